@@ -16,6 +16,7 @@ pkgs.mkShell {
     pkgs.redis
     pkgs.nginx
     pkgs.wrk
+    pkgs.wrk2
     pkgs.just
   ];
 }
@@ -18,12 +18,11 @@ for size in xlarge large medium small
 do
     for type_ in $VM
     do
-        for action in blender pytorch tensorflow
-        do
-            inv vm.start --type ${type_} --size ${size} --action="run-${action}" \
-		    --virtio-blk /dev/$DISK --no-warn \
-		    --repeat $REPEAT $EXTRA
-        done
+        # run all benchmarks in one VM boot
+        inv vm.start --type ${type_} --size ${size} --action="run-blender,run-pytorch,run-tensorflow" \
+		--reset drop-caches \
+		--virtio-blk /dev/$DISK --no-warn \
+		--repeat $REPEAT $EXTRA
     done
 done
 
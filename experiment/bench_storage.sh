@@ -9,12 +9,10 @@ for size in medium
 do
     for type_ in $VM
     do
-        for action in sqlite fio
+        for disk in ${DISKS}
         do
-            for disk in ${DISKS}
-            do
-                inv vm.start --type ${type_} --size ${size} --virtio-blk /dev/${disk} --no-warn --action="run-${action}"  --fio-job "libaio" --name-extra $disk
-                done
+            # run all benchmarks in one VM boot
+            inv vm.start --type ${type_} --size ${size} --virtio-blk /dev/${disk} --no-warn --action="run-sqlite,run-fio" --reset remount  --fio-job "libaio" --name-extra $disk
         done
     done
 done
@@ -129,6 +129,7 @@
                 python3.pkgs.click
                 python3.pkgs.seaborn
                 python3.pkgs.pandas
+                python3.pkgs.pyarrow
                 python3.pkgs.binary
                 python3.pkgs.lxml
                 python3.pkgs.ipython
@@ -151,6 +152,7 @@
                 iperf # iperf3
                 memtier-benchmark
                 wrk
+                wrk2
               ] ++ [ inv-completion ]
               ++ pre-commit-check.enabledPackages;
             inherit (pre-commit-check) shellHook;
@@ -50,6 +50,24 @@ in
     enable = true;
   };
 
+  # tell the host that the guest is ready (see wait_for_ready() in tasks/qemu.py)
+  # by writing to the "org.cvm-eval.ready" virtio-serial port, if present
+  systemd.services."guest-ready" = {
+    description = "Announce guest readiness to the host";
+    wantedBy = [ "multi-user.target" ];
+    after = [ "sshd.service" "boottime-log.service" ];
+    wants = [ "sshd.service" ];
+    serviceConfig.Type = "idle";
+    script = ''
+      for port in /sys/class/virtio-ports/*; do
+        if [ "$(cat $port/name 2>/dev/null)" = "org.cvm-eval.ready" ]; then
+          echo READY > /dev/$(basename $port)
+        fi
+      done
+    '';
+    enable = true;
+  };
+
   # XXX: this systemd-networkd configuration seems not work, why?
   # systemd.network.enable = true;
   # # qemu network (for ssh)
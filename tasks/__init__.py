@@ -1,21 +1,57 @@
 #!/usr/bin/env python3
 
+from importlib import import_module
+from typing import List, Optional, Set
+import os
+import sys
+
 from invoke import Collection
 
-from . import utils, build, vm, memory
-from . import plot_phoronix_memory, plot_phoronix_npb, plot_application, plot_network
-from . import plot_boottime, plot_vmexit, plot_storage, plot_unixbench
+from . import utils, build, vm, scheduler, cache, loader, plot
+
+# These modules import pandas, numpy, matplotlib and seaborn at import time, so
+# they are only imported if one of their tasks is invoked (e.g., not for
+# `inv vm.start`). collection name -> module
+LAZY_COLLECTIONS = {
+    "memory": "memory",
+    "results": "results",
+    "stats": "stats",
+    **plot.PLOT_MODULES,
+}
+
+# invoke flags that need every task
+ALL_TASKS_FLAGS = {"-l", "--list", "--complete", "--print-completion-script"}
+
+
+def requested_collections(argv: List[str]) -> Optional[Set[str]]:
+    """Return the lazy collections named in the command line, or None if all
+    of them are needed (task listing, completion or not run by invoke)
+    """
+    if not argv:
+        return None
+    prog = os.path.basename(argv[0])
+    if prog not in ("inv", "invoke") and not argv[0].endswith("invoke/__main__.py"):
+        return None
+    if any(arg.split("=")[0] in ALL_TASKS_FLAGS for arg in argv[1:]):
+        return None
+    names = {arg.split(".")[0] for arg in argv[1:] if not arg.startswith("-")}
+    if not names and any(arg in ("-h", "--help") for arg in argv[1:]):
+        return None
+    return names & set(LAZY_COLLECTIONS)
+
 
 ns = Collection()
 ns.add_collection(Collection.from_module(utils))
 ns.add_collection(Collection.from_module(build))
 ns.add_collection(Collection.from_module(vm))
-ns.add_collection(Collection.from_module(memory))
-ns.add_collection(Collection.from_module(plot_phoronix_memory), "phoronix")
-ns.add_collection(Collection.from_module(plot_phoronix_npb), "npb")
-ns.add_collection(Collection.from_module(plot_application), "app")
-ns.add_collection(Collection.from_module(plot_network), "network")
-ns.add_collection(Collection.from_module(plot_boottime), "boottime")
-ns.add_collection(Collection.from_module(plot_vmexit), "vmexit")
-ns.add_collection(Collection.from_module(plot_storage), "storage")
-ns.add_collection(Collection.from_module(plot_unixbench), "unixbench")
+ns.add_collection(Collection.from_module(scheduler))
+ns.add_collection(Collection.from_module(cache))
+ns.add_collection(Collection.from_module(loader))
+ns.add_collection(Collection.from_module(plot))
+
+_requested = requested_collections(sys.argv)
+for _name, _module in LAZY_COLLECTIONS.items():
+    if _requested is None or _name in _requested:
+        ns.add_collection(
+            Collection.from_module(import_module(f".{_module}", __name__)), _name
+        )
@@ -7,7 +7,9 @@ from typing import Optional
 from subprocess import CalledProcessError
 
 from config import PROJECT_ROOT
+from metadata import save_metadata, update_metadata
 from qemu import QemuVm
+from stats import Sampler
 from storage import mount_disk
 
 
@@ -29,6 +31,17 @@ def setup_disk(vm: QemuVm, fail_stop=True) -> bool:
     return True
 
 
+def primary_metric(app: str, log: Path) -> Optional[float]:
+    """Return the time (throughput for tensorflow) of a run, or None"""
+    import results
+
+    try:
+        return float(results.parse_app(app, log)["time"].iloc[0])
+    except Exception as e:
+        print(f"[sampling] cannot parse {log}: {e!r}")
+        return None
+
+
 def run_blender(
     name: str,
     vm: QemuVm,
@@ -41,6 +54,7 @@ def run_blender(
     outputdir = Path(f"./bench-result/application/blender/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     disk = setup_disk(vm)
     if disk:
@@ -55,15 +69,21 @@ def run_blender(
         "run",
     ]
 
-    for i in range(repeat):
-        print(f"Running blender {i+1}/{repeat}")
+    sampler = Sampler.from_config(vm.config, repeat)
+    while sampler.more():
+        i = sampler.runs
+        print(f"Running blender {i+1}/{sampler.max_runs}")
         output = vm.ssh_cmd(cmd)
         if output.returncode != 0:
             print(f"Error running blender: {output.stderr}")
+            sampler.add(None)
             continue
         lines = output.stdout.split("\n")
-        with open(outputdir_host / f"{i+1}.log", "w") as f:
+        log = outputdir_host / f"{i+1}.log"
+        with open(log, "w") as f:
             f.write("\n".join(lines))
+        sampler.add(primary_metric("blender", log))
+    update_metadata(outputdir_host / "run.json", sampling=sampler.record())
 
     print(f"Results saved in {outputdir_host}")
 
@@ -81,6 +101,7 @@ def run_tensorflow(
     outputdir = Path(f"./bench-result/application/tensorflow/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     if thread_cnt is None:
         if "resource" in vm.config:
@@ -103,20 +124,27 @@ def run_tensorflow(
         f"{thread_cnt}",
     ]
 
-    for i in range(repeat):
-        print(f"Running tensorflow {i+1}/{repeat}")
+    sampler = Sampler.from_config(vm.config, repeat)
+    while sampler.more():
+        i = sampler.runs
+        print(f"Running tensorflow {i+1}/{sampler.max_runs}")
         try:
             output = vm.ssh_cmd(cmd)
         except CalledProcessError as e:
             # Tensorflow may fail due to OOM, ignore that case
             print(f"Error running tensorflow: {e}")
+            sampler.add(None)
             continue
         if output.returncode != 0:
             print(f"Error running tensorflow: {output.stderr}")
+            sampler.add(None)
             continue
         lines = output.stdout.split("\n")
-        with open(outputdir_host / f"thread_{thread_cnt}-{i+1}.log", "w") as f:
+        log = outputdir_host / f"thread_{thread_cnt}-{i+1}.log"
+        with open(log, "w") as f:
             f.write("\n".join(lines))
+        sampler.add(primary_metric("tensorflow", log))
+    update_metadata(outputdir_host / "run.json", sampling=sampler.record())
 
     print(f"Results saved in {outputdir_host}")
 
@@ -134,6 +162,7 @@ def run_pytorch(
     outputdir = Path(f"./bench-result/application/pytorch/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     if thread_cnt is None:
         if "resource" in vm.config:
@@ -156,15 +185,21 @@ def run_pytorch(
         f"{thread_cnt}",
     ]
 
-    for i in range(repeat):
-        print(f"Running pytorch {i+1}/{repeat}")
+    sampler = Sampler.from_config(vm.config, repeat)
+    while sampler.more():
+        i = sampler.runs
+        print(f"Running pytorch {i+1}/{sampler.max_runs}")
         output = vm.ssh_cmd(cmd)
         if output.returncode != 0:
             print(f"Error running pytorch: {output.stderr}")
+            sampler.add(None)
             continue
         lines = output.stdout.split("\n")
-        with open(outputdir_host / f"thread_{thread_cnt}-{i+1}.log", "w") as f:
+        log = outputdir_host / f"thread_{thread_cnt}-{i+1}.log"
+        with open(log, "w") as f:
             f.write("\n".join(lines))
+        sampler.add(primary_metric("pytorch", log))
+    update_metadata(outputdir_host / "run.json", sampling=sampler.record())
 
     print(f"Results saved in {outputdir_host}")
 
@@ -181,6 +216,7 @@ def run_sqlite(
     outputdir = Path(f"./bench-result/application/sqlite/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     disk = setup_disk(vm)
     if disk:
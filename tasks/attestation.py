@@ -5,6 +5,7 @@ from datetime import datetime
 from pathlib import Path
 
 from config import PROJECT_ROOT
+from metadata import save_metadata
 from qemu import QemuVm
 
 import subprocess
@@ -22,6 +23,7 @@ def run_attestation_sev(
     outputdir = Path(f"./bench-result/attestation/sev/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     """
     Run the preparation phase to build the snpguest utility in the CVM.
@@ -70,6 +72,7 @@ def run_attestation_tdx(
     outputdir = Path(f"./bench-result/attestation/tdx/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     """
     Mount the shared directory in the TDX ubuntu-based guest
@@ -7,11 +7,15 @@ import subprocess
 import time
 
 from config import PROJECT_ROOT
+from metadata import run_metadata, save_metadata, update_metadata
 from qemu import spawn_qemu, QemuVm
+from stats import Sampler
 
 
-def boot_test(qemu_cmd: List[str], pin: bool, outfile=None, **kargs: Any) -> None:
-    """Start a VM and wait for the VM to boot and then terminate the VM."""
+def boot_test(qemu_cmd: List[str], pin: bool, outfile=None, **kargs: Any) -> float:
+    """Start a VM and wait for the VM to boot and then terminate the VM.
+    Return the seconds from the launch of QEMU until ssh is ready.
+    """
     resource = kargs["config"]["resource"]
     vmconfig = kargs["config"]["vmconfig"]
     pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
@@ -47,13 +51,14 @@ def boot_test(qemu_cmd: List[str], pin: bool, outfile=None, **kargs: Any) -> Non
         time.sleep(3)  # ensure loading of BPF program
 
     vm: QemuVM
+    start = time.monotonic()
     with spawn_qemu(
         qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
     ) as vm:
         if pin:
             vm.pin_vcpu(pin_base)
-        time.sleep(10)
         vm.wait_for_ssh()
+        boot_time = time.monotonic() - start
         vm.shutdown()
 
     # get output from bpftrace process
@@ -67,6 +72,17 @@ def boot_test(qemu_cmd: List[str], pin: bool, outfile=None, **kargs: Any) -> Non
         if outfile:
             with open(outfile, "w") as f:
                 f.write(bpftrace.stdout.read().decode())
+    return boot_time
+
+
+def total_boot_time(outfile: Path) -> Optional[float]:
+    from plot_boottime import parse_result_file
+
+    try:
+        return sum(parse_result_file(outfile))
+    except Exception as e:
+        print(f"[sampling] cannot parse {outfile}: {e!r}")
+        return None
 
 
 def run_boot_test(
@@ -79,11 +95,21 @@ def run_boot_test(
     outputdir = Path(f"{PROJECT_ROOT}/bench-result/boottime/{name}/{date}")
     if trace:
         outputdir.mkdir(parents=True, exist_ok=True)
+        metadata = run_metadata(kargs["config"], qemu_cmd)
+        save_metadata(outputdir / "run.json", metadata, name, repeat=repeat)
 
-    for i in range(repeat):
-        outfile = outputdir / f"{i+1}.txt"
-        boot_test(qemu_cmd, pin, outfile, **kargs)
+    # the primary metric is the total boot time (without trace, the time from
+    # the launch of QEMU until ssh is ready; the teardown is not included)
+    sampler = Sampler.from_config(kargs["config"], repeat)
+    while sampler.more():
+        outfile = outputdir / f"{sampler.runs+1}.txt"
+        boot_time = boot_test(qemu_cmd, pin, outfile, **kargs)
+        if trace:
+            sampler.add(total_boot_time(outfile))
+        else:
+            sampler.add(boot_time)
         time.sleep(1)
 
     if trace:
+        update_metadata(outputdir / "run.json", sampling=sampler.record())
         print(f"Output written to {outputdir}")
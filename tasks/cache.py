@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Memoization of result parsers.
+
+    @cached(version=1)
+    def parse_iperf_log(file: Path) -> float:
+        ...
+
+Results are keyed by the parser, its version and its arguments, where
+arguments that are files are replaced by (path, mtime, size). A changed or new
+file is thus parsed again, everything else comes from a bounded in-memory LRU
+or from the on-disk cache in .cache/parse/. Bump version when a parser changes
+to invalidate its cached results.
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Tuple
+import copy
+import functools
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+
+from invoke import task
+
+from config import PROJECT_ROOT
+
+CACHE_DIR = PROJECT_ROOT / ".cache" / "parse"
+# number of results kept in memory per parser
+LRU_SIZE = 1024
+# set to False to always call the parsers (e.g., to measure them)
+ENABLED = True
+
+
+def file_key(arg: Any) -> Any:
+    """Replace a file argument by its identity (path, mtime, size)"""
+    if isinstance(arg, (str, Path)):
+        try:
+            st = os.stat(arg)
+        except (OSError, ValueError):
+            return arg
+        if os.path.isfile(arg):
+            return (str(Path(arg).resolve()), st.st_mtime_ns, st.st_size)
+    return arg
+
+
+def cached(version: int = 1, maxsize: int = LRU_SIZE) -> Callable:
+    def decorator(parse: Callable) -> Callable:
+        name = f"{parse.__module__}.{parse.__qualname__}"
+        lru: "OrderedDict[Tuple, Any]" = OrderedDict()
+        # the parsers are called from threads (see loader.load_files)
+        lock = threading.Lock()
+
+        @functools.wraps(parse)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not ENABLED:
+                return parse(*args, **kwargs)
+            key = (
+                version,
+                tuple(file_key(a) for a in args),
+                tuple(sorted((k, file_key(v)) for k, v in kwargs.items())),
+            )
+            with lock:
+                hit = key in lru
+                if hit:
+                    lru.move_to_end(key)
+                    result = lru[key]
+            if hit:
+                # callers may modify the result (e.g., DataFrame.sort_values(inplace=True))
+                return copy.deepcopy(result)
+
+            digest = hashlib.sha1(repr(key).encode()).hexdigest()
+            path = CACHE_DIR / name / f"{digest}.pkl"
+            result = None
+            try:
+                with open(path, "rb") as f:
+                    result = pickle.load(f)
+            except (OSError, pickle.PickleError, EOFError):
+                pass
+            if result is None:
+                result = parse(*args, **kwargs)
+                try:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = path.with_suffix(
+                        f".{os.getpid()}.{threading.get_ident()}.tmp"
+                    )
+                    with open(tmp, "wb") as f:
+                        pickle.dump(result, f)
+                    tmp.rename(path)
+                except (OSError, pickle.PickleError) as e:
+                    print(f"[warn] failed to cache {name}: {e}")
+
+            with lock:
+                lru[key] = result
+                lru.move_to_end(key)
+                while len(lru) > maxsize:
+                    lru.popitem(last=False)
+            return copy.deepcopy(result)
+
+        def cache_clear() -> None:
+            with lock:
+                lru.clear()
+            shutil.rmtree(CACHE_DIR / name, ignore_errors=True)
+
+        wrapper.cache_clear = cache_clear  # type: ignore
+        return wrapper
+
+    return decorator
+
+
+# inv cache.clear
+@task
+def clear(ctx: Any) -> None:
+    """Remove the on-disk cache of parsed results"""
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    print(f"Removed {CACHE_DIR}")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Parallel loading of result files.
+
+Result trees (e.g., bench-result/ on NFS) are I/O-latency bound, so the loaders
+parse their files with load_files() which uses a thread pool, or a process pool
+for parsers that spend most of their time decoding (JSON, XML).
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Iterable, List, Optional
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from invoke import task
+
+# LOAD_WORKERS=1 disables parallel loading
+WORKERS: int = int(os.environ.get("LOAD_WORKERS", "0")) or min(
+    32, (os.cpu_count() or 1) + 4
+)
+PROCESSES: int = min(WORKERS, os.cpu_count() or 1)
+# below this, starting a process pool costs more than it saves
+MIN_PROCESS_FILES = 8
+
+
+def load_files(
+    parse: Callable[[Any], Any],
+    files: Iterable[Any],
+    processes: bool = False,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """Return [parse(file) for file in files], computed in parallel.
+
+    parse must be a module-level function if processes is True. With
+    return_exceptions, the exception raised for a file is returned in its
+    place instead of being raised.
+    """
+    files = list(files)
+    if WORKERS <= 1 or len(files) <= 1:
+        return [call(parse, f, return_exceptions) for f in files]
+
+    executor: Executor
+    if processes and PROCESSES > 1 and len(files) >= MIN_PROCESS_FILES:
+        executor = ProcessPoolExecutor(
+            max_workers=min(PROCESSES, len(files)),
+            mp_context=multiprocessing.get_context("fork"),
+        )
+    else:
+        executor = ThreadPoolExecutor(max_workers=min(WORKERS, len(files)))
+    with executor:
+        futures = [executor.submit(call, parse, f, return_exceptions) for f in files]
+        return [future.result() for future in futures]
+
+
+def call(parse: Callable[[Any], Any], file: Any, return_exceptions: bool) -> Any:
+    if not return_exceptions:
+        return parse(file)
+    try:
+        return parse(file)
+    except Exception as e:
+        return e
+
+
+def make_tree(root: Path, num_files: int) -> None:
+    """Create num_files fio JSON outputs and iperf logs under root"""
+    rnd = random.Random(0)
+    stats = ["iops_mean", "iops_stddev", "bw_mean", "bw_dev"]
+    for i in range(num_files):
+        jobs = []
+        for name in ["randread", "randwrite", "seqread", "seqwrite"]:
+            job: dict = {"jobname": name}
+            for op in ["read", "write", "trim"]:
+                job[op] = {s: rnd.random() * 1e6 for s in stats}
+                job[op]["lat_ns"] = {"mean": rnd.random() * 1e5, "stddev": 1.0}
+                percentiles = {f"{p:.6f}": rnd.randint(1, 10**7) for p in range(100)}
+                job[op]["clat_ns"] = {"percentile": percentiles}
+            jobs.append(job)
+        fio = root / "fio" / f"{i:05d}.json"
+        fio.parent.mkdir(parents=True, exist_ok=True)
+        fio.write_text(json.dumps({"fio version": "fio-3.36", "jobs": jobs}, indent=2))
+
+        iperf = root / "iperf" / f"{i:05d}.log"
+        iperf.parent.mkdir(parents=True, exist_ok=True)
+        lines = [
+            f"[  5]   {t}.00-{t + 1}.00   sec  1.17 GBytes  10.1 Gbits/sec"
+            for t in range(10)
+        ]
+        lines.append("[SUM]   0.00-10.00  sec  11.7 GBytes  10.1 Gbits/sec  receiver")
+        iperf.write_text("\n".join(lines) + "\n")
+
+
+# examples:
+# inv loader.bench
+# inv loader.bench --sizes 100,1000 --dir /nfs/scratch (to measure on NFS)
+@task
+def bench(ctx: Any, sizes: str = "10,100,1000", dir: Optional[str] = None) -> None:
+    """Report the load time of synthetic result trees: serial vs. threads vs. processes"""
+    import cache
+    from plot_network import parse_iperf_log
+    from plot_storage import read_json
+
+    global WORKERS
+
+    # measure parsing, not the parse cache
+    cache.ENABLED = False
+    workers = WORKERS
+    print(f"workers: {WORKERS} threads, {PROCESSES} processes")
+    print(f"{'files':>6} {'parser':>6} {'serial':>9} {'threads':>9} {'procs':>9}")
+    for num_files in [int(s) for s in sizes.split(",")]:
+        with TemporaryDirectory(dir=dir) as tmp:
+            root = Path(tmp)
+            make_tree(root, num_files)
+            for name, parse, pattern in [
+                ("iperf", parse_iperf_log, "iperf/*.log"),
+                ("fio", read_json, "fio/*.json"),
+            ]:
+                files = sorted(root.glob(pattern))
+                times = []
+                for w, processes in [(1, False), (workers, False), (workers, True)]:
+                    WORKERS = w
+                    start = time.perf_counter()
+                    load_files(parse, files, processes=processes)
+                    times.append(time.perf_counter() - start)
+                WORKERS = workers
+                print(
+                    f"{num_files:>6} {name:>6} "
+                    + " ".join(f"{t * 1000:>7.1f}ms" for t in times)
+                )
+    cache.ENABLED = True
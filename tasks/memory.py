@@ -10,7 +10,11 @@ from invoke import task
 import numpy as np
 import pandas as pd
 
+import results
+import stats
+from cache import cached
 from config import PROJECT_ROOT
+from metadata import save_metadata
 from qemu import QemuVm
 
 
@@ -25,6 +29,7 @@ def run_mlc(
     outputdir = Path(f"./bench-result/memory/mlc/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
     cmd = [
         "bash",
         "/share/benchmarks/memory/run_mlc.sh",
@@ -40,6 +45,7 @@ def run_mlc(
     print(f"Results saved in {outputdir_host}")
 
 
+@cached()
 def parse_mlc_result_sub(name: str, file: Path):
     """
     Exmaple:
@@ -101,6 +107,16 @@ def parse_mlc_result(
 ):
     """Parse the mlc result and return a DataFrame"""
 
+    data = results.load("mlc", base_dir.parent)
+    if data is not None:
+        data = data[data["name"] == base_dir.name]
+        dates = sorted(data["date"].unique())[-10:] if date is None else [date]
+        data = data[data["date"].isin(dates)]
+        return data.assign(name=data["date"])[
+            ["name", "random_access_latency", "bw_all_read"]
+            + ["bw_3_1", "bw_2_1", "bw_1_1", "bw_stream"]
+        ].reset_index(drop=True)
+
     fs = []
     if date is None:
         files = sorted([d for d in base_dir.iterdir() if d.is_dir()])[-10:]
@@ -158,29 +174,25 @@ def show_mlc_result(
     print(cvm_df)
 
     # latency difference (using median)
-    vm_lat_median = vm_df["random_access_latency"].median()
-    cvm_lat_median = cvm_df["random_access_latency"].median()
+    vm_lat = vm_df["random_access_latency"]
+    cvm_lat = cvm_df["random_access_latency"]
+    lat = stats.ratio(cvm_lat, vm_lat, stat="median")
     print(
-        f"random access latency: {vm_lat_median:.3f}, {cvm_lat_median:.3f}, {cvm_lat_median - vm_lat_median:.3f} us"
+        f"random access latency: {vm_lat.median():.3f}, {cvm_lat.median():.3f}, "
+        f"{cvm_lat.median() - vm_lat.median():.3f} us (ratio {lat})"
     )
 
     # bw overhead using median
-    vm_bw = (
-        vm_df[["bw_all_read", "bw_3_1", "bw_2_1", "bw_1_1", "bw_stream"]]
-        .median()
-        .values
-    )
-    cvm_bw = (
-        cvm_df[["bw_all_read", "bw_3_1", "bw_2_1", "bw_1_1", "bw_stream"]]
-        .median()
-        .values
-    )
-    print(f"vm_bw: {vm_bw}")
-    print(f"cvm_bw: {cvm_bw}")
-    overhead = (1 - cvm_bw / vm_bw) * 100
-    print(f"bw diff: {overhead}")
-    geo_mean = np.prod(cvm_bw / vm_bw) ** (1 / len(cvm_bw))
-    print(f"geomean: {geo_mean:.3f}, {(1 - geo_mean)*100:.3f}%")
+    columns = ["bw_all_read", "bw_3_1", "bw_2_1", "bw_1_1", "bw_stream"]
+    for column in columns:
+        r = stats.ratio(cvm_df[column], vm_df[column], stat="median")
+        print(f"{column}: {r}, overhead: {r.overhead(higher_is_better=True)}%")
+    for label, df in [(vm_label, vm_df), (cvm_label, cvm_df)]:
+        outliers = {c: int(stats.outliers(df[c]).sum()) for c in columns}
+        print(f"{label} outliers: {outliers}")
+    pairs = [(cvm_df[c], vm_df[c]) for c in columns]
+    geo_mean = stats.geomean_ratio(pairs, stat="median")
+    print(f"geomean: {geo_mean}, {geo_mean.overhead(higher_is_better=True)}%")
 
 
 @task
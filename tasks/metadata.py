@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Per-run metadata sidecars.
+
+Every benchmark run writes a JSON file next to its results describing how the
+run was configured, so that results can be indexed without parsing the
+directory names (see results.py):
+
+- run.json in the result directory, if the run has one
+  (e.g., bench-result/application/blender/{name}/{date}/run.json)
+- {date}.meta.json next to the result file otherwise
+  (e.g., bench-result/fio/{name}/{job}/{date}.meta.json)
+"""
+
+from dataclasses import asdict, is_dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import datetime
+import json
+import platform
+
+# keys of the config dict of vm.start that are not part of the configuration
+SKIP_KEYS = ["ctx", "vm", "resource", "pinning", "ssh_cmd"]
+
+
+def cpu_model() -> Optional[str]:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+
+def to_json(value: Any) -> Any:
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): to_json(v) for k, v in value.items()}
+    return str(value)
+
+
+def run_metadata(config: dict, qemu_cmd: List[str], vm: Any = None) -> Dict[str, Any]:
+    """Collect the metadata of a run started by vm.start"""
+    guest_kernel = None
+    if vm is not None:
+        output = vm.ssh_cmd(["uname", "-r"], check=False, verbose=False)
+        if output.returncode == 0:
+            guest_kernel = output.stdout.strip()
+    return {
+        "config": {k: to_json(v) for k, v in config.items() if k not in SKIP_KEYS},
+        "resource": to_json(config.get("resource")),
+        "qemu_cmd": [str(arg) for arg in qemu_cmd],
+        "pinning": to_json(config.get("pinning")),
+        "host": platform.node(),
+        "host_kernel": platform.release(),
+        "guest_kernel": guest_kernel,
+        "cpu_model": cpu_model(),
+    }
+
+
+def save_metadata(
+    path: Path, metadata: Dict[str, Any], name: str, **extra: Any
+) -> None:
+    """Write the sidecar of a run whose results are saved under name.
+    extra is recorded as is (e.g., the benchmark parameters).
+    """
+    if not metadata:
+        # the VM was not started by vm.start (e.g., from an ipython session)
+        return
+    data = dict(metadata)
+    data["name"] = name
+    data["date"] = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    data.update({k: to_json(v) for k, v in extra.items()})
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def update_metadata(path: Path, **extra: Any) -> None:
+    """Add extra to the sidecar written by save_metadata() (e.g., what is only
+    known after the run)
+    """
+    if not path.exists():
+        return
+    with open(path) as f:
+        data = json.load(f)
+    data.update({k: to_json(v) for k, v in extra.items()})
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def sidecar_path(file: Path) -> Optional[Path]:
+    """Return the sidecar of a result file, if any (the run.json of the run may
+    be up to two levels up for runs with several steps, e.g., memtier-sweep
+    and nginx-sweep)
+    """
+    for path in [
+        file.with_name(f"{file.stem}.meta.json"),
+        *(parent / "run.json" for parent in list(file.parents)[:3]),
+    ]:
+        if path.is_file():
+            return path
+    return None
+
+
+def is_sidecar(file: Path) -> bool:
+    return file.name == "run.json" or file.name.endswith(".meta.json")
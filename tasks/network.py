@@ -1,12 +1,21 @@
 import subprocess
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
+import functools
+import json
+import os
+import re
+import shutil
+import signal
 import subprocess
 import time
-from typing import Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from config import PROJECT_ROOT, VM_IP
+from metadata import save_metadata, update_metadata
 from qemu import QemuVm
+from stats import Sampler
 
 
 def run_ping(name: str, vm: QemuVm, pin_base=20):
@@ -17,6 +26,7 @@ def run_ping(name: str, vm: QemuVm, pin_base=20):
     outputdir = Path(f"./bench-result/network/ping/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     for pkt_size in [64, 128, 256, 512, 1024]:
         process = subprocess.Popen(
@@ -48,7 +58,8 @@ def run_iperf(
     pin_end: Optional[int] = None,
 ):
     """Run the iperf benchmark on the VM.
-    The results are saved in ./bench-result/network/iperf/{name}/{proto}/{date}/
+    The results are saved in ./bench-result/network/iperf/{name}/{proto}/{date}/{pkt}.json
+    (iperf3 JSON; older runs have the text output in {pkt}.log)
     """
     if udp:
         proto = "udp"
@@ -63,48 +74,160 @@ def run_iperf(
     if pin_end is None:
         pin_end = pin_start + parallel - 1
 
-    date = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-    outputdir = Path(f"./bench-result/network/iperf/{name}/{proto}/{date}/")
-    outputdir_host = PROJECT_ROOT / outputdir
-    outputdir_host.mkdir(parents=True, exist_ok=True)
-
     # start server
     server_cmd = ["iperf", "-s", "-p", f"{port}", "-D"]
     vm.ssh_cmd(server_cmd)
     time.sleep(1)
 
-    # run client
-    for pkt_size in pkt_sizes:
-        cmd = [
-            "taskset",
-            "-c",
-            f"{pin_start}-{pin_end}",
-            "iperf",
-            "-c",
-            f"{VM_IP}",
-            "-p",
-            f"{port}",
-            "-b",
-            "0",
-            "-i",
-            "1",
-            "-l",
-            f"{pkt_size}",
-            "-P",
-            f"{parallel}",
-        ]
-        if udp:
-            cmd.append("-u")
-        print(cmd)
-        output = subprocess.check_output(cmd).decode()
-        lines = output.split("\n")
-        with open(outputdir_host / f"{pkt_size}.log", "w") as f:
-            f.write("\n".join(lines))
+    # one sample is a run over all packet sizes (in a new date directory)
+    sidecars = []
+    sampler = Sampler.from_config(vm.config)
+    while sampler.more():
+        date = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        outputdir = Path(f"./bench-result/network/iperf/{name}/{proto}/{date}/")
+        outputdir_host = PROJECT_ROOT / outputdir
+        outputdir_host.mkdir(parents=True, exist_ok=True)
+        sidecars.append(outputdir_host / "run.json")
+        save_metadata(sidecars[-1], vm.metadata, name)
 
-        # workaround to avoid "iperf3: error - unable to receive control message - port may not be available"
-        time.sleep(1)
+        # run client
+        for pkt_size in pkt_sizes:
+            cmd = [
+                "taskset",
+                "-c",
+                f"{pin_start}-{pin_end}",
+                "iperf",
+                "-c",
+                f"{VM_IP}",
+                "-p",
+                f"{port}",
+                "-b",
+                "0",
+                "-i",
+                "1",
+                "-l",
+                f"{pkt_size}",
+                "-P",
+                f"{parallel}",
+            ]
+            if udp:
+                cmd.append("-u")
+            cmd.append(iperf_json_option())
+            print(cmd)
+            # write every interval report (-i 1) to disk as soon as it arrives
+            with open(outputdir_host / f"{pkt_size}.json", "w") as f, subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, text=True
+            ) as proc:
+                for line in proc.stdout:
+                    f.write(line)
+                    f.flush()
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd)
 
-    print(f"Results saved in {outputdir_host}")
+            # workaround to avoid "iperf3: error - unable to receive control message - port may not be available"
+            time.sleep(1)
+
+        sampler.add(iperf_throughput(outputdir_host, pkt_sizes))
+        print(f"Results saved in {outputdir_host}")
+
+    for sidecar in sidecars:
+        update_metadata(sidecar, sampling=sampler.record())
+
+
+@functools.lru_cache()
+def iperf_json_option() -> str:
+    """Return the JSON output option of iperf3: --json-stream (one JSON event
+    per line, since iperf 3.17) or -J (one document at the end)
+    """
+    help = subprocess.run(["iperf", "--help"], capture_output=True, text=True)
+    return "--json-stream" if "--json-stream" in help.stdout + help.stderr else "-J"
+
+
+def iperf_throughput(outputdir: Path, pkt_sizes: list) -> Optional[float]:
+    """Return the geometric mean of the throughputs of the packet sizes"""
+    import stats
+    from plot_network import iperf_log, parse_iperf_log
+
+    try:
+        return float(
+            stats.geomean([parse_iperf_log(iperf_log(outputdir, s)) for s in pkt_sizes])
+        )
+    except Exception as e:
+        print(f"[sampling] cannot parse {outputdir}: {e!r}")
+        return None
+
+
+def start_memtier_server(
+    vm: QemuVm,
+    server: str,
+    tls: bool,
+    port: int = 6379,
+    tls_port: int = 6380,
+    server_threads: Optional[int] = None,
+) -> None:
+    """Start redis or memcached in the VM.
+    `server_threads` is only valid for memcached (default: number of vCPUs).
+    """
+    if server_threads is None:
+        if "resource" in vm.config:
+            server_threads = vm.config["resource"].cpu
+        else:
+            server_threads = 1
+    tls_ = "-tls" if tls else ""
+    server_cmd = [
+        "just",
+        "-f",
+        "/share/benchmarks/network/justfile",
+        f"STANDARD_MEMTIER_PORT={port}",
+        f"TLS_MEMTIER_PORT={tls_port}",
+        f"THREADS={server_threads}",
+        f"run-{server}{tls_}",
+    ]
+    vm.ssh_cmd(server_cmd)
+    print("Server started")
+    time.sleep(1)
+
+
+def memtier_client_cmd(
+    server: str,
+    tls: bool,
+    port: int,
+    tls_port: int,
+    client_threads: int,
+    clients: int = 100,
+    pipeline: int = 40,
+    client_key: str = PROJECT_ROOT / "benchmarks/network/tls/pki/private/client.key",
+    client_cert: str = PROJECT_ROOT / "benchmarks/network/tls/pki/issued/client.crt",
+    ca_cert: str = PROJECT_ROOT / "benchmarks/network/tls/pki/ca.crt",
+) -> List[str]:
+    """Return the memtier_benchmark command against the server in the VM"""
+    if server == "redis":
+        proto = "redis"
+    elif server == "memcached":
+        proto = "memcache_binary"
+    else:
+        raise ValueError(f"Unknown server: {server}")
+
+    cmd = [
+        "memtier_benchmark",
+        f"--host={VM_IP}",
+        "-p",
+        f"{tls_port if tls else port}",
+        "-t",
+        f"{client_threads}",
+        "-c",
+        f"{clients}",
+        f"--pipeline={pipeline}",
+        f"--protocol={proto}",
+    ]
+    if tls:
+        cmd += [
+            "--tls",
+            f"--cert={client_cert}",
+            f"--key={client_key}",
+            f"--cacert={ca_cert}",
+        ]
+    return cmd
 
 
 def run_memtier(
@@ -121,9 +244,13 @@ def run_memtier(
     ca_cert: str = PROJECT_ROOT / "benchmarks/network/tls/pki/ca.crt",
     pin_start: int = 20,
     pin_end: Optional[int] = None,
+    instances: str = "1",
+    test_time: int = 30,
 ):
     """Run the memtier benchmark on the VM using redis or memcached.
     `server_threads` is only valid for memcached.
+    With instances > 1 (or "auto"), several memtier clients spread over the
+    host NUMA nodes run at the same time (see run_memtier_instances()).
     The results are saved in ./bench-result/network/memtier/{server}[-tls]/{name}/{date}/
     """
     if tls:
@@ -134,19 +261,7 @@ def run_memtier(
     outputdir = Path(f"./bench-result/network/memtier/{server}{tls_}/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
-
-    if server == "redis":
-        proto = "redis"
-    elif server == "memcached":
-        proto = "memcache_binary"
-    else:
-        raise ValueError(f"Unknown server: {server}")
-
-    if server_threads is None:
-        if "resource" in vm.config:
-            server_threads = vm.config["resource"].cpu
-        else:
-            server_threads = 1
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     if client_threads is None:
         if server == "redis":
@@ -157,55 +272,36 @@ def run_memtier(
     if pin_end is None:
         pin_end = pin_start + client_threads - 1
 
-    server_cmd = [
-        "just",
-        "-f",
-        "/share/benchmarks/network/justfile",
-        f"STANDARD_MEMTIER_PORT={port}",
-        f"TLS_MEMTIER_PORT={tls_port}",
-        f"THREADS={server_threads}",
-        f"run-{server}{tls_}",
-    ]
-    vm.ssh_cmd(server_cmd)
-    print("Server started")
-    time.sleep(1)
+    cmd = memtier_client_cmd(
+        server,
+        tls,
+        port,
+        tls_port,
+        client_threads,
+        client_key=client_key,
+        client_cert=client_cert,
+        ca_cert=ca_cert,
+    )
+    start_memtier_server(vm, server, tls, port, tls_port, server_threads)
 
-    if tls:
-        cmd = [
-            "taskset",
-            "-c",
-            f"{pin_start}-{pin_end}",
-            "memtier_benchmark",
-            f"--host={VM_IP}",
-            "-p",
-            f"{tls_port}",
-            "-t",
-            f"{client_threads}",
-            "-c",
-            "100",
-            "--pipeline=40",
-            f"--protocol={proto}",
-            "--tls",
-            f"--cert={client_cert}",
-            f"--key={client_key}",
-            f"--cacert={ca_cert}",
-        ]
-    else:
-        cmd = [
-            "taskset",
-            "-c",
-            f"{pin_start}-{pin_end}",
-            "memtier_benchmark",
-            f"--host={VM_IP}",
-            "-p",
-            f"{port}",
-            "-t",
-            f"{client_threads}",
-            "-c",
-            "100",
-            "--pipeline=40",
-            f"--protocol={proto}",
-        ]
+    if instances != "1":
+        exclude = set()
+        if vm.pinning is not None:
+            exclude = set(vm.pinning.vcpus) | set(vm.pinning.iothreads)
+        scaling = run_memtier_instances(
+            cmd,
+            outputdir_host,
+            instances,
+            client_threads,
+            pin_start,
+            exclude,
+            test_time,
+        )
+        update_metadata(outputdir_host / "run.json", memtier_scaling=scaling)
+        print(f"Results saved in {outputdir_host}")
+        return
+
+    cmd = ["taskset", "-c", f"{pin_start}-{pin_end}", *cmd]
     print(cmd)
     output = subprocess.check_output(cmd).decode()
     lines = output.split("\n")
@@ -215,6 +311,290 @@ def run_memtier(
     print(f"Results saved in {outputdir_host}")
 
 
+# memtier_benchmark instances are added (auto) while the ops/s grow by this much
+MEMTIER_SCALING_GAIN = 0.05
+MEMTIER_PERCENTILES = [50, 99, 99.9]
+
+
+def client_cpu_sets(
+    num: int, threads: int, pin_start: int, exclude: Set[int]
+) -> List[List[int]]:
+    """Return the host CPUs of num memtier instances with threads threads each,
+    round-robin over the NUMA nodes (only CPUs >= pin_start, not in exclude)
+    """
+    from topology import read_cpu_topology
+
+    nodes: Dict[int, List[int]] = {}
+    for core in read_cpu_topology():
+        for cpu in core.threads:
+            if cpu >= pin_start and cpu not in exclude:
+                nodes.setdefault(core.node, []).append(cpu)
+    free = {node: sorted(cpus) for node, cpus in sorted(nodes.items())}
+    cpu_sets = []
+    for i in range(num):
+        node = list(free)[i % len(free)]
+        if len(free[node]) < threads:
+            print(f"[memtier] not enough CPUs on node {node}, instances share CPUs")
+            free[node] = sorted(nodes[node])
+        cpu_sets.append(free[node][:threads])
+        free[node] = free[node][threads:]
+    return cpu_sets
+
+
+def run_memtier_instances(
+    cmd: List[str],
+    outputdir: Path,
+    instances: str,
+    threads: int,
+    pin_start: int,
+    exclude: Set[int],
+    test_time: int,
+    max_instances: int = 16,
+) -> Dict[int, float]:
+    """Run memtier_benchmark instances (cmd) at the same time for test_time
+    seconds and merge their results into outputdir/memtier.log.
+
+    With instances="auto", 1, 2, 4, ... instances run (in outputdir/scale-{n}/)
+    until the aggregate ops/s grow by less than MEMTIER_SCALING_GAIN, i.e.,
+    the host clients are not the bottleneck anymore, and the results of the
+    last run are kept. Return {instances: ops/s}.
+    """
+    counts = [int(instances)] if instances != "auto" else []
+    n = 1
+    while instances == "auto" and n <= max_instances:
+        counts.append(n)
+        n *= 2
+
+    scaling: Dict[int, float] = {}
+    for num in counts:
+        rundir = outputdir if instances != "auto" else outputdir / f"scale-{num}"
+        rundir.mkdir(parents=True, exist_ok=True)
+        cpu_sets = client_cpu_sets(num, threads, pin_start, exclude)
+        procs = []
+        for i, cpus in enumerate(cpu_sets):
+            instance_cmd = [
+                "taskset",
+                "-c",
+                ",".join(map(str, cpus)),
+                *cmd,
+                f"--test-time={test_time}",
+                f"--json-out-file={rundir}/instance-{i}.json",
+                f"--hdr-file-prefix={rundir}/instance-{i}",
+            ]
+            print(instance_cmd)
+            log = open(rundir / f"instance-{i}.log", "w")
+            procs.append((subprocess.Popen(instance_cmd, stdout=log), log))
+        for proc, log in procs:
+            proc.wait()
+            log.close()
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+        merged = merge_memtier(rundir, num)
+        write_memtier_summary(rundir / "memtier.log", merged)
+        scaling[num] = merged["Totals"]["Ops/sec"]
+        print(f"[memtier] {num} instances: {scaling[num]:.0f} ops/s")
+        if instances == "auto":
+            previous = scaling.get(num // 2)
+            if previous and scaling[num] < previous * (1 + MEMTIER_SCALING_GAIN):
+                break
+
+    if instances == "auto":
+        # keep the results of the last run as the result of the benchmark
+        shutil.copy(
+            outputdir / f"scale-{num}" / "memtier.log", outputdir / "memtier.log"
+        )
+        with open(outputdir / "scaling.json", "w") as f:
+            json.dump(scaling, f, indent=2)
+    return scaling
+
+
+def read_hdr_percentiles(file: Path) -> List[Tuple[float, int]]:
+    """Return [(latency, count), ...] of a HdrHistogram percentile distribution"""
+    counts = []
+    total = 0
+    with open(file) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) != 4 or line.lstrip().startswith("#"):
+                continue
+            try:
+                value, _, count = float(fields[0]), float(fields[1]), int(fields[2])
+            except ValueError:
+                continue
+            counts.append((value, count - total))
+            total = count
+    return counts
+
+
+def merge_memtier(rundir: Path, num: int) -> Dict[str, Dict[str, float]]:
+    """Merge the JSON (and HDR) outputs of num memtier instances: ops/s and
+    KB/s are summed, the average latency is weighted by ops/s, and the
+    latency percentiles are taken from the merged HDR histograms (the maximum
+    over the instances, an upper bound, unless every instance has one)
+    """
+    stats: Dict[str, List[Dict[str, Any]]] = {}
+    for i in range(num):
+        with open(rundir / f"instance-{i}.json") as f:
+            all_stats = json.load(f)["ALL STATS"]
+        for kind in ["Sets", "Gets", "Totals"]:
+            stats.setdefault(kind, []).append(all_stats[kind])
+
+    hdr_kinds = {"Sets": "SET", "Gets": "GET", "Totals": "FULL_RUN"}
+    merged: Dict[str, Dict[str, float]] = {}
+    for kind, per_instance in stats.items():
+        ops = [s["Ops/sec"] for s in per_instance]
+        latencies = [
+            s.get("Average Latency", s.get("Latency", 0.0)) for s in per_instance
+        ]
+        m = {
+            "Ops/sec": sum(ops),
+            "Hits/sec": sum(s.get("Hits/sec", 0.0) for s in per_instance),
+            "Misses/sec": sum(s.get("Misses/sec", 0.0) for s in per_instance),
+            "Average Latency": (
+                sum(o * l for o, l in zip(ops, latencies)) / sum(ops)
+                if sum(ops)
+                else 0.0
+            ),
+            "KB/sec": sum(s.get("KB/sec", 0.0) for s in per_instance),
+        }
+        hist = []
+        missing = 0
+        for i in range(num):
+            files = sorted(rundir.glob(f"instance-{i}_*{hdr_kinds[kind]}*.txt"))
+            if files:
+                hist += read_hdr_percentiles(files[0])
+            else:
+                missing += 1
+        if missing:
+            # percentiles of a part of the instances would be biased
+            print(f"[memtier] {missing} of {num} HDR files ({kind}) missing")
+            hist = []
+        hist.sort()
+        total = sum(c for _, c in hist)
+        for p in MEMTIER_PERCENTILES:
+            if total:
+                cum, value = 0, hist[-1][0]
+                for value, count in hist:
+                    cum += count
+                    if cum >= total * p / 100:
+                        break
+            else:
+                key = f"p{p:.2f}"
+                value = max(
+                    s.get("Percentile Latencies", {}).get(key, 0.0)
+                    for s in per_instance
+                )
+            m[f"p{p:g} Latency"] = value
+        merged[kind] = m
+    return merged
+
+
+def write_memtier_summary(path: Path, merged: Dict[str, Dict[str, float]]) -> None:
+    """Write merged results as the summary table of memtier_benchmark"""
+    columns = [
+        "Ops/sec",
+        "Hits/sec",
+        "Misses/sec",
+        "Average Latency",
+        *[f"p{p:g} Latency" for p in MEMTIER_PERCENTILES],
+        "KB/sec",
+    ]
+    header = "Type     " + "".join(
+        f"{c.replace('Average', 'Avg.'):>16}" for c in columns
+    )
+    lines = [header, "-" * len(header)]
+    for kind in ["Sets", "Gets", "Totals"]:
+        lines.append(
+            f"{kind:<9}" + "".join(f"{merged[kind][c]:>16.2f}" for c in columns)
+        )
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+# offered load of the rate sweep, relative to the measured peak throughput
+MEMTIER_SWEEP_LOADS = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1]
+
+
+def run_memtier_sweep(
+    name: str,
+    vm: QemuVm,
+    server: str = "redis",
+    port: int = 6379,
+    tls_port: int = 6380,
+    tls: bool = False,
+    server_threads: Optional[int] = None,
+    client_threads: int = 8,
+    clients: int = 50,
+    pin_start: int = 20,
+    step_time: int = 30,
+):
+    """Measure the latency of redis or memcached at a given load.
+    First, the peak throughput is measured (closed loop, in peak/). Then, the
+    offered load is stepped from 10% to 110% of the peak with memtier's
+    --rate-limiting (in rate-{percent}/). Every step records memtier's JSON
+    output (memtier.json) and HDR histograms (memtier_*.hgrm/txt).
+    Unlike run_memtier(), the requests are not pipelined so that the latency
+    of a request is not hidden behind the others.
+    The results are saved in ./bench-result/network/memtier-sweep/{server}[-tls]/{name}/{date}/
+    """
+    tls_ = "-tls" if tls else ""
+    date = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    outputdir = Path(
+        f"./bench-result/network/memtier-sweep/{server}{tls_}/{name}/{date}/"
+    )
+    outputdir_host = PROJECT_ROOT / outputdir
+    outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
+
+    cmd = memtier_client_cmd(
+        server, tls, port, tls_port, client_threads, clients=clients, pipeline=1
+    )
+    cmd = [
+        "taskset",
+        "-c",
+        f"{pin_start}-{pin_start + client_threads - 1}",
+        *cmd,
+        f"--test-time={step_time}",
+        "--print-percentiles=50,90,99,99.9,99.99",
+    ]
+    start_memtier_server(vm, server, tls, port, tls_port, server_threads)
+
+    def run_step(step: str, extra: List[str]) -> float:
+        stepdir = outputdir_host / step
+        stepdir.mkdir(parents=True, exist_ok=True)
+        step_cmd = [
+            *cmd,
+            *extra,
+            f"--json-out-file={stepdir}/memtier.json",
+            f"--hdr-file-prefix={stepdir}/memtier",
+        ]
+        print(step_cmd)
+        output = subprocess.check_output(step_cmd).decode()
+        with open(stepdir / "memtier.log", "w") as f:
+            f.write(output)
+        with open(stepdir / "memtier.json") as f:
+            return json.load(f)["ALL STATS"]["Totals"]["Ops/sec"]
+
+    peak = run_step("peak", [])
+    print(f"[memtier] peak: {peak:.0f} ops/s")
+    connections = client_threads * clients
+    steps = []
+    for load in MEMTIER_SWEEP_LOADS:
+        percent = round(load * 100)
+        # --rate-limiting is the number of requests per second of a connection
+        rate = max(1, round(load * peak / connections))
+        achieved = run_step(f"rate-{percent}", [f"--rate-limiting={rate}"])
+        print(f"[memtier] {percent}%: {rate * connections} -> {achieved:.0f} ops/s")
+        steps.append({"percent": percent, "rate": rate, "target": rate * connections})
+
+    sweep = {"peak": peak, "connections": connections, "steps": steps}
+    with open(outputdir_host / "sweep.json", "w") as f:
+        json.dump(sweep, f, indent=2)
+    update_metadata(outputdir_host / "run.json", memtier_sweep=sweep)
+    print(f"Results saved in {outputdir_host}")
+
+
 def run_nginx(
     name: str,
     vm: QemuVm,
@@ -231,6 +611,7 @@ def run_nginx(
     outputdir = Path(f"./bench-result/network/nginx/{name}/{date}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
 
     if pin_end is None:
         pin_end = pin_start + threads - 1
@@ -278,3 +659,326 @@ def run_nginx(
         f.write("\n".join(lines))
 
     print(f"Results saved in {outputdir_host}")
+
+
+# response sizes of the nginx sweep (files in benchmarks/network/nginx/www)
+NGINX_SIZES = {"1K": 1 << 10, "16K": 16 << 10, "128K": 128 << 10, "1M": 1 << 20}
+# offered request rate of the nginx sweep, relative to the peak of wrk
+NGINX_SWEEP_LOADS = [0.25, 0.5, 0.75, 0.9, 1.0]
+
+
+def nginx_www_files(sizes: List[str]) -> None:
+    """Create the files served by nginx (www/{size}.bin), if they do not exist"""
+    www = PROJECT_ROOT / "benchmarks/network/nginx/www"
+    for size in sizes:
+        file = www / f"{size}.bin"
+        if not file.exists() or file.stat().st_size != NGINX_SIZES[size]:
+            file.write_bytes(os.urandom(NGINX_SIZES[size]))
+
+
+def wrk_requests_per_sec(output: str) -> float:
+    match = re.search(r"^Requests/sec:\s+([\d.]+)", output, re.MULTILINE)
+    if match is None:
+        raise ValueError(f"No Requests/sec in the wrk output:\n{output}")
+    return float(match.group(1))
+
+
+def run_nginx_sweep(
+    name: str,
+    vm: QemuVm,
+    threads: int = 8,
+    connections: int = 300,
+    duration: str = "30s",
+    sizes: List[str] = list(NGINX_SIZES),
+    pin_start: int = 20,
+    pin_end: Optional[int] = None,
+):
+    """Measure the latency distribution of nginx at constant request rates.
+    For every scheme (http, https) and response size, the peak request rate
+    is measured by wrk (peak.log), then wrk2 offers 25% to 100% of it
+    (rate-{percent}.log) and reports the latency distribution corrected for
+    coordinated omission (--latency).
+    The results are saved in ./bench-result/network/nginx-sweep/{name}/{date}/{scheme}/{size}/
+    """
+    date = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    outputdir = Path(f"./bench-result/network/nginx-sweep/{name}/{date}/")
+    outputdir_host = PROJECT_ROOT / outputdir
+    outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
+
+    if pin_end is None:
+        pin_end = pin_start + threads - 1
+
+    nginx_www_files(sizes)
+    server_cmd = ["just", "-f", "/share/benchmarks/network/justfile", "run-nginx"]
+    vm.ssh_cmd(server_cmd)
+    time.sleep(1)
+
+    def run_wrk(cmd: List[str], log: Path) -> str:
+        cmd = ["taskset", "-c", f"{pin_start}-{pin_end}", *cmd]
+        print(cmd)
+        output = subprocess.run(cmd, capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"Error running {cmd[3]}: {output.stderr}")
+        log.parent.mkdir(parents=True, exist_ok=True)
+        with open(log, "w") as f:
+            f.write(output.stdout)
+        return output.stdout
+
+    sweep: Dict[str, Dict[str, Any]] = {}
+    for scheme in ["http", "https"]:
+        for size in sizes:
+            url = f"{scheme}://{VM_IP}/{size}.bin"
+            opts = [f"-t{threads}", f"-c{connections}", f"-d{duration}"]
+            rundir = outputdir_host / scheme / size
+            output = run_wrk(["wrk", url, *opts], rundir / "peak.log")
+            peak = wrk_requests_per_sec(output)
+            rates = {}
+            for load in NGINX_SWEEP_LOADS:
+                percent = round(load * 100)
+                rates[percent] = max(1, round(load * peak))
+                cmd = ["wrk2", url, *opts, f"-R{rates[percent]}", "--latency"]
+                run_wrk(cmd, rundir / f"rate-{percent}.log")
+            print(f"[nginx] {scheme} {size}: peak {peak:.0f} req/s")
+            sweep[f"{scheme}/{size}"] = {"peak": peak, "rates": rates}
+
+    with open(outputdir_host / "sweep.json", "w") as f:
+        json.dump(sweep, f, indent=2)
+    update_metadata(outputdir_host / "run.json", nginx_sweep=sweep)
+    print(f"Results saved in {outputdir_host}")
+
+
+# server key types of the TLS handshake benchmark
+TLS_KEY_TYPES = {
+    "rsa2048": ["-newkey", "rsa:2048"],
+    "rsa4096": ["-newkey", "rsa:4096"],
+    "ecdsa-p256": ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1"],
+}
+TLS_PKI = Path("benchmarks/network/tls/pki")
+
+
+def server_cert(key_type: str) -> Tuple[Path, Path]:
+    """Return the certificate and the key (relative to the project root) of a
+    server key of key_type, signed by the CA of benchmarks/network/tls/pki.
+    They are created if they do not exist.
+    """
+    crt = TLS_PKI / "issued" / f"server-{key_type}.crt"
+    key = TLS_PKI / "private" / f"server-{key_type}.key"
+    if (PROJECT_ROOT / crt).exists() and (PROJECT_ROOT / key).exists():
+        return crt, key
+
+    pki = PROJECT_ROOT / TLS_PKI
+    usage = "digitalSignature"
+    if key_type.startswith("rsa"):
+        usage += ",keyEncipherment"
+    ext = pki / f"server-{key_type}.ext"
+    ext.write_text(
+        "basicConstraints=CA:FALSE\n"
+        f"keyUsage={usage}\n"
+        "extendedKeyUsage=serverAuth\n"
+        "subjectAltName=DNS:server\n"
+    )
+    csr = pki / f"server-{key_type}.csr"
+    try:
+        subprocess.run(
+            [
+                "openssl",
+                "req",
+                "-new",
+                *TLS_KEY_TYPES[key_type],
+                "-nodes",
+                "-subj",
+                "/CN=server",
+                "-keyout",
+                PROJECT_ROOT / key,
+                "-out",
+                csr,
+            ],
+            check=True,
+        )
+        subprocess.run(
+            [
+                "openssl",
+                "x509",
+                "-req",
+                "-in",
+                csr,
+                "-CA",
+                pki / "ca.crt",
+                "-CAkey",
+                pki / "private" / "ca.key",
+                "-set_serial",
+                f"0x{os.urandom(16).hex()}",
+                "-days",
+                "825",
+                "-extfile",
+                ext,
+                "-out",
+                PROJECT_ROOT / crt,
+            ],
+            check=True,
+        )
+    finally:
+        csr.unlink(missing_ok=True)
+        ext.unlink(missing_ok=True)
+    return crt, key
+
+
+def start_tls_servers(
+    vm: QemuVm, key_type: str, nginx_port: int, redis_port: int
+) -> None:
+    """Start nginx and redis in the VM with a server key of key_type on the
+    given TLS ports (redis does not authenticate clients)
+    """
+    crt, key = server_cert(key_type)
+    nginxdir = PROJECT_ROOT / "benchmarks/network/nginx"
+    # see nginx.conf; session resumption needs a session cache (or tickets)
+    conf = f"""http {{
+    server {{
+        listen {nginx_port} ssl;
+        server_name benchmark;
+        ssl_certificate ../{crt.relative_to("benchmarks/network")};
+        ssl_certificate_key ../{key.relative_to("benchmarks/network")};
+        ssl_session_cache shared:SSL:10m;
+        ssl_session_tickets on;
+        access_log off;
+        error_log off;
+        location / {{
+            root www;
+        }}
+    }}
+}}
+events {{}}
+pid handshake-{key_type}.pid;
+daemon on;
+"""
+    (nginxdir / f"handshake-{key_type}.conf").write_text(conf)
+    justfile = "/share/benchmarks/network/justfile"
+    vm.ssh_cmd(["just", "-f", justfile, "run-nginx-conf", f"handshake-{key_type}.conf"])
+    vm.ssh_cmd(
+        [
+            "just",
+            "-f",
+            justfile,
+            f"STANDARD_MEMTIER_PORT={redis_port + 100}",
+            f"TLS_MEMTIER_PORT={redis_port}",
+            f"SERVER_CERT=/share/{crt}",
+            f"SERVER_KEY=/share/{key}",
+            "run-redis-tls-noauth",
+        ]
+    )
+    time.sleep(1)
+
+
+@contextmanager
+def count_vmexits(pid: int, outfile: Path) -> Iterator[None]:
+    """Count the VM exits (and VMGEXITs of SEV) of the QEMU process pid with
+    bpftrace while the context is active and save the counts in outfile
+    """
+    with open("/proc/cpuinfo") as f:
+        vendor = "amd" if "AuthenticAMD" in f.read() else "intel"
+    script = PROJECT_ROOT / f"scripts/trace/{vendor}_kvm_vmexit_count.bt"
+    # only count the exits of this VM
+    code = re.sub(
+        r"^(tracepoint:kvm:\w+) \{",
+        rf"\1 /pid == {pid}/ {{",
+        script.read_text(),
+        flags=re.MULTILINE,
+    )
+    bpftrace = subprocess.Popen(
+        ["bpftrace", "-"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    bpftrace.stdin.write(code)
+    bpftrace.stdin.close()  # send EOF
+    time.sleep(3)  # ensure loading of BPF program
+    try:
+        yield
+    finally:
+        # the END block prints the counts
+        bpftrace.send_signal(signal.SIGINT)
+        stdout, stderr = bpftrace.communicate()
+        if bpftrace.returncode != 0:
+            print(f"bpftrace failed with return code {bpftrace.returncode}")
+            print(stderr)
+        with open(outfile, "w") as f:
+            f.write(stdout)
+
+
+def run_tls_handshake(
+    name: str,
+    vm: QemuVm,
+    clients: int = 8,
+    duration: int = 30,
+    key_types: List[str] = list(TLS_KEY_TYPES),
+    servers: List[str] = ["nginx", "redis"],
+    pin_start: int = 20,
+    vmexit: bool = True,
+):
+    """Measure the rate and the latency of new TLS handshakes against nginx
+    and redis in the VM with `openssl s_time` for every server key type, with
+    full handshakes (new) and with session resumption (reuse). No data is
+    transferred after a handshake. clients processes (pinned to pin_start..)
+    connect in parallel for duration seconds; with vmexit, the VM exits
+    during the run are counted by bpftrace.
+    The results are saved in ./bench-result/network/tls-handshake/{name}/{date}/
+    as {server}-{key_type}-{new,reuse}.log (and .vmexit)
+    """
+    date = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    outputdir = Path(f"./bench-result/network/tls-handshake/{name}/{date}/")
+    outputdir_host = PROJECT_ROOT / outputdir
+    outputdir_host.mkdir(parents=True, exist_ok=True)
+    save_metadata(outputdir_host / "run.json", vm.metadata, name)
+
+    ports: Dict[str, Dict[str, int]] = {}
+    for i, key_type in enumerate(key_types):
+        ports[key_type] = {"nginx": 8443 + i, "redis": 6390 + i}
+        start_tls_servers(
+            vm, key_type, ports[key_type]["nginx"], ports[key_type]["redis"]
+        )
+    print("Servers started")
+
+    for server in servers:
+        for key_type in key_types:
+            for session in ["new", "reuse"]:
+                run = f"{server}-{key_type}-{session}"
+                cmd = [
+                    "openssl",
+                    "s_time",
+                    "-connect",
+                    f"{VM_IP}:{ports[key_type][server]}",
+                    f"-{session}",
+                    "-time",
+                    f"{duration}",
+                    "-CAfile",
+                    f"{PROJECT_ROOT / TLS_PKI / 'ca.crt'}",
+                ]
+                print(cmd)
+                vmexits = outputdir_host / f"{run}.vmexit"
+                with count_vmexits(vm.pid, vmexits) if vmexit else nullcontext():
+                    procs = [
+                        subprocess.Popen(
+                            ["taskset", "-c", f"{pin_start + i}", *cmd],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            text=True,
+                        )
+                        for i in range(clients)
+                    ]
+                    outputs = [proc.communicate()[0] for proc in procs]
+                for proc in procs:
+                    if proc.returncode != 0:
+                        print(f"Error running s_time: {proc.returncode}")
+                with open(outputdir_host / f"{run}.log", "w") as f:
+                    for i, output in enumerate(outputs):
+                        f.write(f"# client {i}\n{output}")
+                print(f"[tls] {run} done")
+
+    update_metadata(
+        outputdir_host / "run.json",
+        tls_handshake={"clients": clients, "duration": duration, "ports": ports},
+    )
+    print(f"Results saved in {outputdir_host}")
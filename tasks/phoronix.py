@@ -1,18 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from collections import defaultdict
 from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import IO, Dict, Iterator, List, Union
+from typing import IO, Any, Dict, Iterator, List, Union
+import io
 import subprocess
 
 import pandas as pd
 from lxml import etree
 
+from cache import cached
 from config import PROJECT_ROOT
+from metadata import save_metadata
 from qemu import QemuVm
 
 # Based on
@@ -55,43 +57,94 @@ def yes_please() -> IO[bytes]:
     return yes_please.stdout
 
 
-def parse_xml(path: Union[str, Path]) -> pd.DataFrame:
-    """Parse the Phoronix XML file (or str) and return a DataFrame with the results."""
+# precompiled XPath expressions (see iter_entries()); smart strings would keep
+# a reference to the parsed tree
+RESULT_FIELDS = {
+    field: etree.XPath(f"string(./{tag})", smart_strings=False)
+    for field, tag in [
+        ("title", "Title"),
+        ("app_version", "AppVersion"),
+        ("description", "Description"),
+        ("scale", "Scale"),
+        ("proportion", "Proportion"),
+    ]
+}
+ENTRIES = etree.XPath("./Data/Entry")
+ENTRY_FIELDS = {
+    field: etree.XPath(f"./{tag}/text()", smart_strings=False)
+    for field, tag in [
+        ("identifier", "Identifier"),
+        ("value", "Value"),
+        ("raw_string", "RawString"),
+        ("json", "JSON"),
+    ]
+}
+
+
+def iter_entries(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """Stream the result entries of a Phoronix XML file (or str) as dicts.
+
+    Only one <Result> element is kept in memory at a time.
+    """
+    source: Union[str, IO[bytes]]
     if isinstance(path, Path):
-        tree = etree.parse(str(path))
+        source = str(path)
     else:
-        tree = etree.fromstring(path)
-    results = defaultdict(list)
-    for result in tree.xpath("./Result"):
-        for entry in result.xpath("./Data/Entry"):
-            value = entry.xpath("./Value")[0].text
-            if value == None:
+        source = io.BytesIO(path.encode() if isinstance(path, str) else path)
+    for _, result in etree.iterparse(source, events=("end",), tag="Result"):
+        fields = {field: xpath(result) for field, xpath in RESULT_FIELDS.items()}
+        fields["benchmark_id"] = "%s: %s [%s]" % (
+            fields["title"],
+            fields["description"],
+            fields["scale"],
+        )
+        for entry in ENTRIES(result):
+            row: Dict[str, Any] = {}
+            for field, xpath in ENTRY_FIELDS.items():
+                texts = xpath(entry)
+                row[field] = texts[0] if texts else None
+            if row["value"] is None:
                 # the value can be None if the test failed to run
-                printf(f"XXX: value of {entry} is None! check the xml file")
+                print(f"XXX: value of {row['identifier']} is None! check the xml file")
                 continue
-            identifier = entry.xpath("./Identifier")[0].text
-            results["identifier"].append(entry.xpath("./Identifier")[0].text)
-            results["value"].append(float(entry.xpath("./Value")[0].text))
-            results["raw_string"].append(entry.xpath("./RawString")[0].text)
-            json = entry.xpath("./JSON")
-            if len(json) == 0:
-                results["json"].append("")
-            else:
-                results["json"].append(json[0].text)
+            row["value"] = float(row["value"])
+            row["json"] = row["json"] or ""
+            row.update(fields)
+            yield row
+        # free the parsed elements
+        result.clear()
+        while result.getprevious() is not None:
+            del result.getparent()[0]
 
-            title = result.xpath("./Title")[0].text
-            scale = result.xpath("./Scale")[0].text
-            description = result.xpath("./Description")[0].text
 
-            results["title"].append(title)
-            results["app_version"].append(result.xpath("./AppVersion")[0].text)
-            results["description"].append(description)
-            results["scale"].append(scale)
+@cached()
+def parse_xml(path: Union[str, Path]) -> pd.DataFrame:
+    """Parse the Phoronix XML file (or str) and return a DataFrame with the results."""
+    columns = ["identifier", "value", "raw_string", "json", "title", "app_version"]
+    columns += ["description", "scale", "proportion", "benchmark_id"]
+    return pd.DataFrame(list(iter_entries(path)), columns=columns)
 
-            results["proportion"].append(result.xpath("./Proportion")[0].text)
-            results["benchmark_id"].append("%s: %s [%s]" % (title, description, scale))
 
-    return pd.DataFrame(results)
+@cached()
+def parse_xml_trials(path: Union[str, Path]) -> pd.DataFrame:
+    """Same as parse_xml() but with one row per trial: the value of each
+    trial is taken from RawString (e.g., "12.1:12.3:12.2"), the average
+    reported by Phoronix is kept as "mean".
+    """
+    rows = []
+    for row in iter_entries(path):
+        samples = [s for s in (row.pop("raw_string") or "").split(":") if s]
+        mean = row.pop("value")
+        values = []
+        for sample in samples:
+            try:
+                values.append(float(sample))
+            except ValueError:
+                # e.g., "" or a failed trial
+                pass
+        for trial, value in enumerate(values or [mean]):
+            rows.append(dict(row, trial=trial, value=value, mean=mean))
+    return pd.DataFrame(rows)
 
 
 # test results path when running phoronix as root
@@ -171,6 +224,9 @@ def run_phoronix(
 
     # copy the result to the host
     vm.ssh_cmd(["cp", str(report_path), str(out_path)])
+    save_metadata(
+        outputdir_host / f"{date}.meta.json", vm.metadata, name, bench=pts_name
+    )
 
 
 if __name__ == "__main__":
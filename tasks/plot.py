@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Render all figures of a manifest in one go.
+
+A manifest (e.g., experiment/plot_manifest.json) is a JSON list of figures:
+[
+  {"task": "network.plot-iperf", "result_dir": "network",
+   "args": {"mode": "udp", "mq": true}, "datasets": ["iperf"]},
+  {"task": "boottime.plot-boottime-snp", "result_dir": "boottime",
+   "args": {"cpu": true}, "cvm": "snp"}
+]
+- task: invoke task name (collection.task as in tasks/__init__.py)
+- result_dir: subdirectory of --result-dir passed to the task as result_dir
+- args: other arguments of the task (cvm and outdir are set by render-all)
+- datasets: benchmarks of the result dataset the figure reads (see results.py)
+- cvm: only render the figure for this CVM type
+
+The plot modules and the datasets are loaded once, then the figures are
+rendered by forked worker processes. A figure is skipped if its inputs (the
+files under its result directory), its plotting code and its arguments are
+unchanged since the last render (see .cache/render/).
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+import ast
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import time
+
+from invoke import Context, task
+
+from config import PROJECT_ROOT, SCRIPT_ROOT
+
+# collection name -> module of the plot tasks (also the lazily imported
+# collections of tasks/__init__.py)
+PLOT_MODULES = {
+    "phoronix": "plot_phoronix_memory",
+    "npb": "plot_phoronix_npb",
+    "app": "plot_application",
+    "network": "plot_network",
+    "boottime": "plot_boottime",
+    "vmexit": "plot_vmexit",
+    "storage": "plot_storage",
+    "unixbench": "plot_unixbench",
+}
+
+STATE_FILE = PROJECT_ROOT / ".cache" / "render" / "state.json"
+
+
+def load_manifest(path: Path, cvm: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        manifest = json.load(f)
+    return [fig for fig in manifest if fig.get("cvm", cvm) == cvm]
+
+
+def figure_id(fig: Dict[str, Any]) -> str:
+    args = " ".join(f"--{k}={v}" for k, v in sorted(fig.get("args", {}).items()))
+    return f"{fig['task']} {args}".strip()
+
+
+def resolve_task(name: str) -> Any:
+    collection, task_name = name.split(".", 1)
+    module = importlib.import_module(PLOT_MODULES[collection])
+    return getattr(module, task_name.replace("-", "_"))
+
+
+def code_files(module_name: str) -> List[Path]:
+    """Return the source of a plot module and of the local modules it imports"""
+    path = SCRIPT_ROOT / f"{module_name}.py"
+    files = {path}
+    for node in ast.walk(ast.parse(path.read_text())):
+        names = []
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        for name in names:
+            local = SCRIPT_ROOT / f"{name.split('.')[0]}.py"
+            if local.exists():
+                files.add(local)
+    return sorted(files)
+
+
+def input_hash(fig: Dict[str, Any], result_dir: Path) -> str:
+    """Hash the inputs (path, mtime, size), the plotting code and the arguments"""
+    h = hashlib.sha256()
+    h.update(figure_id(fig).encode())
+    module = PLOT_MODULES[fig["task"].split(".", 1)[0]]
+    for path in code_files(module):
+        h.update(path.read_bytes())
+    inputs = result_dir / fig["result_dir"]
+    for root, dirs, files in os.walk(inputs):
+        dirs[:] = sorted(d for d in dirs if d != "dataset")
+        for file in sorted(files):
+            st = os.stat(os.path.join(root, file))
+            rel = os.path.relpath(os.path.join(root, file), inputs)
+            h.update(f"{rel}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+    return h.hexdigest()
+
+
+def warm_up(figs: List[Dict[str, Any]], result_dir: Path) -> None:
+    """Import the plot modules, build the font cache and load the datasets
+    before forking the workers so that they share them
+    """
+    import matplotlib.font_manager as font_manager  # type: ignore
+    import results
+
+    for fig in figs:
+        resolve_task(fig["task"])
+    # plot_common sets the font family; resolve it once
+    font_manager.findfont("libertine")
+    for fig in figs:
+        for benchmark in fig.get("datasets", []):
+            results.load(benchmark, result_dir / fig["result_dir"])
+
+
+def render(fig: Dict[str, Any], cvm: str, outdir: str, result_dir: Path) -> float:
+    """Render a figure (in a worker process) and return the elapsed time"""
+    import matplotlib.pyplot as plt  # type: ignore
+
+    start = time.perf_counter()
+    kwargs = dict(fig.get("args", {}))
+    kwargs.update(
+        cvm=cvm, outdir=outdir, result_dir=str(result_dir / fig["result_dir"])
+    )
+    try:
+        resolve_task(fig["task"])(Context(), **kwargs)
+    finally:
+        plt.close("all")
+    return time.perf_counter() - start
+
+
+def detect_cvm() -> str:
+    with open("/proc/cpuinfo") as f:
+        return "snp" if "AuthenticAMD" in f.read() else "tdx"
+
+
+# examples:
+# inv plot.render-all
+# inv plot.render-all --cvm tdx --result-dir bench-results --outdir plot --jobs 8
+# inv plot.render-all --only network --force
+@task
+def render_all(
+    ctx: Any,
+    manifest: str = "experiment/plot_manifest.json",
+    cvm: Optional[str] = None,  # by default detected from the host CPU
+    result_dir: str = "bench-results",
+    outdir: str = "plot",
+    jobs: int = 0,  # number of worker processes (0: number of CPUs)
+    only: Optional[str] = None,  # only render figures whose task contains this
+    force: bool = False,  # render even if nothing changed
+    dry_run: bool = False,  # only show what would be rendered
+) -> None:
+    """Render the figures of a manifest in parallel, skipping unchanged ones"""
+    if cvm is None:
+        cvm = detect_cvm()
+    figs = load_manifest(Path(manifest), cvm)
+    if only is not None:
+        figs = [fig for fig in figs if only in fig["task"]]
+    root = Path(result_dir)
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+
+    state: Dict[str, str] = {}
+    if STATE_FILE.exists() and not force:
+        state = json.loads(STATE_FILE.read_text())
+    key = f"{cvm}:{root}:{outdir}"
+    hashes = {figure_id(fig): input_hash(fig, root) for fig in figs}
+    todo = [
+        fig
+        for fig in figs
+        if state.get(f"{key}:{figure_id(fig)}") != hashes[figure_id(fig)]
+    ]
+    print(f"[render] {len(todo)} of {len(figs)} figures changed")
+    if dry_run or not todo:
+        for fig in todo:
+            print(f"[render] {figure_id(fig)}")
+        return
+
+    warm_up(todo, root)
+    failed: Set[str] = set()
+    workers = jobs or os.cpu_count() or 1
+    mp = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(todo)), mp_context=mp
+    ) as pool:
+        futures = {pool.submit(render, fig, cvm, outdir, root): fig for fig in todo}
+        for future in as_completed(futures):
+            fid = figure_id(futures[future])
+            try:
+                elapsed = future.result()
+            except Exception as e:
+                print(f"[render] failed {fid}: {e!r}")
+                failed.add(fid)
+                continue
+            print(f"[render] done {fid} ({elapsed:.1f}s)")
+            state[f"{key}:{fid}"] = hashes[fid]
+
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    STATE_FILE.write_text(json.dumps(state, indent=2))
+    if failed:
+        raise RuntimeError(f"{len(failed)} figures failed")
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import matplotlib as mpl  # type: ignore
 import matplotlib.pyplot as plt  # type: ignore
 import seaborn as sns  # type: ignore
 from typing import Any, Dict, List, Union, Optional
@@ -12,21 +11,12 @@ from pathlib import Path
 
 from invoke import task
 
-mpl.use("Agg")
-mpl.rcParams["text.latex.preamble"] = r"\usepackage{amsmath}"
-mpl.rcParams["pdf.fonttype"] = 42
-mpl.rcParams["ps.fonttype"] = 42
-mpl.rcParams["font.family"] = "libertine"
+import results
+import stats
+from cache import cached
 
-sns.set_style("whitegrid")
-sns.set_style("ticks", {"xtick.major.size": 8, "ytick.major.size": 8})
-sns.set_context("paper", rc={"font.size": 5, "axes.titlesize": 5, "axes.labelsize": 8})
-
-# 3.3 inch for single column, 7 inch for double column
-figwidth_half = 3.3
-figwidth_full = 7
-
-FONTSIZE = 9
+# common graph settings
+from plot_common import FONTSIZE, figwidth_full, figwidth_half
 
 pastel = sns.color_palette("pastel")
 vm_col = pastel[0]
@@ -40,6 +30,27 @@ hatches2 = ["", "", "//"]
 BENCH_RESULT_DIR = Path("./bench-result/application")
 
 
+def load_app_result(
+    app: str, name: str, date: Optional[str] = None
+) -> Optional[pd.DataFrame]:
+    """Return the times of a run of app from the result dataset, or None if
+    the dataset is not available
+    """
+    data = results.load(app, BENCH_RESULT_DIR)
+    if data is None:
+        return None
+    data = data[data["name"] == name]
+    if date is None:
+        # we use the latest result if date is not provided
+        date = sorted(data["date"].unique())[-1]
+    data = data[data["date"] == date]
+    if len(data) == 0:
+        print(f"XXX: No result found for {app}/{name}/{date}")
+        return pd.DataFrame({"name": [name], "time": [0]})
+    return pd.DataFrame({"name": name, "time": data["time"]}).reset_index(drop=True)
+
+
+@cached()
 def parse_blender_result_sub(name: str, file: Path):
     with open(file) as f:
         lines = f.readlines()
@@ -62,6 +73,10 @@ def parse_blender_result_sub(name: str, file: Path):
 # bench mark path:
 # ./bench-result/application/blender/{name}/{date}/
 def parse_blender_result(name: str, date: Optional[str] = None) -> float:
+    df = load_app_result("blender", name, date)
+    if df is not None:
+        return df
+
     if date is None:
         # we use the latest result if date is not provided
         date = sorted(os.listdir(BENCH_RESULT_DIR / "blender" / name))[-1]
@@ -74,6 +89,9 @@ def parse_blender_result(name: str, date: Optional[str] = None) -> float:
     # iterate over the files in the directory
     dfs = []
     for file in os.listdir(path):
+        if not file.endswith(".log"):
+            # e.g., run.json (see metadata.py)
+            continue
         df = parse_blender_result_sub(name, path / file)
         dfs.append(df)
 
@@ -83,6 +101,7 @@ def parse_blender_result(name: str, date: Optional[str] = None) -> float:
     return df
 
 
+@cached()
 def parse_pytorch_result_sub(name: str, file: Path):
     with open(file) as f:
         lines = f.readlines()
@@ -102,6 +121,10 @@ def parse_pytorch_result_sub(name: str, file: Path):
 
 
 def parse_pytorch_result(name: str, date: Optional[str] = None) -> float:
+    df = load_app_result("pytorch", name, date)
+    if df is not None:
+        return df
+
     if date is None:
         # we use the latest result if date is not provided
         date = sorted(os.listdir(BENCH_RESULT_DIR / "pytorch" / name))[-1]
@@ -114,6 +137,9 @@ def parse_pytorch_result(name: str, date: Optional[str] = None) -> float:
     # iterate over the files in the directory
     dfs = []
     for file in os.listdir(path):
+        if not file.endswith(".log"):
+            # e.g., run.json (see metadata.py)
+            continue
         df = parse_pytorch_result_sub(name, path / file)
         dfs.append(df)
 
@@ -123,6 +149,7 @@ def parse_pytorch_result(name: str, date: Optional[str] = None) -> float:
     return df
 
 
+@cached()
 def parse_tensorflow_result_sub(name: str, file: Path):
     with open(file) as f:
         lines = f.readlines()
@@ -142,6 +169,10 @@ def parse_tensorflow_result_sub(name: str, file: Path):
 
 
 def parse_tensorflow_result(name: str, date: Optional[str] = None) -> float:
+    df = load_app_result("tensorflow", name, date)
+    if df is not None:
+        return df
+
     if date is None:
         # we use the latest result if date is not provided
         date = sorted(os.listdir(BENCH_RESULT_DIR / "tensorflow" / name))[-1]
@@ -154,6 +185,9 @@ def parse_tensorflow_result(name: str, date: Optional[str] = None) -> float:
     # iterate over the files in the directory
     dfs = []
     for file in os.listdir(path):
+        if not file.endswith(".log"):
+            # e.g., run.json (see metadata.py)
+            continue
         df = parse_tensorflow_result_sub(name, path / file)
         dfs.append(df)
     if len(dfs) == 0:
@@ -165,6 +199,7 @@ def parse_tensorflow_result(name: str, date: Optional[str] = None) -> float:
     return df
 
 
+@cached()
 def parse_sqlite_result_sub(name: str, workload: str, file: Path):
     with open(file) as f:
         lines = f.readlines()
@@ -189,14 +224,24 @@ def parse_sqlite_result(
     label: Optional[str] = None,
     max_num: int = 10,
 ) -> pd.DataFrame:
+    if label is None:
+        label = name
+
+    data = results.load("sqlite", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[data["name"] == name]
+        dates = sorted(data["date"].unique())[-max_num:] if date is None else [date]
+        data = data[data["date"].isin(dates)]
+        return pd.DataFrame(
+            {"name": label, "workload": data["workload"], "time": data["time"]}
+        ).reset_index(drop=True)
+
     dates = []
     if date is None:
         # we use the latest results if date is not provided
-        dates = sorted(os.listdir(BENCH_RESULT_DIR / "sqlite" / name))[:max_num]
+        dates = sorted(os.listdir(BENCH_RESULT_DIR / "sqlite" / name))[-max_num:]
     else:
         dates.append(date)
-    if label is None:
-        label = name
 
     workloads = ["seq", "rand", "update", "update_rand"]
 
@@ -329,31 +374,26 @@ def plot_application(
     # calc relative values
     # type vm is the baseline
     for i, app in enumerate(["Blender", "Pytorch", "Tensorflow"]):
-        # choose mean values of each size
-        vm_mean = df[(df["VM"] == vm_label) & (df["Application"] == app)]
-        vm_mean = vm_mean.groupby("Size")["Time"].mean()
-        vm_index = np.array([vm_mean[label] for label in labels])
-        cvm_mean = df[(df["VM"] == cvm_label) & (df["Application"] == app)]
-        cvm_mean = cvm_mean.groupby("Size")["Time"].mean()
-        cvm_index = np.array([cvm_mean[label] for label in labels])
-
-        print("vm_index:", vm_index, cvm_index)
-
-        if app == "Tensorflow":
-            vm_index[0] = 1
-            cvm_index[0] = 1
-        relative = cvm_index / vm_index
-        if i == 2:
-            geoman = np.prod(relative[1:]) ** (1 / len(relative[1:]))
-        else:
-            geomean = np.exp(np.mean(np.log(relative)))
-        if app == "Tensorflow":
-            overhead = (1 - geomean) * 100
-        else:
-            overhead = (geomean - 1) * 100
-        print(f"{app}: {relative}")
+        # CVM and VM times of each size
+        app_df = df[df["Application"] == app]
+        pairs = [
+            (
+                app_df[(app_df["VM"] == cvm_label) & (app_df["Size"] == label)]["Time"],
+                app_df[(app_df["VM"] == vm_label) & (app_df["Size"] == label)]["Time"],
+            )
+            for label in labels
+        ]
+        # Tensorflow has no result for small
+        skip = 1 if app == "Tensorflow" else 0
+        ratios = [stats.ratio(c, v) for c, v in pairs[skip:]]
+        relative = np.array([1.0] * skip + [r.value for r in ratios])
+        geomean = stats.geomean_ratio(pairs[skip:])
+        # Tensorflow reports a throughput
+        overhead = geomean.overhead(higher_is_better=app == "Tensorflow")
+        for label, r in zip(labels[skip:], ratios):
+            print(f"{app} {label}: {r}")
         print(f"Geometric mean of relative values for {app}: {geomean}")
-        print(f"Overhead for {app}: {overhead:.2f}%")
+        print(f"Overhead for {app}: {overhead}%")
 
         if rel:
             # plot rel using right axis
@@ -6,29 +6,16 @@ from pathlib import Path
 import os
 
 from invoke import task
-import matplotlib as mpl  # type: ignore
 import matplotlib.pyplot as plt  # type: ignore
 import seaborn as sns  # type: ignore
 import pandas as pd
 import numpy as np
 
-# common graph settings
-
-mpl.use("Agg")
-mpl.rcParams["text.latex.preamble"] = r"\usepackage{amsmath}"
-mpl.rcParams["pdf.fonttype"] = 42
-mpl.rcParams["ps.fonttype"] = 42
-mpl.rcParams["font.family"] = "libertine"
-
-sns.set_style("whitegrid")
-sns.set_style("ticks", {"xtick.major.size": 8, "ytick.major.size": 8})
-sns.set_context("paper", rc={"font.size": 5, "axes.titlesize": 5, "axes.labelsize": 8})
+import stats
+from cache import cached
 
-# 3.3 inch for single column, 7 inch for double column
-figwidth_half = 3.3
-figwidth_full = 7
-
-FONTSIZE = 9
+# common graph settings
+from plot_common import FONTSIZE, figwidth_half
 
 palette = sns.color_palette("pastel")
 hatches = ["", "//", "\\"]
@@ -94,12 +81,20 @@ def parse_result(result: list) -> List[float]:
     return times
 
 
+@cached()
+def parse_result_file(file: Path) -> List[float]:
+    with open(file) as f:
+        result = f.readlines()
+    return parse_result(result)
+
+
 # bench mark path:
 # ./bench-result/boottime/{name}/{date}
 BENCH_RESULT_DIR = Path("./bench-result/boottime")
 
 
-def load_data(name: str, date=None) -> List[float]:
+def load_runs(name: str, date=None) -> np.ndarray:
+    """Return the elapsed times of all runs (runs x phases)"""
     if date is None:
         # use the latest date
         date = sorted(os.listdir(BENCH_RESULT_DIR / name))[-1]
@@ -110,15 +105,32 @@ def load_data(name: str, date=None) -> List[float]:
     results = []
     for file in os.listdir(path):
         if file.endswith(".txt"):
-            with open(path / file) as f:
-                result = f.readlines()
-            parsed = parse_result(result)
-            results.append(parsed)
+            results.append(parse_result_file(path / file))
+    return np.array(results)
+
+
+def load_data(name: str, date=None) -> List[float]:
+    results = load_runs(name, date)
 
     # choose median value of the total time as a result
     total_times = np.sum(results, axis=1)
     median_index = np.argsort(total_times)[len(total_times) // 2]
-    return results[median_index]
+    return list(results[median_index])
+
+
+def print_total_overheads(vm_names: Dict[int, str], cvm_names: Dict[int, str]) -> None:
+    """Print the CVM/VM ratio of the median total boot time with its CI"""
+    for size, vm_name in vm_names.items():
+        vm = load_runs(vm_name).sum(axis=1)
+        cvm = load_runs(cvm_names[size]).sum(axis=1)
+        r = stats.ratio(cvm, vm, stat="median")
+        outliers = int(stats.outliers(pd.Series(vm)).sum()) + int(
+            stats.outliers(pd.Series(cvm)).sum()
+        )
+        print(
+            f"{size}: total {np.median(vm):.2f}s, {np.median(cvm):.2f}s, "
+            f"ratio {r} ({len(vm)}, {len(cvm)} runs, {outliers} outliers)"
+        )
 
 
 def create_df(vm, cvm, index) -> pd.DataFrame:
@@ -403,16 +415,17 @@ def plot_boottime2(
     if not prealloc:
         p = "-no-prealloc"
     if cpu:
-        for cpu in cpusize:
-            vm_[cpu] = load_data(f"{vm}-direct-boot-cpu{cpu}")
-            cvm_[cpu] = load_data(f"{cvm}-direct-boot-cpu{cpu}{p}")
-        df = create_df(vm_, cvm_, cpusize)
+        vm_names = {cpu: f"{vm}-direct-boot-cpu{cpu}" for cpu in cpusize}
+        cvm_names = {cpu: f"{cvm}-direct-boot-cpu{cpu}{p}" for cpu in cpusize}
     else:
-        for mem in memsize:
-            vm_[mem] = load_data(f"{vm}-direct-boot-mem{mem}")
-            cvm_[mem] = load_data(f"{cvm}-direct-boot-mem{mem}{p}")
-        df = create_df(vm_, cvm_, memsize)
+        vm_names = {mem: f"{vm}-direct-boot-mem{mem}" for mem in memsize}
+        cvm_names = {mem: f"{cvm}-direct-boot-mem{mem}{p}" for mem in memsize}
+    for size in vm_names:
+        vm_[size] = load_data(vm_names[size])
+        cvm_[size] = load_data(cvm_names[size])
+    df = create_df(vm_, cvm_, list(vm_names))
     print(df)
+    print_total_overheads(vm_names, cvm_names)
 
     ax = plot_clustered_stacked(df, [vm_label, cvm_label], cvm=cvm, color=palette)
 
@@ -1,32 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import matplotlib as mpl  # type: ignore
 import matplotlib.pyplot as plt  # type: ignore
 import seaborn as sns  # type: ignore
 from typing import Any, Dict, List, Union, Optional
 import pandas as pd
+import json
 import os
+import re
 import numpy as np
 from pathlib import Path
 
 from invoke import task
 
-mpl.use("Agg")
-mpl.rcParams["text.latex.preamble"] = r"\usepackage{amsmath}"
-mpl.rcParams["pdf.fonttype"] = 42
-mpl.rcParams["ps.fonttype"] = 42
-mpl.rcParams["font.family"] = "libertine"
+import results
+from cache import cached
+from loader import load_files
 
-sns.set_style("whitegrid")
-sns.set_style("ticks", {"xtick.major.size": 8, "ytick.major.size": 8})
-sns.set_context("paper", rc={"font.size": 5, "axes.titlesize": 5, "axes.labelsize": 8})
-
-# 3.3 inch for single column, 7 inch for double column
-figwidth_half = 3.3
-figwidth_full = 7
-
-FONTSIZE = 9
+# common graph settings
+from plot_common import FONTSIZE, figwidth_full, figwidth_half
 
 pastel = sns.color_palette("pastel")
 # palette = sns.color_palette("pastel")
@@ -55,32 +47,106 @@ hatches3 = ["", "*", "//", "-", "\\", ".", "o-", "*-"]
 BENCH_RESULT_DIR = Path("./bench-result/network")
 
 
+def iperf_log(outputdir: Path, size: Union[int, str]) -> Path:
+    """Return the output of a packet size: {size}.json (iperf3 JSON), or
+    {size}.log (text) for older runs
+    """
+    file = outputdir / f"{size}.json"
+    return file if file.exists() else outputdir / f"{size}.log"
+
+
 def parse_iperf_result_sub(
     name: str, mode: str, date: str, lebel: str, pkt_size: [int]
 ) -> pd.DataFrame:
-    ths = []
-    for size in pkt_size:
-        file = BENCH_RESULT_DIR / "iperf" / name / mode / date / f"{size}.log"
-        with file.open("r") as f:
-            lines = f.readlines()
-
-        # example format:
-        # > [SUM]   0.00-10.00  sec  11.7 GBytes  10.1 Gbits/sec                  receiver
-        # find the line with [SUM] from the end
-        for line in reversed(lines):
-            if "[SUM]" in line:
-                break
-        else:
-            raise ValueError("No [SUM] line found")
-        th = float(line.split()[5])
-        if line.split()[6] == "Mbits/sec":
-            th /= 1000.0
-        ths.append(th)
+    files = [
+        iperf_log(BENCH_RESULT_DIR / "iperf" / name / mode / date, size)
+        for size in pkt_size
+    ]
+    ths = load_files(parse_iperf_log, files)
 
     df = pd.DataFrame({"name": lebel, "size": pkt_size, "throughput": ths})
     return df
 
 
+def read_iperf_json(file: Path) -> Dict[str, Any]:
+    """Return the report of an iperf3 JSON output, written with -J (one
+    document) or --json-stream (one event per line: start, interval, end)
+    """
+    with file.open("r") as f:
+        text = f.read()
+    if not text.startswith('{"event"'):
+        return json.loads(text)
+    report: Dict[str, Any] = {"intervals": []}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            # the run was interrupted while writing the line
+            print(f"[warn] {file}: truncated event")
+            break
+        if event["event"] == "interval":
+            report["intervals"].append(event["data"])
+        else:
+            report[event["event"]] = event["data"]
+    return report
+
+
+@cached()
+def parse_iperf_log(file: Path) -> float:
+    """Return the throughput (Gbps) of an iperf log"""
+    if file.suffix == ".json":
+        report = read_iperf_json(file)
+        if "end" not in report:
+            raise ValueError(f"No end report found: {report.get('error')}")
+        # the receiver side if reported, as the "[SUM] ... receiver" text line
+        end = report["end"]
+        return end.get("sum_received", end.get("sum"))["bits_per_second"] / 1e9
+
+    with file.open("r") as f:
+        lines = f.readlines()
+
+    # example format:
+    # > [SUM]   0.00-10.00  sec  11.7 GBytes  10.1 Gbits/sec                  receiver
+    # find the line with [SUM] from the end
+    for line in reversed(lines):
+        if "[SUM]" in line:
+            break
+    else:
+        raise ValueError("No [SUM] line found")
+    th = float(line.split()[5])
+    if line.split()[6] == "Mbits/sec":
+        th /= 1000.0
+    return th
+
+
+@cached()
+def parse_iperf_intervals(file: Path) -> pd.DataFrame:
+    """Return the per-interval throughput (Gbps) of every stream and of their
+    sum (stream "sum") of an iperf3 JSON output
+    """
+    rows = []
+    for interval in read_iperf_json(file)["intervals"]:
+        streams = [(str(s["socket"]), s) for s in interval["streams"]]
+        for stream, s in [*streams, ("sum", interval["sum"])]:
+            rows.append(
+                {
+                    "stream": stream,
+                    "start": s["start"],
+                    "end": s["end"],
+                    "throughput": s["bits_per_second"] / 1e9,
+                    "bytes": s["bytes"],
+                    # TCP only
+                    "retransmits": s.get("retransmits", np.nan),
+                    # UDP only
+                    "lost_percent": s.get("lost_percent", np.nan),
+                    "omitted": s.get("omitted", False),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
 # bench mark path:
 # ./bench-result/network/iperf/{name}/{date}
 def parse_iperf_result(
@@ -99,6 +165,20 @@ def parse_iperf_result(
     else:
         raise ValueError(f"Invalid mode: {mode}")
 
+    data = results.load("iperf", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[(data["name"] == name) & (data["mode"] == mode)]
+        dates = sorted(data["date"].unique())[-max_num:] if date is None else [date]
+        sizes = {str(size): size for size in pktsize}
+        data = data[data["date"].isin(dates) & data["pkt"].isin(sizes)]
+        return pd.DataFrame(
+            {
+                "name": label,
+                "size": data["pkt"].map(sizes),
+                "throughput": data["throughput"],
+            }
+        )
+
     dates = []
     if date is None:
         # use the latest date
@@ -106,12 +186,16 @@ def parse_iperf_result(
     else:
         dates.append(date)
 
-    dfs = []
-    for date in dates:
-        df = parse_iperf_result_sub(name, mode, date, label, pktsize)
-        dfs.append(df)
-
-    df = pd.concat(dfs)
+    # load all dates and packet sizes at once
+    files = [
+        iperf_log(BENCH_RESULT_DIR / "iperf" / name / mode / date, size)
+        for date in dates
+        for size in pktsize
+    ]
+    ths = load_files(parse_iperf_log, files)
+    df = pd.DataFrame(
+        {"name": label, "size": pktsize * len(dates), "throughput": ths}
+    )
 
     return df
 
@@ -126,6 +210,22 @@ def parse_ping_result(name: str, label: str, date=None, all=False) -> pd.DataFra
     pktsize_ = []
     lats = []
 
+    data = results.load("ping", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[data["name"] == name]
+        if date is None:
+            # use the latest date
+            date = sorted(data["date"].unique())[-1]
+        print(f"date: {date}")
+        data = data[(data["date"] == date) & data["pkt"].isin([str(s) for s in pktsize_actual])]
+        return pd.DataFrame(
+            {
+                "name": label,
+                "size": data["pkt"].astype(int),
+                "latency": data["latency"],
+            }
+        )
+
     if date is None:
         # use the latest date
         date = sorted(os.listdir(BENCH_RESULT_DIR / "ping" / name))[-1]
@@ -137,20 +237,7 @@ def parse_ping_result(name: str, label: str, date=None, all=False) -> pd.DataFra
         if not path.exists():
             print(f"XXX: {path} not found!")
             continue
-        with path.open("r") as f:
-            lines = f.readlines()
-
-        # example format:
-        # > 128 bytes from 172.44.0.2: icmp_seq=1 ttl=64 time=0.131 ms
-        # > 128 bytes from 172.44.0.2: icmp_seq=2 ttl=64 time=0.221 ms
-        # > 128 bytes from 172.44.0.2: icmp_seq=3 ttl=64 time=0.212 ms
-        # > 128 bytes from 172.44.0.2: icmp_seq=4 ttl=64 time=0.200 ms
-        lats_ = []
-        for line in lines:
-            if "icmp_seq" in line:
-                lats_.append(float(line.split()[6].split("=")[1]))
-        # drop firt 3 pings to get stable result
-        lats_ = lats_[3:]
+        lats_ = parse_ping_log(path)
         lats.extend(lats_)
         pktsize_.extend([size] * len(lats_))
 
@@ -158,6 +245,26 @@ def parse_ping_result(name: str, label: str, date=None, all=False) -> pd.DataFra
     return df
 
 
+@cached()
+def parse_ping_log(path: Path) -> List[float]:
+    """Return the latencies (ms) of a ping log"""
+    with path.open("r") as f:
+        lines = f.readlines()
+
+    # example format:
+    # > 128 bytes from 172.44.0.2: icmp_seq=1 ttl=64 time=0.131 ms
+    # > 128 bytes from 172.44.0.2: icmp_seq=2 ttl=64 time=0.221 ms
+    # > 128 bytes from 172.44.0.2: icmp_seq=3 ttl=64 time=0.212 ms
+    # > 128 bytes from 172.44.0.2: icmp_seq=4 ttl=64 time=0.200 ms
+    lats = []
+    for line in lines:
+        if "icmp_seq" in line:
+            lats.append(float(line.split()[6].split("=")[1]))
+    # drop firt 3 pings to get stable result
+    return lats[3:]
+
+
+@cached()
 def parse_memtier_result_sub(
     path: str, label: str, server: str, tls: bool = False
 ) -> pd.DataFrame:
@@ -201,6 +308,34 @@ def parse_memtier_result_sub(
 def parse_memtier_result(
     name: str, label: str, server: str, date=None, date_tls=None, max_num: int = 10
 ) -> pd.DataFrame:
+    data = results.load("memtier", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[data["name"] == name]
+        plain = data[data["server"] == server]
+        tls = data[data["server"] == f"{server}-tls"]
+        dates = sorted(plain["date"].unique())[-max_num:] if date is None else [date]
+        if date_tls is None:
+            date_tls = sorted(tls["date"].unique())[-1]
+        dfs = []
+        for date in dates:
+            for df, suffix in [
+                (plain[plain["date"] == date], ""),
+                (tls[tls["date"] == date_tls], " (tls)"),
+            ]:
+                # GET/SET (tls) labels as in parse_memtier_result_sub()
+                dfs.append(
+                    pd.DataFrame(
+                        {
+                            "name": label,
+                            "workload": df["workload"].str.replace(" (tls)", "")
+                            + suffix,
+                            "throughput": df["throughput"],
+                            "server": server,
+                        }
+                    )
+                )
+        return pd.concat(dfs)
+
     dates = []
 
     if date is None:
@@ -241,6 +376,67 @@ def parse_memtier_result(
     return df
 
 
+# percentiles recorded by network.run_memtier_sweep()
+MEMTIER_SWEEP_PERCENTILES = ["p50", "p90", "p99", "p99.9", "p99.99"]
+
+
+@cached()
+def parse_memtier_sweep_step(file: Path) -> pd.DataFrame:
+    """Return the throughput (ops/s) and latencies (ms) of a step of a memtier
+    rate sweep (memtier.json) with its offered load ("percent" of the peak and
+    "target" ops/s from sweep.json; NaN for the peak step)
+    """
+    with open(file) as f:
+        all_stats = json.load(f)["ALL STATS"]
+    percent = target = np.nan
+    sweep_file = file.parent.parent / "sweep.json"
+    if file.parent.name.startswith("rate-") and sweep_file.exists():
+        percent = int(file.parent.name.removeprefix("rate-"))
+        with open(sweep_file) as f:
+            steps = json.load(f)["steps"]
+        target = next(s["target"] for s in steps if s["percent"] == percent)
+    rows = []
+    for workload in ["Sets", "Gets", "Totals"]:
+        stats = all_stats[workload]
+        percentiles = stats.get("Percentile Latencies", {})
+        row = {
+            "workload": workload.upper().removesuffix("S"),
+            "percent": percent,
+            "target": target,
+            "throughput": stats["Ops/sec"],
+            "latency": stats.get("Average Latency", stats.get("Latency", np.nan)),
+        }
+        for p in MEMTIER_SWEEP_PERCENTILES:
+            row[p] = percentiles.get(f"p{float(p[1:]):.2f}", np.nan)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# bench mark path:
+# ./bench-result/network/memtier-sweep/{server}[-tls]/{name}/{date}/{step}/memtier.json
+def parse_memtier_sweep(name: str, label: str, server: str, date=None) -> pd.DataFrame:
+    """Return the steps of the latest (or the given) rate sweep"""
+    data = results.load("memtier_sweep", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[(data["name"] == name) & (data["server"] == server)]
+        if date is None:
+            date = sorted(data["date"].unique())[-1]
+        data = data[data["date"] == date]
+        columns = ["step", "workload", "percent", "target", "throughput", "latency"]
+        columns += MEMTIER_SWEEP_PERCENTILES
+        return data[columns].assign(name=label).reset_index(drop=True)
+
+    rundir = BENCH_RESULT_DIR / "memtier-sweep" / server / name
+    if date is None:
+        date = sorted(os.listdir(rundir))[-1]
+    dfs = []
+    for file in sorted((rundir / date).glob("*/memtier.json")):
+        df = parse_memtier_sweep_step(file)
+        dfs.append(df.assign(step=file.parent.name, name=label))
+    return pd.concat(dfs, ignore_index=True)
+
+
+@cached()
 def parse_nginx_result_sub(path: str, name: str, workload: str) -> pd.DataFrame:
     """
         Example output:
@@ -268,6 +464,25 @@ def parse_nginx_result_sub(path: str, name: str, workload: str) -> pd.DataFrame:
 def parse_nginx_result(
     name: str, label: str, date=None, max_num: int = 10
 ) -> pd.DataFrame:
+    data = results.load("nginx", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[data["name"] == name]
+        dates = sorted(data["date"].unique())[-max_num:] if date is None else [date]
+        dfs = []
+        for date in dates:
+            for workload in ["http", "https"]:
+                df = data[(data["date"] == date) & (data["workload"] == workload)]
+                dfs.append(
+                    pd.DataFrame(
+                        {
+                            "name": label,
+                            "workload": workload,
+                            "throughput": df["throughput"],
+                        }
+                    )
+                )
+        return pd.concat(dfs)
+
     dates = []
     if date is None:
         dates = sorted(os.listdir(BENCH_RESULT_DIR / "nginx" / name))[-max_num:]
@@ -291,6 +506,218 @@ def parse_nginx_result(
     return df
 
 
+# latency percentiles of wrk --latency (wrk2: corrected for coordinated omission)
+WRK_PERCENTILES = ["p50", "p75", "p90", "p99", "p99.9", "p99.99", "p99.999", "p100"]
+WRK_UNITS = {"us": 1e-3, "ms": 1.0, "s": 1e3, "m": 60e3}
+
+
+def wrk_latency_ms(value: str) -> float:
+    """Convert a latency of wrk (e.g., 1.23ms, 456.78us) to ms"""
+    match = re.fullmatch(r"([\d.]+)(us|ms|s|m)", value)
+    if match is None:
+        raise ValueError(f"Unknown latency: {value}")
+    return float(match.group(1)) * WRK_UNITS[match.group(2)]
+
+
+@cached()
+def parse_wrk_latency(file: Path) -> pd.DataFrame:
+    """Return the throughput (requests/s) and the latency distribution (ms) of
+    a wrk or wrk2 output (one row; NaN percentiles without --latency)
+
+        Example output of wrk2 --latency:
+    ```
+      Thread Stats   Avg      Stdev     Max   +/- Stdev
+        Latency     1.23ms  456.78us   5.67ms   70.00%
+        Req/Sec     1.23k   100.00     2.00k    80.00%
+      Latency Distribution (HdrHistogram - Recorded Latency)
+     50.000%    1.20ms
+     ...
+    100.000%    5.67ms
+    ...
+    Requests/sec:  12000.00
+    ```
+    """
+    row = {"throughput": np.nan, "latency": np.nan}
+    row.update({p: np.nan for p in WRK_PERCENTILES})
+    with open(file) as f:
+        for line in f:
+            fields = line.split()
+            if line.startswith("Requests/sec:"):
+                row["throughput"] = float(fields[1])
+            elif fields[:1] == ["Latency"] and len(fields) == 5:
+                row["latency"] = wrk_latency_ms(fields[1])
+            elif len(fields) == 2 and re.fullmatch(r"[\d.]+%", fields[0]):
+                p = f"p{float(fields[0][:-1]):g}"
+                if p in row:
+                    row[p] = wrk_latency_ms(fields[1])
+    return pd.DataFrame([row])
+
+
+def parse_wrk_spectrum(file: Path) -> pd.DataFrame:
+    """Return the detailed percentile spectrum of a wrk2 --latency output:
+    latency (ms), percentile (0-1) and count (requests <= latency)
+    """
+    rows = []
+    with open(file) as f:
+        in_spectrum = False
+        for line in f:
+            if "Detailed Percentile spectrum" in line:
+                in_spectrum = True
+            elif in_spectrum and line.startswith("#["):
+                break
+            elif in_spectrum:
+                fields = line.split()
+                if len(fields) == 4 and not fields[0].isalpha():
+                    rows.append(
+                        {
+                            "latency": float(fields[0]),
+                            "percentile": float(fields[1]),
+                            "count": int(fields[2]),
+                        }
+                    )
+    return pd.DataFrame(rows, columns=["latency", "percentile", "count"])
+
+
+def parse_nginx_sweep_step(file: Path) -> pd.DataFrame:
+    """Return parse_wrk_latency() of a step of an nginx sweep with its offered
+    load ("percent" of the peak and "target" requests/s; NaN for the peak)
+    """
+    df = parse_wrk_latency(file)
+    percent = target = np.nan
+    sweep_file = file.parents[2] / "sweep.json"
+    if file.stem.startswith("rate-") and sweep_file.exists():
+        percent = int(file.stem.removeprefix("rate-"))
+        with open(sweep_file) as f:
+            sweep = json.load(f)[f"{file.parents[1].name}/{file.parent.name}"]
+        target = sweep["rates"][str(percent)]
+    return df.assign(percent=percent, target=target)
+
+
+# bench mark path:
+# ./bench-result/network/nginx-sweep/{name}/{date}/{scheme}/{size}/{step}.log
+def parse_nginx_sweep(name: str, label: str, date=None) -> pd.DataFrame:
+    """Return the steps of the latest (or the given) nginx sweep"""
+    data = results.load("nginx_sweep", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[data["name"] == name]
+        if date is None:
+            date = sorted(data["date"].unique())[-1]
+        data = data[data["date"] == date]
+        columns = ["scheme", "size", "step", "percent", "target", "throughput"]
+        columns += ["latency", *WRK_PERCENTILES]
+        return data[columns].assign(name=label).reset_index(drop=True)
+
+    rundir = BENCH_RESULT_DIR / "nginx-sweep" / name
+    if date is None:
+        date = sorted(os.listdir(rundir))[-1]
+    dfs = []
+    for file in sorted((rundir / date).glob("*/*/*.log")):
+        df = parse_nginx_sweep_step(file).assign(
+            scheme=file.parents[1].name, size=file.parent.name, step=file.stem
+        )
+        dfs.append(df.assign(name=label))
+    return pd.concat(dfs, ignore_index=True)
+
+
+def parse_s_time(file: Path) -> pd.DataFrame:
+    """Return the handshake rate (handshakes/s over all clients) and the mean
+    handshake latency (ms, including the TCP connection) of the outputs of
+    parallel `openssl s_time` clients (see network.run_tls_handshake)
+
+        Example output of a client:
+    ```
+    Collecting connection statistics for 30 seconds
+    ****************************************************************
+    2345 connections in 21.40s; 109.58 connections/user sec, bytes read 0
+    2345 connections in 31 real seconds, 0 bytes read per connection
+    ```
+    """
+    connections = []
+    seconds = []
+    with open(file) as f:
+        for line in f:
+            match = re.match(r"(\d+) connections in (\d+) real seconds", line)
+            if match:
+                connections.append(int(match.group(1)))
+                seconds.append(int(match.group(2)))
+    rate = sum(c / s for c, s in zip(connections, seconds) if s > 0)
+    latency = np.mean([s / c * 1e3 for c, s in zip(connections, seconds) if c > 0])
+    return pd.DataFrame(
+        {
+            "clients": [len(connections)],
+            "connections": [sum(connections)],
+            "rate": [rate],
+            "latency": [latency],
+        }
+    )
+
+
+def parse_vmexit_counts(file: Path) -> pd.DataFrame:
+    """Return the VM exit counts of scripts/trace/*_kvm_vmexit_count.bt:
+    "REASON: count" lines; indented lines are VMGEXITs (SEV-ES/SNP)
+    """
+    rows = []
+    with open(file) as f:
+        for line in f:
+            match = re.fullmatch(r"(\s*)(\S[^:]*): (\d+)", line.rstrip("\n"))
+            if match:
+                rows.append(
+                    {
+                        "reason": match.group(2),
+                        "count": int(match.group(3)),
+                        "vmgexit": bool(match.group(1)),
+                    }
+                )
+    return pd.DataFrame(rows, columns=["reason", "count", "vmgexit"])
+
+
+def parse_tls_handshake(file: Path) -> pd.DataFrame:
+    """Return parse_s_time() of a run of network.run_tls_handshake with its
+    server, key type and session (new, reuse) and the VM exits per handshake
+    (from {run}.vmexit, if any)
+    """
+    df = parse_s_time(file)
+    server, rest = file.stem.split("-", 1)
+    key_type, session = rest.rsplit("-", 1)
+    exits = vmgexits = np.nan
+    vmexit_file = file.with_suffix(".vmexit")
+    if vmexit_file.exists():
+        counts = parse_vmexit_counts(vmexit_file)
+        exits = counts[~counts["vmgexit"]]["count"].sum()
+        vmgexits = counts[counts["vmgexit"]]["count"].sum()
+    connections = df["connections"].iloc[0]
+    return df.assign(
+        server=server,
+        key_type=key_type,
+        session=session,
+        exits=exits,
+        vmgexits=vmgexits,
+        exits_per_handshake=exits / connections if connections else np.nan,
+    )
+
+
+# bench mark path:
+# ./bench-result/network/tls-handshake/{name}/{date}/{server}-{key_type}-{session}.log
+def parse_tls_handshake_result(name: str, label: str, date=None) -> pd.DataFrame:
+    """Return the runs of the latest (or the given) TLS handshake benchmark"""
+    data = results.load("tls_handshake", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[data["name"] == name]
+        if date is None:
+            date = sorted(data["date"].unique())[-1]
+        data = data[data["date"] == date]
+        columns = ["date", "server", "key_type", "session", "clients"]
+        columns += ["connections", "rate", "latency", "exits", "vmgexits"]
+        columns += ["exits_per_handshake"]
+        return data[columns].assign(name=label).reset_index(drop=True)
+
+    rundir = BENCH_RESULT_DIR / "tls-handshake" / name
+    if date is None:
+        date = sorted(os.listdir(rundir))[-1]
+    dfs = [parse_tls_handshake(file) for file in sorted((rundir / date).glob("*.log"))]
+    return pd.concat(dfs, ignore_index=True).assign(date=date, name=label)
+
+
 @task
 def plot_iperf(
     ctx,
@@ -489,6 +916,122 @@ def plot_iperf(
     print(f"Plot saved in {save_path}")
 
 
+# bench mark path:
+# ./bench-result/network/iperf/{name}/{mode}/{date}/{pkt}.json
+def parse_iperf_timeseries(
+    name: str, label: str, mode: str, pkt: Union[int, str], date=None
+) -> pd.DataFrame:
+    """Return the per-second throughput of every stream (and their sum) of
+    the latest (or the given) run
+    """
+    data = results.load("iperf_intervals", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[
+            (data["name"] == name) & (data["mode"] == mode) & (data["pkt"] == str(pkt))
+        ]
+        if date is None:
+            date = sorted(data["date"].unique())[-1]
+        data = data[data["date"] == date]
+        columns = ["stream", "start", "end", "throughput", "retransmits", "lost_percent"]
+        return data[columns].assign(name=label).reset_index(drop=True)
+
+    if date is None:
+        date = sorted(os.listdir(BENCH_RESULT_DIR / "iperf" / name / mode))[-1]
+    file = BENCH_RESULT_DIR / "iperf" / name / mode / date / f"{pkt}.json"
+    return parse_iperf_intervals(file).assign(name=label)
+
+
+# examples:
+# inv network.plot-iperf-timeseries --mode udp --pkt 1460
+# inv network.plot-iperf-timeseries --mode tcp --pkt 128K --vhost --streams
+@task
+def plot_iperf_timeseries(
+    ctx,
+    cvm="snp",
+    mode="udp",
+    pkt=None,  # default: 1460 (udp), 128K (tcp)
+    vhost=False,
+    mq=False,
+    swiotlb=False,
+    streams=False,  # also plot the throughput of every stream
+    size="medium",
+    outdir="plot",
+    result_dir=None,
+):
+    """Plot the throughput of iperf over time (ramp-up, steady state, collapse)"""
+    if result_dir is not None:
+        global BENCH_RESULT_DIR
+        BENCH_RESULT_DIR = Path(result_dir)
+    if pkt is None:
+        pkt = 1460 if mode == "udp" else "128K"
+    if cvm == "snp":
+        vm = "amd"
+        cvm_label = "snp"
+    else:
+        vm = "intel"
+        cvm_label = "td"
+
+    suffix = ""
+    if vhost:
+        suffix += "-vhost"
+    if mq:
+        suffix += "-mq"
+    vm_name = f"{vm}-direct-{size}{suffix}"
+    if swiotlb:
+        vm_name += "-swiotlb"
+    df = pd.concat(
+        [
+            parse_iperf_timeseries(vm_name, "vm", mode, pkt),
+            parse_iperf_timeseries(f"{cvm}-direct-{size}{suffix}", cvm_label, mode, pkt),
+        ]
+    )
+    summary = df[df["stream"] == "sum"].groupby("name")["throughput"]
+    print(summary.describe())
+
+    fig, ax = plt.subplots(figsize=(figwidth_half, 1.8))
+    for label, color in [("vm", vm_col), (cvm_label, cvm_col)]:
+        data = df[df["name"] == label]
+        total = data[data["stream"] == "sum"]
+        ax.plot(
+            total["end"],
+            total["throughput"],
+            color=color,
+            marker="o",
+            markersize=1.5,
+            linewidth=1,
+            label=label,
+        )
+        if streams:
+            for _, stream in data[data["stream"] != "sum"].groupby("stream"):
+                ax.plot(
+                    stream["end"],
+                    stream["throughput"],
+                    color=color,
+                    linewidth=0.3,
+                    alpha=0.6,
+                )
+    ax.set_xlabel("Time [s]")
+    ax.set_ylabel("Throughput [Gbps]")
+    ax.set_ylim(bottom=0)
+    ax.set_title("Higher is better ↑", fontsize=FONTSIZE, color="navy")
+    ax.legend(fontsize=5)
+
+    sns.despine(top = True)
+    plt.tight_layout()
+
+    outname = f"iperf_{mode}_{pkt}{suffix.replace('-', '_')}"
+    if swiotlb:
+        outname += "_swiotlb"
+    outname += "_timeseries"
+    if streams:
+        outname += "_streams"
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    save_path = outdir / f"{outname}.pdf"
+    plt.savefig(save_path, bbox_inches="tight")
+    print(f"Plot saved in {save_path}")
+
+
 @task
 def plot_ping(
     ctx,
@@ -880,6 +1423,91 @@ def plot_memcached(
     print(f"Plot saved in {save_path}")
 
 
+# examples:
+# inv network.plot-memtier-knee
+# inv network.plot-memtier-knee --server memcached --percentile p99.9 --mq
+@task
+def plot_memtier_knee(
+    ctx,
+    cvm="snp",
+    server="redis",  # redis, memcached
+    tls=False,
+    percentile="p99",  # see MEMTIER_SWEEP_PERCENTILES, or "latency" (average)
+    mq=False,
+    size="medium",
+    outdir="plot",
+    result_dir=None,
+):
+    """Plot the latency vs. the achieved throughput of a memtier rate sweep
+    (see network.run_memtier_sweep) for VM and CVM with and without vhost
+    """
+    if result_dir is not None:
+        global BENCH_RESULT_DIR
+        BENCH_RESULT_DIR = Path(result_dir)
+    if cvm == "snp":
+        vm = "amd"
+        cvm_label = "snp"
+    else:
+        vm = "intel"
+        cvm_label = "td"
+
+    def get_name(name, vhost=False):
+        n = f"{name}-direct-{size}"
+        if vhost:
+            n += "-vhost"
+        if mq:
+            n += "-mq"
+        return n
+
+    server_dir = f"{server}-tls" if tls else server
+    variants = [
+        (get_name(vm), "vm", vm_col, "o"),
+        (get_name(vm, vhost=True), "vhost", vhost_col, "s"),
+        (get_name(cvm), cvm_label, cvm_col, "^"),
+        (get_name(cvm, vhost=True), f"{cvm_label}-vhost", cvm_vhost_col, "v"),
+    ]
+
+    fig, ax = plt.subplots(figsize=(figwidth_half, 2.0))
+    for name, label, color, marker in variants:
+        try:
+            df = parse_memtier_sweep(name, label, server_dir)
+        except (FileNotFoundError, IndexError):
+            print(f"no sweep of {name}")
+            continue
+        df = df[(df["workload"] == "TOTAL") & (df["step"] != "peak")]
+        df = df.sort_values("percent")
+        print(label)
+        print(df[["percent", "target", "throughput", "latency", percentile]])
+        ax.plot(
+            df["throughput"] / 1e6,
+            df[percentile],
+            color=color,
+            marker=marker,
+            markersize=2.5,
+            markeredgecolor="black",
+            markeredgewidth=0.3,
+            linewidth=1,
+            label=label,
+        )
+    ax.set_xlabel("Throughput [Mops/s]")
+    ax.set_ylabel(f"{percentile} latency [ms]")
+    ax.set_yscale("log")
+    ax.set_title("Lower is better ↓", fontsize=FONTSIZE, color="navy")
+    ax.legend(fontsize=5)
+
+    sns.despine(top = True)
+    plt.tight_layout()
+
+    outname = f"{server}{'_tls' if tls else ''}_knee_{percentile}"
+    if mq:
+        outname += "_mq"
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    save_path = outdir / f"{outname}.pdf"
+    plt.savefig(save_path, bbox_inches="tight")
+    print(f"Plot saved in {save_path}")
+
+
 @task
 def plot_nginx(
     ctx,
@@ -990,3 +1618,216 @@ def plot_nginx(
     save_path = outdir / outname
     plt.savefig(save_path, bbox_inches="tight")
     print(f"Plot saved in {save_path}")
+
+
+# examples:
+# inv network.plot-nginx-latency
+# inv network.plot-nginx-latency --percentile p99.9 --vhost
+@task
+def plot_nginx_latency(
+    ctx,
+    cvm="snp",
+    percentile="p99",  # see WRK_PERCENTILES, or "latency" (average)
+    vhost=False,
+    mq=False,
+    size="medium",
+    outdir="plot",
+    result_dir=None,
+):
+    """Plot the latency vs. the achieved request rate of an nginx sweep (see
+    network.run_nginx_sweep) over HTTP and HTTPS for every response size,
+    and print the latency ratios that separate the cost of TLS from the cost
+    of the (virtio-net) I/O path of the CVM
+    """
+    if result_dir is not None:
+        global BENCH_RESULT_DIR
+        BENCH_RESULT_DIR = Path(result_dir)
+    if cvm == "snp":
+        vm = "amd"
+        cvm_label = "snp"
+    else:
+        vm = "intel"
+        cvm_label = "td"
+
+    suffix = ""
+    if vhost:
+        suffix += "-vhost"
+    if mq:
+        suffix += "-mq"
+    df = pd.concat(
+        [
+            parse_nginx_sweep(f"{vm}-direct-{size}{suffix}", "vm"),
+            parse_nginx_sweep(f"{cvm}-direct-{size}{suffix}", cvm_label),
+        ]
+    )
+    steps = df[df["step"] != "peak"]
+
+    # cvm/vm on http: I/O path; https/http: TLS (and whether the CVM adds to it)
+    lat = steps.pivot_table(
+        index=["size", "percent"], columns=["name", "scheme"], values=percentile
+    )
+    ratios = pd.DataFrame(
+        {
+            f"{cvm_label}/vm http": lat[(cvm_label, "http")] / lat[("vm", "http")],
+            "vm https/http": lat[("vm", "https")] / lat[("vm", "http")],
+            f"{cvm_label} https/http": lat[(cvm_label, "https")]
+            / lat[(cvm_label, "http")],
+        }
+    )
+    ratios[f"{cvm_label} tls / vm tls"] = (
+        ratios[f"{cvm_label} https/http"] / ratios["vm https/http"]
+    )
+    print(f"{percentile} latency ratios")
+    print(ratios.to_string(float_format="%.3f"))
+    peaks = df[df["step"] == "peak"].pivot_table(
+        index="size", columns=["name", "scheme"], values="throughput"
+    )
+    print("peak requests/s")
+    print(peaks.to_string(float_format="%.0f"))
+
+    sizes = [s for s in ["1K", "16K", "128K", "1M"] if s in set(steps["size"])]
+    fig, axes = plt.subplots(1, len(sizes), figsize=(figwidth_full, 1.8), squeeze=False)
+    for ax, response_size in zip(axes[0], sizes):
+        for label, color in [("vm", vm_col), (cvm_label, cvm_col)]:
+            for scheme, linestyle in [("http", "-"), ("https", "--")]:
+                data = steps[
+                    (steps["name"] == label)
+                    & (steps["scheme"] == scheme)
+                    & (steps["size"] == response_size)
+                ].sort_values("percent")
+                ax.plot(
+                    data["throughput"] / 1e3,
+                    data[percentile],
+                    color=color,
+                    linestyle=linestyle,
+                    marker="o",
+                    markersize=2,
+                    linewidth=1,
+                    label=f"{label} ({scheme})",
+                )
+        ax.set_title(response_size, fontsize=FONTSIZE)
+        ax.set_xlabel("Requests/s [k]")
+        ax.set_yscale("log")
+    axes[0][0].set_ylabel(f"{percentile} latency [ms]")
+    axes[0][-1].legend(fontsize=5)
+    fig.suptitle("Lower is better ↓", fontsize=FONTSIZE, color="navy")
+
+    sns.despine(top = True)
+    plt.tight_layout()
+
+    outname = f"nginx_latency_{percentile}{suffix.replace('-', '_')}"
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    save_path = outdir / f"{outname}.pdf"
+    plt.savefig(save_path, bbox_inches="tight")
+    print(f"Plot saved in {save_path}")
+
+
+# examples:
+# inv network.plot-tls-handshake
+# inv network.plot-tls-handshake --server redis --vhost
+@task
+def plot_tls_handshake(
+    ctx,
+    cvm="snp",
+    server="nginx",  # nginx, redis
+    vhost=False,
+    mq=False,
+    size="medium",
+    top=5,  # number of the most frequent exit reasons to show
+    outdir="plot",
+    result_dir=None,
+):
+    """Plot the TLS handshake rate for every server key type with and without
+    session resumption (see network.run_tls_handshake), and print the
+    latency and the VM exits per handshake
+    """
+    if result_dir is not None:
+        global BENCH_RESULT_DIR
+        BENCH_RESULT_DIR = Path(result_dir)
+    if cvm == "snp":
+        vm = "amd"
+        cvm_label = "snp"
+    else:
+        vm = "intel"
+        cvm_label = "td"
+
+    suffix = ""
+    if vhost:
+        suffix += "-vhost"
+    if mq:
+        suffix += "-mq"
+    names = {
+        "vm": f"{vm}-direct-{size}{suffix}",
+        cvm_label: f"{cvm}-direct-{size}{suffix}",
+    }
+    df = pd.concat(
+        [parse_tls_handshake_result(name, label) for label, name in names.items()]
+    )
+    df = df[df["server"] == server]
+    columns = ["rate", "latency", "exits_per_handshake"]
+    table = df.pivot_table(
+        index=["key_type", "session"], columns="name", values=columns
+    )
+    print(table.to_string(float_format="%.2f"))
+    relative = table["rate"][cvm_label] / table["rate"]["vm"]
+    print(f"handshake rate {cvm_label}/vm")
+    print(relative.to_string(float_format="%.3f"))
+
+    # the most frequent exit reasons (per handshake) of full handshakes
+    for label, name in names.items():
+        for _, run in df[(df["name"] == label) & (df["session"] == "new")].iterrows():
+            file = (
+                BENCH_RESULT_DIR
+                / "tls-handshake"
+                / name
+                / run["date"]
+                / f"{server}-{run['key_type']}-new.vmexit"
+            )
+            if not file.exists():
+                continue
+            counts = parse_vmexit_counts(file).nlargest(top, "count")
+            counts["per_handshake"] = counts["count"] / run["connections"]
+            print(f"{label} {run['key_type']}: top exit reasons")
+            print(counts.to_string(index=False, float_format="%.2f"))
+
+    key_types = [
+        k for k in ["rsa2048", "rsa4096", "ecdsa-p256"] if k in set(df["key_type"])
+    ]
+    fig, ax = plt.subplots(figsize=(figwidth_half, 2.0))
+    bars = [
+        ("vm", "new", vm_col, ""),
+        (cvm_label, "new", cvm_col, "//"),
+        ("vm", "reuse", vm_col, "."),
+        (cvm_label, "reuse", cvm_col, "x"),
+    ]
+    width = 0.8 / len(bars)
+    x = np.arange(len(key_types))
+    for i, (label, session, color, hatch) in enumerate(bars):
+        data = df[(df["name"] == label) & (df["session"] == session)]
+        rates = data.set_index("key_type")["rate"].reindex(key_types)
+        ax.bar(
+            x + (i - (len(bars) - 1) / 2) * width,
+            rates / 1e3,
+            width,
+            color=color,
+            hatch=hatch,
+            edgecolor="black",
+            linewidth=0.5,
+            label=f"{label} ({session})",
+        )
+    ax.set_xticks(x)
+    ax.set_xticklabels(key_types)
+    ax.set_ylabel("Handshakes/s [k]")
+    ax.set_title("Higher is better ↑", fontsize=FONTSIZE, color="navy")
+    ax.legend(fontsize=5)
+
+    sns.despine(top = True)
+    plt.tight_layout()
+
+    outname = f"tls_handshake_{server}{suffix.replace('-', '_')}"
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    save_path = outdir / f"{outname}.pdf"
+    plt.savefig(save_path, bbox_inches="tight")
+    print(f"Plot saved in {save_path}")
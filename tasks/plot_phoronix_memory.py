@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import matplotlib as mpl  # type: ignore
 import matplotlib.pyplot as plt  # type: ignore
 import seaborn as sns  # type: ignore
 from typing import Any, Dict, List, Union
@@ -13,24 +12,10 @@ from pathlib import Path
 from invoke import task
 
 import phoronix
+import stats
 
 # common graph settings
-
-mpl.use("Agg")
-mpl.rcParams["text.latex.preamble"] = r"\usepackage{amsmath}"
-mpl.rcParams["pdf.fonttype"] = 42
-mpl.rcParams["ps.fonttype"] = 42
-mpl.rcParams["font.family"] = "libertine"
-
-sns.set_style("whitegrid")
-sns.set_style("ticks", {"xtick.major.size": 8, "ytick.major.size": 8})
-sns.set_context("paper", rc={"font.size": 5, "axes.titlesize": 5, "axes.labelsize": 8})
-
-# 3.3 inch for single column, 7 inch for double column
-figwidth_half = 3.3
-figwidth_full = 7
-
-FONTSIZE = 9
+from plot_common import figwidth_half
 
 palette = sns.color_palette("pastel")
 hatches = ["", "//"]
@@ -110,13 +95,26 @@ palette = [
 ]
 
 
-def load_data(vmfile: Path, cvmfile: Path) -> pd.DataFrame:
-    vm = phoronix.parse_xml(vmfile)
-    cvm = phoronix.parse_xml(cvmfile)
+def load_data(vmfile: Path, cvmfile: Path, trials: bool = False) -> pd.DataFrame:
+    """Return the relative values (CVM / VM) of each benchmark. With trials,
+    every trial of the CVM is compared with the mean of the VM and
+    "relative_std" is the standard deviation over the trials.
+    """
+    if trials:
+        vm = phoronix.parse_xml_trials(vmfile)
+        vm = vm.groupby("benchmark_id", as_index=False)["value"].mean()
+        cvm = phoronix.parse_xml_trials(cvmfile)
+    else:
+        vm = phoronix.parse_xml(vmfile)
+        cvm = phoronix.parse_xml(cvmfile)
 
     # merge two using identifier and benchmark_id as a key
-    data = pd.merge(vm, cvm, on="benchmark_id", suffixes=("_vm", f"_{cvm}"))
-    data["relative"] = data[f"value_{cvm}"] / data["value_vm"]
+    data = pd.merge(vm, cvm, on="benchmark_id", suffixes=("_vm", "_cvm"))
+    data["relative"] = data["value_cvm"] / data["value_vm"]
+    if trials:
+        data = data.groupby("benchmark_id", as_index=False)["relative"].agg(
+            relative="mean", relative_std="std"
+        )
 
     # drop rows if its benchmark_id is not in BENCHMARK_ID
     data = data[data["benchmark_id"].isin(BENCHMARK_ID)]
@@ -139,7 +137,8 @@ BENCH_RESULT_DIR = Path("./bench-result/phoronix")
 # ./bench-result/phoronix/{name}/memory/{date}
 def get_file(name: str, date=None):
     if date is None:
-        date = sorted(os.listdir(BENCH_RESULT_DIR / name / "memory"))[-1]
+        files = os.listdir(BENCH_RESULT_DIR / name / "memory")
+        date = sorted(f for f in files if f.endswith(".xml"))[-1]
     path = BENCH_RESULT_DIR / name / "memory" / date
     return path
 
@@ -153,6 +152,7 @@ def plot_phoronix_memory(
     name: str = "memory",
     tmebypass: bool = False,
     poll: bool = False,
+    trials: bool = False,  # use every trial (RawString), with error bars
     result_dir=None,
 ):
     if result_dir is not None:
@@ -177,7 +177,7 @@ def plot_phoronix_memory(
 
     vmfile = get_file(f"{vm}-direct-{size}{pvm}")
     cvmfile = get_file(f"{cvm}-direct-{size}{pcvm}")
-    data = load_data(vmfile, cvmfile)
+    data = load_data(vmfile, cvmfile, trials=trials)
 
     # print relative values
     print(data)
@@ -185,6 +185,19 @@ def plot_phoronix_memory(
     geomean = data["relative"].prod() ** (1 / len(data))
     print(f"geometric mean: {geomean}")
     print(f"overhead: {(1-geomean)*100}")
+    if trials:
+        vm_trials = phoronix.parse_xml_trials(vmfile)
+        cvm_trials = phoronix.parse_xml_trials(cvmfile)
+        pairs = [
+            (
+                cvm_trials[cvm_trials["benchmark_id"] == b]["value"],
+                vm_trials[vm_trials["benchmark_id"] == b]["value"],
+            )
+            for b in data["benchmark_id"]
+        ]
+        geomean_ci = stats.geomean_ratio(pairs)
+        print(f"geometric mean (CI over the trials): {geomean_ci}")
+        print(f"overhead: {geomean_ci.overhead(higher_is_better=True)}%")
 
     fig, ax = plt.subplots(figsize=(figwidth_half, 2.5))
     #fig, ax = plt.subplots()
@@ -195,7 +208,9 @@ def plot_phoronix_memory(
         color=palette,
         edgecolor="black",
         label=f"{cvm_label}",
-        linewidth=0.5
+        linewidth=0.5,
+        xerr=data["relative_std"] if trials else None,
+        error_kw=dict(elinewidth=0.5, capsize=1),
     )
 
     # draw a line at 1.0 to indicate the baseline
@@ -228,6 +243,6 @@ def plot_phoronix_memory(
 
     outdir = Path(outdir)
     outdir.mkdir(exist_ok=True, parents=True)
-    outpath = outdir / f"{name}_{size}{pvm}.pdf"
+    outpath = outdir / f"{name}_{size}{pvm}{'_trials' if trials else ''}.pdf"
     plt.savefig(outpath, format="pdf", pad_inches=0, bbox_inches="tight")
     print(f"save {outpath}")
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import matplotlib as mpl  # type: ignore
 import matplotlib.pyplot as plt  # type: ignore
 import seaborn as sns  # type: ignore
 from typing import Any, Dict, List, Union, Optional
@@ -14,24 +13,11 @@ from matplotlib.patches import Patch
 from invoke import task
 
 import phoronix
+import stats
+from loader import load_files
 
 # common graph settings
-
-mpl.use("Agg")
-mpl.rcParams["text.latex.preamble"] = r"\usepackage{amsmath}"
-mpl.rcParams["pdf.fonttype"] = 42
-mpl.rcParams["ps.fonttype"] = 42
-mpl.rcParams["font.family"] = "libertine"
-
-sns.set_style("whitegrid")
-sns.set_style("ticks", {"xtick.major.size": 8, "ytick.major.size": 8})
-sns.set_context("paper", rc={"font.size": 5, "axes.titlesize": 5, "axes.labelsize": 8})
-
-# 3.3 inch for single column, 7 inch for double column
-figwidth_half = 3.3
-figwidth_full = 7
-
-FONTSIZE = 9
+from plot_common import FONTSIZE, figwidth_half
 
 pastel = sns.color_palette("pastel")
 vm_col = pastel[0]
@@ -71,20 +57,26 @@ assert len(BENCHMARK_ID) == len(LABELS)
 BENCH_RESULT_DIR = Path("./bench-result/phoronix/")
 
 
-def parse_result(name: str, date: Optional[str] = None) -> pd.DataFrame:
+def parse_result(
+    name: str, date: Optional[str] = None, trials: bool = False
+) -> pd.DataFrame:
     if date is None:
-        date = sorted(os.listdir(BENCH_RESULT_DIR / name / "npb"))[-1]
+        files = os.listdir(BENCH_RESULT_DIR / name / "npb")
+        date = sorted(f for f in files if f.endswith(".xml"))[-1]
     path = BENCH_RESULT_DIR / name / "npb" / date
 
+    if trials:
+        # one row per trial
+        return phoronix.parse_xml_trials(path)
     df = phoronix.parse_xml(path)
     return df
 
 
 def load_data(
-    vm: str, cvm: str, rel=True, size="numa", pvm="", pcvm=""
+    vm: str, cvm: str, rel=True, size="numa", pvm="", pcvm="", trials=False
 ) -> pd.DataFrame:
-    vm_df = parse_result(f"{vm}-direct-{size}{pvm}")
-    cvm_df = parse_result(f"{cvm}-direct-{size}{pcvm}")
+    vm_df = parse_result(f"{vm}-direct-{size}{pvm}", trials=trials)
+    cvm_df = parse_result(f"{cvm}-direct-{size}{pcvm}", trials=trials)
 
     if not rel:
         df = pd.concat([vm_df, cvm_df])
@@ -179,6 +171,7 @@ def plot_npb(
     rel: bool = True,
     tmebypass: bool = False,
     poll: bool = False,
+    trials: bool = False,  # use every trial (RawString), with error bars
     result_dir=None,
 ):
     if result_dir is not None:
@@ -199,7 +192,7 @@ def plot_npb(
     if poll:
         pvm += "-poll"
         pcvm += "-poll"
-    df = load_data(vm, cvm, rel=False, size=size, pvm=pvm, pcvm=pcvm)
+    df = load_data(vm, cvm, rel=False, size=size, pvm=pvm, pcvm=pcvm, trials=trials)
     df["identifier"] = df["identifier"].map(
         {f"{vm}-direct-{size}{pvm}": vm_label, f"{cvm}-direct-{size}{pcvm}": cvm_label}
     )
@@ -227,15 +220,24 @@ def plot_npb(
 
     # calculat relative values for each benchmark
     # type vm is the baseline
-    vm_index = df[df["identifier"] == vm_label]["value"].values
-    cvm_index = df[df["identifier"] == cvm_label]["value"].values
+    # (the mean of the trials if trials is set)
+    means = df.groupby(["identifier", "benchmark_id"], sort=False)["value"].mean()
+    vm_index = means[vm_label].reindex(LABELS).values
+    cvm_index = means[cvm_label].reindex(LABELS).values
     relative = cvm_index / vm_index
     print(relative)
-    # geomean
-    geomean = np.exp(np.mean(np.log(relative)))
-    overhead = (1 - geomean) * 100
+    # geomean (with a CI over the trials if trials is set)
+    pairs = [
+        (
+            df[(df["identifier"] == cvm_label) & (df["benchmark_id"] == b)]["value"],
+            df[(df["identifier"] == vm_label) & (df["benchmark_id"] == b)]["value"],
+        )
+        for b in LABELS
+    ]
+    geomean = stats.geomean_ratio(pairs)
+    overhead = geomean.overhead(higher_is_better=True)
     print(f"Geometric mean of relative values: {geomean}")
-    print(f"Overhead: {overhead:.2f}%")
+    print(f"Overhead: {overhead}%")
 
     if rel:
         # plot rel using right axis
@@ -278,6 +280,8 @@ def plot_npb(
 
     outdir = Path(outdir)
     outdir.mkdir(parents=True, exist_ok=True)
+    if trials:
+        pvm += "_trials"
     if not rel:
         save_path = outdir / f"{outname}_{size}_norel{pvm}.pdf"
     else:
@@ -309,28 +313,32 @@ def get_wait_policy(file_name):
 def parse_experiment_results(root_dir, type=None):
     data = []
 
+    logs = []
     for root, dirs, files in os.walk(root_dir):
         for file in files:
             if file.endswith(".log"):
-                parts = file.split(".")
-                benchmark = parts[0]
-                size = parts[1]
-                wait_policy = get_wait_policy(file)
-                time = extract_time_from_log(os.path.join(root, file))
-
-                dir_parts = root.split(os.sep)
-                if type is None:
-                    type = dir_parts[-1]  # get the last part of the path
-
-                data.append(
-                    {
-                        "type": type,
-                        "benchmark": benchmark,
-                        "size": size,
-                        "wait_policy": wait_policy,
-                        "time": time,
-                    }
-                )
+                logs.append((root, file))
+    times = load_files(extract_time_from_log, [os.path.join(*log) for log in logs])
+
+    for (root, file), time in zip(logs, times):
+        parts = file.split(".")
+        benchmark = parts[0]
+        size = parts[1]
+        wait_policy = get_wait_policy(file)
+
+        dir_parts = root.split(os.sep)
+        if type is None:
+            type = dir_parts[-1]  # get the last part of the path
+
+        data.append(
+            {
+                "type": type,
+                "benchmark": benchmark,
+                "size": size,
+                "wait_policy": wait_policy,
+                "time": time,
+            }
+        )
 
     df = pd.DataFrame(data)
     return df
@@ -8,6 +8,10 @@ from pathlib import Path
 from typing import Any, Dict, List, Union
 
 from invoke import task
+
+import results
+from cache import cached
+from loader import load_files
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
@@ -15,22 +19,7 @@ import pandas as pd
 import seaborn as sns
 
 # common graph settings
-
-mpl.use("Agg")
-mpl.rcParams["text.latex.preamble"] = r"\usepackage{amsmath}"
-mpl.rcParams["pdf.fonttype"] = 42
-mpl.rcParams["ps.fonttype"] = 42
-mpl.rcParams["font.family"] = "libertine"
-
-sns.set_style("whitegrid")
-sns.set_style("ticks", {"xtick.major.size": 8, "ytick.major.size": 8})
-sns.set_context("paper", rc={"font.size": 5, "axes.titlesize": 5, "axes.labelsize": 8})
-
-# 3.3 inch for single column, 7 inch for double column
-figwidth_half = 3.3
-figwidth_full = 7
-
-FONTSIZE = 9
+from plot_common import FONTSIZE, figwidth_half
 
 pastel = sns.color_palette("pastel")
 vm_col = pastel[0]
@@ -41,23 +30,29 @@ palette = [vm_col, swiotlb_col, cvm_col]
 hatches = ["", "o", "//", "x", ""]
 
 
+@cached()
 def read_json(file):
-    lines = []
     with open(file) as f:
-        # ignore error massages if any
-        # (skip line until "{" is found)
-        for line in f:
-            if line.strip() == "{":
-                lines.append(line)
-                break
-            else:
-                print(f"[warn] skipping line: {line.strip()}")
-        for line in f:
-            lines.append(line)
-    data = json.loads("".join(lines))
+        text = f.read()
+    # ignore error massages if any
+    # (skip line until "{" is found)
+    start = 0 if text.startswith("{\n") else text.find("\n{\n") + 1
+    for line in text[:start].splitlines():
+        print(f"[warn] skipping line: {line.strip()}")
+    data, _ = json.JSONDecoder().raw_decode(text, start)
     return data
 
 
+# tail latency columns of process_data(): {read,write}_{p50,p99,p999,p9999}
+TAIL_PERCENTILES = {"p50": 50, "p99": 99, "p999": 99.9, "p9999": 99.99}
+
+
+def clat_percentile(job: dict, ddir: str, percentile: float) -> float:
+    """Return a completion latency percentile (ns) reported by fio, or NaN"""
+    percentiles = job[ddir].get("clat_ns", {}).get("percentile", {})
+    return float(percentiles.get(f"{percentile:f}", np.nan))
+
+
 def process_data(data, name):
     d = []
     for job in data["jobs"]:
@@ -78,6 +73,11 @@ def process_data(data, name):
                 float(job["write"]["lat_ns"]["mean"]),
                 float(job["write"]["lat_ns"]["stddev"]),
             ]
+            + [
+                clat_percentile(job, ddir, p)
+                for ddir in ["read", "write"]
+                for p in TAIL_PERCENTILES.values()
+            ]
         )
     columns = [
         "name",
@@ -94,32 +94,147 @@ def process_data(data, name):
         "write_bw_dev",
         "write_lat_mean",
         "write_lat_dev",
-    ]
+    ] + [f"{ddir}_{p}" for ddir in ["read", "write"] for p in TAIL_PERCENTILES]
     df = pd.DataFrame(d, columns=columns)
     return df
 
 
+# fio's completion latency histogram (see stat.h of fio): 29 groups of 64
+# buckets each; the bucket width doubles with each group
+FIO_IO_U_PLAT_BITS = 6
+FIO_IO_U_PLAT_VAL = 1 << FIO_IO_U_PLAT_BITS
+FIO_IO_U_PLAT_NR = 29 * FIO_IO_U_PLAT_VAL
+DDIRS = ["read", "write", "trim"]  # data direction of hist logs
+
+
+def plat_val_to_idx(val: int) -> int:
+    """Return the histogram bucket of a latency (ns), see plat_val_to_idx() in fio"""
+    msb = val.bit_length() - 1 if val > 0 else 0
+    if msb <= FIO_IO_U_PLAT_BITS:
+        return val
+    error_bits = msb - FIO_IO_U_PLAT_BITS
+    base = (error_bits + 1) << FIO_IO_U_PLAT_BITS
+    offset = (FIO_IO_U_PLAT_VAL - 1) & (val >> error_bits)
+    return min(base + offset, FIO_IO_U_PLAT_NR - 1)
+
+
+def plat_idx_to_val(idx: np.ndarray) -> np.ndarray:
+    """Return the latency (ns) that represents each bucket (its midpoint)"""
+    idx = np.asarray(idx, dtype=np.int64)
+    error_bits = np.maximum((idx >> FIO_IO_U_PLAT_BITS) - 1, 0)
+    base = 1 << (error_bits + FIO_IO_U_PLAT_BITS)
+    k = idx % FIO_IO_U_PLAT_VAL
+    val = base + (k + 0.5) * (1 << error_bits)
+    return np.where(idx < 2 * FIO_IO_U_PLAT_VAL, idx, val)
+
+
+# latency (ns) of each bucket
+CLAT_BUCKETS = plat_idx_to_val(np.arange(FIO_IO_U_PLAT_NR))
+
+
+def empty_hist() -> np.ndarray:
+    return np.zeros(FIO_IO_U_PLAT_NR, dtype=np.int64)
+
+
+@cached()
+def read_clat_hist(file: Path) -> Dict[str, Dict[str, np.ndarray]]:
+    """Return the clat histograms of a fio run as {jobname: {ddir: counts}}.
+
+    The histograms are taken from the json+ output (clat_ns.bins) or, for runs
+    without it, from the hist logs ({date}_clat_hist.{i}.log, written with
+    --write_hist_log) assuming that job i is the i-th job of the JSON output.
+    """
+    data = read_json(file)
+    hists: Dict[str, Dict[str, np.ndarray]] = {}
+    for i, job in enumerate(data["jobs"]):
+        hists[job["jobname"]] = {}
+        for ddir in DDIRS:
+            bins = job.get(ddir, {}).get("clat_ns", {}).get("bins")
+            if not bins:
+                continue
+            counts = empty_hist()
+            for val, count in bins.items():
+                counts[plat_val_to_idx(int(val))] += count
+            hists[job["jobname"]][ddir] = counts
+        log = Path(file).with_name(f"{Path(file).stem}_clat_hist.{i + 1}.log")
+        if len(hists[job["jobname"]]) < len(DDIRS) and log.exists():
+            for ddir, counts in read_hist_log(log).items():
+                hists[job["jobname"]].setdefault(ddir, counts)
+    return hists
+
+
+def read_hist_log(file: Path) -> Dict[str, np.ndarray]:
+    """Sum the per-interval histograms of a fio hist log per data direction.
+    Each line is "msec, ddir, bs, [offset,] bucket 0, ..., bucket 1855".
+    """
+    log = np.loadtxt(file, delimiter=",", dtype=np.int64, ndmin=2)
+    hists = {}
+    for d, ddir in enumerate(DDIRS):
+        rows = log[log[:, 1] == d]
+        if len(rows) > 0:
+            hists[ddir] = rows[:, -FIO_IO_U_PLAT_NR:].sum(axis=0)
+    return hists
+
+
+def load_clat_hist(
+    name: str, jobfile: str, jobname: str, ddir: str, date=None, max_num: int = 10
+) -> np.ndarray:
+    """Merge the clat histograms of the latest max_num runs (or of date)"""
+    if date is None:
+        files = sorted(
+            f
+            for f in os.listdir(BENCH_RESULT_DIR / name / jobfile)
+            if f.endswith(".json") and not f.endswith(".meta.json")
+        )[-max_num:]
+    else:
+        files = [f"{date}.json"]
+    files = [BENCH_RESULT_DIR / name / jobfile / f for f in files]
+    merged = empty_hist()
+    for hists in load_files(read_clat_hist, files, processes=True):
+        merged += hists.get(jobname, {}).get(ddir, 0)
+    return merged
+
+
+def hist_percentiles(counts: np.ndarray, percentiles: List[float]) -> np.ndarray:
+    """Return the latencies (ns) at the given percentiles of a histogram"""
+    cdf = np.cumsum(counts) / max(counts.sum(), 1)
+    idx = np.searchsorted(cdf, np.asarray(percentiles) / 100.0)
+    return CLAT_BUCKETS[np.minimum(idx, FIO_IO_U_PLAT_NR - 1)]
+
+
 BENCH_RESULT_DIR = Path("./bench-result/fio")
 
 
 def read_result(
     name: str, label: str, jobname: str, date=None, max_num: int = 10
 ) -> pd.DataFrame:
+    data = results.load("fio", BENCH_RESULT_DIR)
+    if data is not None:
+        data = data[(data["name"] == name) & (data["job"] == jobname)]
+        dates = sorted(data["date"].unique())[-max_num:] if date is None else [date]
+        data = data[data["date"].isin(dates)]
+        columns = process_data({"jobs": []}, label).columns
+        return data.assign(name=label)[columns]
+
     dates = []
     if date is None:
         # use the latest results
         # note: fio reports stddev
         dates = [
             Path(i).stem
-            for i in sorted(os.listdir(BENCH_RESULT_DIR / name / jobname))[-max_num:]
+            for i in sorted(
+                f
+                for f in os.listdir(BENCH_RESULT_DIR / name / jobname)
+                if f.endswith(".json") and not f.endswith(".meta.json")
+            )[-max_num:]
         ]
     else:
         dates.append(date)
 
+    files = [BENCH_RESULT_DIR / name / jobname / f"{date}.json" for date in dates]
     dfs = []
-    for date in dates:
-        file = BENCH_RESULT_DIR / name / jobname / f"{date}.json"
-        data = read_json(file)
+    # decoding fio's JSON output is CPU bound
+    for data in load_files(read_json, files, processes=True):
         df = process_data(data, label)
         dfs.append(df)
 
@@ -787,3 +902,92 @@ def analyze_fio(
 
     print(df[(df["jobname"] == "iops randwrite")]["write_iops_mean"])
     print(cdf[(cdf["jobname"] == "iops randwrite")]["write_iops_mean"])
+
+
+def plot_clat_cdf(
+    hists: Dict[str, np.ndarray], outdir: Path, outname: str, title: str
+) -> None:
+    """Plot the tail of completion latency CDFs (as 1 - CDF on a log scale so
+    that p99, p99.9 and p99.99 are equally spaced)"""
+    fig, ax = plt.subplots(figsize=(figwidth_half, 2.5))
+    for i, (label, counts) in enumerate(hists.items()):
+        total = counts.sum()
+        if total == 0:
+            print(f"[warn] no histogram for {label}")
+            continue
+        used = np.nonzero(counts)[0]
+        tail = 1.0 - np.cumsum(counts) / total
+        ax.step(
+            CLAT_BUCKETS[used] / 1000,
+            np.maximum(tail[used], 0.5 / total),
+            where="post",
+            label=label,
+            color=palette[i % len(palette)],
+        )
+        p = hist_percentiles(counts, list(TAIL_PERCENTILES.values()))
+        print(
+            f"{label}: "
+            + ", ".join(f"{k}={v / 1000:.1f}us" for k, v in zip(TAIL_PERCENTILES, p))
+        )
+
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_yticks([0.5, 1e-1, 1e-2, 1e-3, 1e-4])
+    ax.set_yticklabels(["p50", "p90", "p99", "p99.9", "p99.99"])
+    ax.set_ylim(bottom=1e-5)
+    plt.xlabel("Completion latency [us]")
+    plt.ylabel("Percentile")
+    plt.title(title, fontsize=FONTSIZE)
+    plt.legend(frameon=True)
+    sns.despine(top=True)
+    plt.tight_layout()
+    outfile = Path(outdir) / outname
+    plt.savefig(outfile, format="pdf", pad_inches=0, bbox_inches="tight")
+    print(f"saved to {outfile}")
+    plt.clf()
+
+
+# examples:
+# inv storage.plot-fio-clat-cdf
+# inv storage.plot-fio-clat-cdf --cvm tdx --job "alat randwrite" --ddir write
+@task
+def plot_fio_clat_cdf(
+    ctx: Any,
+    cvm="snp",
+    size="medium",
+    aio="native",
+    jobfile="libaio",
+    job="alat randread",  # job (section) of the job file
+    ddir="read",  # read, write or trim
+    outdir="plot",
+    device="nvme1n1",
+    swiotlb=True,
+    max_num=10,  # number of runs merged into a histogram
+    result_dir=None,
+):
+    """Plot tail latency CDFs of the merged fio clat histograms (VM, swiotlb, CVM)"""
+    if result_dir is not None:
+        global BENCH_RESULT_DIR
+        BENCH_RESULT_DIR = Path(result_dir)
+
+    if cvm == "snp":
+        vm, vm_label, cvm_label = "amd", "vm", "snp"
+    else:
+        vm, vm_label, cvm_label = "intel", "vm", "td"
+
+    names = {vm_label: f"{vm}-direct-{size}-{device}-{aio}"}
+    if swiotlb:
+        names["swiotlb"] = f"{vm}-direct-{size}-{device}-{aio}-swiotlb"
+    names[cvm_label] = f"{cvm}-direct-{size}-{device}-{aio}"
+
+    hists = {}
+    for label, name in names.items():
+        if not (BENCH_RESULT_DIR / name / jobfile).is_dir():
+            print(f"[warn] no results for {name}")
+            continue
+        hists[label] = load_clat_hist(name, jobfile, job, ddir, max_num=int(max_num))
+
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    outname = f"fio_clat_cdf_{device}_{job.replace(' ', '_')}_{ddir}.pdf"
+    plot_clat_cdf(hists, outdir, outname, f"{job} ({ddir})")
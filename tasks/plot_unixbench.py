@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import matplotlib as mpl  # type: ignore
 import matplotlib.pyplot as plt  # type: ignore
 import seaborn as sns  # type: ignore
 from typing import Any, Dict, List, Union, Optional
@@ -12,25 +11,12 @@ from pathlib import Path
 
 from invoke import task
 
+from cache import cached
+
 import phoronix
 
 # common graph settings
-
-mpl.use("Agg")
-mpl.rcParams["text.latex.preamble"] = r"\usepackage{amsmath}"
-mpl.rcParams["pdf.fonttype"] = 42
-mpl.rcParams["ps.fonttype"] = 42
-mpl.rcParams["font.family"] = "libertine"
-
-sns.set_style("whitegrid")
-sns.set_style("ticks", {"xtick.major.size": 8, "ytick.major.size": 8})
-sns.set_context("paper", rc={"font.size": 5, "axes.titlesize": 5, "axes.labelsize": 8})
-
-# 3.3 inch for single column, 7 inch for double column
-figwidth_half = 3.3
-figwidth_full = 7
-
-FONTSIZE = 9
+from plot_common import FONTSIZE, figwidth_half
 
 pastel = sns.color_palette("pastel")
 vm_col = pastel[0]
@@ -70,6 +56,7 @@ SHORT_NAME = [
     "Syscall",
 ]
 
+@cached()
 def parse_result_sub(path: Path, type: str) -> pd.DataFrame:
     # parse file
     with open(path, "r") as f:
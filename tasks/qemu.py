@@ -4,23 +4,45 @@
 # (c) 2021-2022 Jörg Thalheim
 # https://github.com/Mic92/vmsh/blob/358cd4b6ec7de0dcac05a12e32486ef30658018c/tests/qemu.py
 
+import asyncio
 import json
+import mmap
 import os
 import re
+import select
 import socket
 import subprocess
-import psutil
+import tempfile
 import time
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass
+from fnmatch import fnmatch
 from pathlib import Path
 from queue import Queue
 from shlex import quote
 from tempfile import TemporaryDirectory
-from typing import Any, Dict, Iterator, List, Text, Optional
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Text,
+    Optional,
+)
 
 from procs import ChildFd, pprint_cmd, run
 from config import PROJECT_ROOT
+from topology import (
+    PinPlan,
+    find_device_irqs,
+    find_vhost_workers,
+    plan_io_pinning,
+    plan_pinning,
+    set_irq_affinity,
+)
 
 
 class QmpSession:
@@ -74,6 +96,139 @@ class QmpSession:
         return self._result()
 
 
+class QmpEventStream:
+    """Async iterator over QMP events whose name matches one of `patterns`.
+
+    Patterns are shell-style wildcards (e.g., "BLOCK_JOB_*"). Events are
+    buffered from the moment the stream is created, so nothing is lost between
+    subscribing and starting to iterate. The iteration ends when the stream is
+    closed or the QMP connection goes away.
+    """
+
+    def __init__(self, session: "AsyncQmpSession", patterns: List[str]) -> None:
+        self.session = session
+        self.patterns = patterns
+        self.queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+
+    def matches(self, event: str) -> bool:
+        if not self.patterns:
+            return True
+        return any(fnmatch(event, p) for p in self.patterns)
+
+    def close(self) -> None:
+        if self in self.session.subscribers:
+            self.session.subscribers.remove(self)
+        self.queue.put_nowait(None)
+
+    def __aiter__(self) -> "QmpEventStream":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        event = await self.queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+class AsyncQmpSession:
+    """asyncio-based QMP client.
+
+    Unlike QmpSession, every command is tagged with an `id`, so several
+    commands can be in flight at the same time (e.g., with asyncio.gather), and
+    events are dispatched to subscribers (see subscribe()) in the background
+    instead of being queued up while waiting for a command result.
+    """
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.pending: Dict[int, "asyncio.Future[Dict[str, Any]]"] = {}
+        self.subscribers: List[QmpEventStream] = []
+        self.next_id = 0
+        self.dispatcher: Optional["asyncio.Task[None]"] = None
+
+    @classmethod
+    async def connect(cls, path: Path) -> "AsyncQmpSession":
+        reader, writer = await asyncio.open_unix_connection(str(path))
+        session = cls(reader, writer)
+        hello = json.loads(await reader.readline())
+        assert "QMP" in hello, f"Unexpected result: {hello}"
+        session.dispatcher = asyncio.create_task(session._dispatch())
+        await session.send("qmp_capabilities")
+        return session
+
+    async def _dispatch(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                if "event" in msg:
+                    for stream in list(self.subscribers):
+                        if stream.matches(msg["event"]):
+                            stream.queue.put_nowait(msg)
+                elif msg.get("id") in self.pending:
+                    future = self.pending.pop(msg["id"])
+                    if not future.done():
+                        future.set_result(msg)
+                else:
+                    m = json.dumps(msg, sort_keys=True, indent=4)
+                    print(f"Got unexpected qmp response: {m}")
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("qmp connection closed"))
+            self.pending.clear()
+            for stream in list(self.subscribers):
+                stream.close()
+
+    async def send(self, cmd: str, args: Dict[str, Any] = {}) -> Dict[str, Any]:
+        """
+        Send a Qmp command and wait for its result.
+        Other commands can be sent while this one is in flight.
+        """
+        self.next_id += 1
+        data: Dict[str, Any] = dict(execute=cmd, id=self.next_id)
+        if args != {}:
+            data["arguments"] = args
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        self.writer.write(json.dumps(data).encode() + b"\n")
+        await self.writer.drain()
+        res = await future
+        if "return" not in res:
+            m = json.dumps(res, sort_keys=True, indent=4)
+            raise RuntimeError(f"Got unexpected qmp response: {m}")
+        return res
+
+    def subscribe(self, *patterns: str) -> QmpEventStream:
+        """
+        Subscribe to events, e.g.:
+
+            async for event in session.subscribe("SHUTDOWN", "BLOCK_JOB_*"):
+                ...
+
+        Without patterns, all events are delivered.
+        """
+        stream = QmpEventStream(self, list(patterns))
+        self.subscribers.append(stream)
+        return stream
+
+    async def close(self) -> None:
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            try:
+                await self.dispatcher
+            except asyncio.CancelledError:
+                pass
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
 def is_port_open(ip: str, port: int, wait_response: bool = False) -> bool:
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
@@ -97,6 +252,53 @@ def connect_qmp(path: Path) -> Iterator[QmpSession]:
         sock.close()
 
 
+@asynccontextmanager
+async def connect_qmp_async(path: Path) -> AsyncIterator[AsyncQmpSession]:
+    session = await AsyncQmpSession.connect(path)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+def byte_entropy(
+    buf: Any, block_size: Optional[int] = None, chunk_size: int = 8 << 20
+) -> Any:
+    """Shannon entropy of bytes in bits per byte (8.0 for random data such as
+    ciphertext). buf is anything supporting the buffer protocol, e.g., the
+    memoryview of QemuVm.map_memory(). If block_size is given, return a numpy
+    array with the entropy of each block. The data is processed in chunks of
+    chunk_size bytes to bound memory usage.
+    """
+    import numpy as np
+
+    data = np.frombuffer(buf, dtype=np.uint8)
+
+    def entropy(counts: "np.ndarray") -> "np.ndarray":
+        total = counts.sum(axis=-1, keepdims=True)
+        p = counts / np.maximum(total, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(p > 0, -p * np.log2(p), 0.0).sum(axis=-1)
+
+    if block_size is None:
+        counts = np.zeros(256, dtype=np.int64)
+        for i in range(0, len(data), chunk_size):
+            counts += np.bincount(data[i : i + chunk_size], minlength=256)
+        return float(entropy(counts))
+
+    num_blocks = len(data) // block_size
+    chunk_blocks = max(1, chunk_size // block_size)
+    result = np.empty(num_blocks)
+    for b in range(0, num_blocks, chunk_blocks):
+        n = min(chunk_blocks, num_blocks - b)
+        blocks = data[b * block_size : (b + n) * block_size].reshape(n, block_size)
+        # count bytes of all blocks at once by giving each block its own 256 bins
+        idx = blocks + (np.arange(n, dtype=np.int64) * 256)[:, None]
+        counts = np.bincount(idx.ravel(), minlength=n * 256).reshape(n, 256)
+        result[b : b + n] = entropy(counts)
+    return result
+
+
 def parse_regs(qemu_output: str) -> Dict[str, int]:
     regs = {}
     for match in re.finditer(r"(\S+)\s*=\s*([0-9a-f ]+)", qemu_output):
@@ -119,10 +321,17 @@ def get_ssh_port(session: QmpSession) -> int:
     return ssh_port
 
 
-def ssh_cmd(port: int) -> List[str]:
+def ssh_cmd(port: int, control_path: Optional[Path] = None) -> List[str]:
+    """Return the ssh command line to log into the guest.
+
+    If `control_path` is given, the command multiplexes over an OpenSSH
+    ControlMaster socket at that path: the first successful connection becomes
+    the master (and stays in the background), and all subsequent commands reuse
+    its session instead of doing a full key exchange with the guest.
+    """
     key_path = PROJECT_ROOT.joinpath("nix", "ssh_key")
     key_path.chmod(0o400)
-    return [
+    cmd = [
         "ssh",
         "-i",
         str(key_path),
@@ -132,39 +341,129 @@ def ssh_cmd(port: int) -> List[str]:
         "-oStrictHostKeyChecking=no",
         "-oConnectTimeout=5",
         "-oUserKnownHostsFile=/dev/null",
-        "root@localhost",
+    ]
+    if control_path is not None:
+        cmd += [
+            "-oControlMaster=auto",
+            f"-oControlPath={control_path}",
+            "-oControlPersist=yes",
+        ]
+    cmd.append("root@localhost")
+    return cmd
+
+
+# name of the virtio-serial port the guest uses to announce readiness
+# (see guest-ready service in nix/guest-config.nix)
+READY_PORT_NAME = "org.cvm-eval.ready"
+
+
+def qemu_option_ready_channel(path: Path) -> List[str]:
+    """QEMU options for a virtio-serial port backed by a unix socket at `path`"""
+    return [
+        "-chardev",
+        f"socket,id=ready0,path={path},server=on,wait=off",
+        "-device",
+        "virtio-serial-pci,id=ready-serial",
+        "-device",
+        f"virtserialport,bus=ready-serial.0,chardev=ready0,name={READY_PORT_NAME}",
     ]
 
 
 class QemuVm:
     def __init__(
-        self, qmp_session: QmpSession, tmux_session: str, pid: int, config: dict = {}
+        self,
+        qmp_session: QmpSession,
+        tmux_session: Optional[str],
+        pid: int,
+        config: dict = {},
+        ssh_control_path: Optional[Path] = None,
+        ready_socket: Optional[socket.socket] = None,
+        qmp_async_socket: Optional[Path] = None,
     ) -> None:
         self.qmp_session = qmp_session
         self.tmux_session = tmux_session
         self.pid = pid
         self.ssh_port = get_ssh_port(qmp_session)
+        self.ssh_control_path = ssh_control_path
+        self.ready_socket = ready_socket
+        self.qmp_async_socket = qmp_async_socket
         self.config = config
+        self.pinning: Optional[PinPlan] = None
+        self.irq_affinity: Dict[int, str] = {}  # original affinities (see pin_io())
+        self.shutdown_method: Optional[str] = None  # how shutdown() stopped the VM
+        self.metadata: Dict[str, Any] = {}  # see metadata.run_metadata()
 
     def events(self) -> Iterator[Dict[str, Any]]:
         return self.qmp_session.events()
 
-    def wait_for_ssh(self) -> None:
+    def connect_qmp_async(self) -> "AsyncContextManager[AsyncQmpSession]":
+        """
+        Open an asyncio QMP session on the VM's second QMP monitor.
+        This can be used concurrently with the synchronous session, e.g.:
+
+            async with vm.connect_qmp_async() as qmp:
+                cpus, iothreads = await asyncio.gather(
+                    qmp.send("query-cpus-fast"), qmp.send("query-iothreads")
+                )
         """
-        Block until ssh port is accessible
+        assert self.qmp_async_socket is not None
+        return connect_qmp_async(self.qmp_async_socket)
+
+    def ssh_ok(self) -> bool:
+        """Return True if a trivial ssh command succeeds in the guest."""
+        proc = self.ssh_cmd(
+            ["echo", "ok"], check=False, stderr=subprocess.DEVNULL, verbose=False
+        )
+        return proc.returncode == 0
+
+    def wait_for_ready(self, timeout: float = 600, poll: float = 1.0) -> bool:
+        """
+        Block until the guest announces readiness on the ready channel, ssh
+        answers, or the timeout (in seconds) expires.
+        ssh is probed every `poll` seconds, so images without the guest-ready
+        unit are not slower than plain ssh polling.
+        @return: False if there is no ready channel or the guest did not come up
+        """
+        if self.ready_socket is None:
+            return False
+        deadline = time.monotonic() + timeout
+        received = b""
+        while b"READY" not in received:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select(
+                [self.ready_socket], [], [], min(poll, remaining)
+            )
+            if not readable:
+                if self.ssh_ok():
+                    print("ssh answered before the guest ready notification;")
+                    print(
+                        "if this repeats, rebuild the image with the guest-ready unit"
+                    )
+                    return True
+                continue
+            data = self.ready_socket.recv(64)
+            if not data:
+                # qemu closed the channel
+                return False
+            received += data
+        return True
+
+    def wait_for_ssh(self, timeout: float = 600) -> None:
+        """
+        Block until ssh port is accessible.
+        If the VM has a ready channel, wait for the guest to announce
+        readiness there (up to `timeout` seconds) while still probing ssh.
+        The first successful connection also opens the shared ssh master
+        connection (if multiplexing is enabled).
         """
+        if self.ready_socket is not None:
+            print("wait for guest ready")
+            if not self.wait_for_ready(timeout):
+                print("no ready notification from the guest, fall back to polling")
         print(f"wait for ssh on {self.ssh_port}")
-        while True:
-            if (
-                self.ssh_cmd(
-                    ["echo", "ok"],
-                    check=False,
-                    stderr=subprocess.DEVNULL,
-                    verbose=False,
-                ).returncode
-                == 0
-            ):
-                break
+        while not self.ssh_ok():
             time.sleep(0.1)
 
     def ssh_Popen(
@@ -176,7 +475,7 @@ class QemuVm:
         """
         opens a background process with an interactive ssh session
         """
-        cmd = ssh_cmd(self.ssh_port)
+        cmd = ssh_cmd(self.ssh_port, self.ssh_control_path)
         pprint_cmd(cmd)
         return subprocess.Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderr)
 
@@ -202,11 +501,25 @@ class QemuVm:
             # env_cmd.append("-")
             for k, v in extra_env.items():
                 env_cmd.append(f"{k}={v}")
-        cmd = ssh_cmd(self.ssh_port) + ["--"] + env_cmd + [" ".join(map(quote, argv))]
+        cmd = (
+            ssh_cmd(self.ssh_port, self.ssh_control_path)
+            + ["--"]
+            + env_cmd
+            + [" ".join(map(quote, argv))]
+        )
         return run(
             cmd, stdin=stdin, stdout=stdout, stderr=stderr, check=check, verbose=verbose
         )
 
+    def close_ssh_master(self) -> None:
+        """Stop the background ssh master connection (if any)"""
+        if self.ssh_control_path is None or not self.ssh_control_path.exists():
+            return
+        cmd = ssh_cmd(self.ssh_port, self.ssh_control_path)
+        # "-O exit" must come before the destination
+        cmd[-1:-1] = ["-O", "exit"]
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
     def regs(self) -> Dict[str, int]:
         """
         Get cpu register:
@@ -218,6 +531,9 @@ class QemuVm:
         return parse_regs(res["return"])
 
     def dump_physical_memory(self, addr: int, num_bytes: int) -> bytes:
+        if num_bytes > 4096:
+            with self.map_memory(addr, num_bytes) as mem:
+                return bytes(mem)
         res = self.send(
             "human-monitor-command",
             args={"command-line": f"xp/{num_bytes}bx 0x{addr:x}"},
@@ -227,10 +543,47 @@ class QemuVm:
         )
         return bytes.fromhex(hexval)
 
+    @contextmanager
+    def map_memory(
+        self, addr: int, num_bytes: int, cpu_index: Optional[int] = None
+    ) -> Iterator[memoryview]:
+        """Dump guest memory with QMP pmemsave (physical address) or memsave
+        (virtual address of vCPU cpu_index) to a tmpfs file and map it.
+        Use numpy.frombuffer(mem, dtype=numpy.uint8) for a zero-copy array.
+        The mapping is closed at the end of the with block, or, if such an
+        array is still referenced, when the array is garbage collected.
+        """
+        tmpdir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, path = tempfile.mkstemp(prefix="guest-mem-", dir=tmpdir)
+        try:
+            args = {"val": addr, "size": num_bytes, "filename": path}
+            if cpu_index is None:
+                self.send("pmemsave", args)
+            else:
+                args["cpu-index"] = cpu_index
+                self.send("memsave", args)
+            # the mapping keeps its own file descriptor
+            mm = mmap.mmap(fd, num_bytes, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+            os.unlink(path)
+        mem = memoryview(mm)
+        try:
+            yield mem
+        finally:
+            try:
+                mem.release()
+                mm.close()
+            except BufferError:
+                # exported to an array that is still alive; unmapped by the GC
+                pass
+
     def attach(self) -> None:
         """
         Attach to qemu session via tmux. This is useful for debugging
         """
+        if self.tmux_session is None:
+            raise RuntimeError("qemu is not running in tmux (config['tmux'])")
         subprocess.run(["tmux", "-L", self.tmux_session, "attach"])
 
     def send(self, cmd: str, args: Dict[str, str] = {}) -> Dict[str, str]:
@@ -239,49 +592,230 @@ class QemuVm:
         """
         return self.qmp_session.send(cmd, args)
 
-    def pin_vcpu(self, pcpu_base: int = 0) -> None:
-        """Pin vCPUs to physical CPUs"""
+    def pin_vcpu(self, pcpu_base: int = 0, policy: Optional[str] = None) -> PinPlan:
+        """Pin vCPUs, iothreads and the main loop to physical CPUs.
+        See topology.plan_pinning() for the policies. By default, the policy is
+        taken from the VM config ("pin_policy"), "linear" if not given.
+        """
+        if policy is None:
+            policy = self.config.get("pin_policy", "linear")
+        resource = self.config.get("resource")
+        numa_node = resource.numa_node if resource is not None else None
+
         cpu_info = self.send("query-cpus-fast")["return"]
-        num_cpus = len(cpu_info)
+        iothreads_info = self.send("query-iothreads")["return"]
+        plan = plan_pinning(
+            len(cpu_info), len(iothreads_info), numa_node, policy, pcpu_base
+        )
+        print(f"Pinning plan ({policy}): {plan}")
+        self.pinning = plan
+
         for cpu in cpu_info:
             tid = cpu["thread-id"]
             cpuidx = cpu["cpu-index"]
             try:
-                cmd = ["taskset", "-pc", str(cpuidx + pcpu_base), str(tid)]
+                cmd = ["taskset", "-pc", str(plan.vcpus[cpuidx]), str(tid)]
                 run(cmd)
             except subprocess.CalledProcessError as e:
                 print("Failed to pin vCPU{}: {}".format(cpuidx, e))
-                return
+                return plan
 
-        iothreads_info = self.send("query-iothreads")["return"]
-        num_iothreads = len(iothreads_info)
-        if num_iothreads == 0:
+        if len(iothreads_info) == 0:
             print("No iothreads found")
-            return
-        print("Pin iothreads")
-        for i, cpu in enumerate(iothreads_info):
-            tid = cpu["thread-id"]
+        else:
+            print("Pin iothreads")
+        for i, iothread in enumerate(iothreads_info):
+            tid = iothread["thread-id"]
             try:
-                cmd = ["taskset", "-pc", str(pcpu_base + num_cpus + i), str(tid)]
+                cmd = ["taskset", "-pc", str(plan.iothreads[i]), str(tid)]
                 run(cmd)
             except subprocess.CalledProcessError as e:
-                # FIXME: this can happen if pcpu_base + num_cpus + i is bigger than the number of available CPUs
-                print("Failed to pin vCPU{}: {}".format(cpuidx, e))
-                return
+                print("Failed to pin iothread {}: {}".format(iothread["id"], e))
+                return plan
 
-    def shutdown(self, timeout=10) -> None:
-        """Try graceful shutdown"""
+        if plan.main is not None:
+            print("Pin main loop")
+            try:
+                run(["taskset", "-pc", str(plan.main), str(self.pid)])
+            except subprocess.CalledProcessError as e:
+                print("Failed to pin main loop: {}".format(e))
+
+        return plan
+
+    def pin_io(self, devices: List[str], policy: str = "none") -> PinPlan:
+        """Pin the vhost workers of this VM and the host IRQs of devices
+        (block devices or network interfaces backing the VM's virtio devices).
+        Call this after the guest is up; vhost workers only exist once the
+        guest driver has started the device. The original IRQ affinities are
+        restored by restore_io_pinning().
+        """
+        if self.pinning is None:
+            raise RuntimeError("pin_vcpu() must be called before pin_io()")
+        resource = self.config.get("resource")
+        numa_node = resource.numa_node if resource is not None else None
+        vhost = find_vhost_workers(self.pid)
+        irqs = [irq for device in devices for irq in find_device_irqs(device)]
+        plan = plan_io_pinning(self.pinning, vhost, irqs, numa_node, policy)
+        if policy == "none":
+            return plan
+
+        print(f"Pin {len(plan.vhost)} vhost workers and {len(plan.irqs)} IRQs")
+        for tid, cpu in plan.vhost.items():
+            try:
+                run(["taskset", "-pc", str(cpu), str(tid)])
+            except subprocess.CalledProcessError as e:
+                print("Failed to pin vhost worker {}: {}".format(tid, e))
+        for irq, cpu in plan.irqs.items():
+            old = set_irq_affinity(irq, str(cpu))
+            if old is not None and irq not in self.irq_affinity:
+                self.irq_affinity[irq] = old
+        return plan
+
+    def restore_io_pinning(self) -> None:
+        """Restore the IRQ affinities changed by pin_io()"""
+        for irq, cpus in self.irq_affinity.items():
+            set_irq_affinity(irq, cpus)
+        self.irq_affinity = {}
+
+    def shutdown(self, timeout: Optional[float] = None) -> float:
+        """Shut down the VM and wait until the QEMU process has exited, i.e.,
+        until the guest memory is released. Try poweroff in the guest first,
+        then ACPI powerdown and finally quit, waiting up to timeout seconds
+        (config["shutdown_timeout"], 60 by default) for each of them.
+        Return the time it took.
+        """
+        if timeout is None:
+            timeout = self.config.get("shutdown_timeout", 60)
         print("shutdown vm")
-        try:
-            self.ssh_cmd(["poweroff"])
-        except subprocess.CalledProcessError:
-            print("ssh failed, the server might be already down")
-            return
-        count = 0
-        if count < timeout and psutil.pid_exists(self.pid):
-            time.sleep(1)
-            print(".")
-            count += 1
+        start = time.monotonic()
+
+        def poweroff() -> None:
+            try:
+                self.ssh_cmd(["poweroff"])
+            except subprocess.CalledProcessError:
+                print("ssh failed, the server might be already down")
+
+        for method, request in [
+            ("poweroff", poweroff),
+            ("system_powerdown", lambda: self.send("system_powerdown")),
+            ("quit", lambda: self.send("quit")),
+        ]:
+            try:
+                request()
+            except (OSError, ValueError) as e:
+                # qemu closes the QMP connection when it exits
+                print(f"{method}: {e}")
+            if wait_pid_exit(self.pid, timeout):
+                self.shutdown_method = method
+                break
+            print(f"{method} did not stop the VM within {timeout}s")
+        else:
+            self.shutdown_method = None
+
+        elapsed = time.monotonic() - start
+        print(f"vm stopped in {elapsed:.2f}s ({self.shutdown_method})")
+        return elapsed
+
+
+def wait_pid_exit(pid: int, timeout: Optional[float] = None) -> bool:
+    """Wait until the process exits using a pidfd (no polling).
+    Return False if the process is still alive after timeout seconds.
+    """
+    try:
+        pidfd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return True
+    try:
+        readable, _, _ = select.select([pidfd], [], [], timeout)
+        return len(readable) > 0
+    finally:
+        os.close(pidfd)
+
+
+@contextmanager
+def launch_tmux(cmd: List[str], qmp_socket: Path, tmux_session: str) -> Iterator[int]:
+    """Run qemu in a tmux session so that we can attach to the console and
+    kill qemu threads easily. Yield the pid of qemu.
+    """
+    tmux = [
+        "tmux",
+        "-L",
+        tmux_session,
+        "new-session",
+        "-d",
+        " ".join(map(quote, cmd)),
+    ]
+    print("$ " + " ".join(map(quote, tmux)))
+    subprocess.run(tmux, check=True)
+    qemu_pid = None
+    try:
+        proc = subprocess.run(
+            [
+                "tmux",
+                "-L",
+                tmux_session,
+                "list-panes",
+                "-a",
+                "-F",
+                "#{pane_pid}",
+            ],
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        qemu_pid = int(proc.stdout)
+        print(f"qemu pid: {qemu_pid}")
+        while not qmp_socket.exists():
+            try:
+                os.kill(qemu_pid, 0)
+                time.sleep(0.1)
+            except ProcessLookupError:
+                raise Exception("qemu vm was terminated")
+        yield qemu_pid
+    finally:
+        subprocess.run(["tmux", "-L", tmux_session, "kill-server"])
+        if qemu_pid is not None:
+            print("waiting for qemu to stop")
+            wait_pid_exit(qemu_pid)
+        print("qemu stopped")
+
+
+@contextmanager
+def launch_popen(
+    cmd: List[str], qmp_listener: socket.socket, log: Path
+) -> Iterator[int]:
+    """Run qemu as a child process. The QMP socket is already listening (qemu
+    gets its fd), so the QMP greeting can be read as soon as qemu is up without
+    waiting for the socket file to appear. Yield the pid of qemu.
+    """
+    print("$ " + " ".join(map(quote, cmd)))
+    with open(log, "w") as f:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=f,
+            stderr=subprocess.STDOUT,
+            pass_fds=(qmp_listener.fileno(),),
+        )
+    # only qemu holds the listening socket now; if qemu dies before accepting
+    # the connection, the QMP client gets an error instead of hanging
+    qmp_listener.close()
+    print(f"qemu pid: {proc.pid}")
+    try:
+        yield proc.pid
+    except Exception:
+        if wait_pid_exit(proc.pid, timeout=1):
+            proc.wait()
+            print(f"qemu exited with {proc.returncode}:")
+            print(log.read_text()[-4096:])
+        raise
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+            if not wait_pid_exit(proc.pid, timeout=10):
+                print("qemu did not terminate, kill it")
+                proc.kill()
+        proc.wait()
+        print("qemu stopped")
 
 
 @contextmanager
@@ -294,6 +828,15 @@ def spawn_qemu(
 ) -> Iterator[QemuVm]:
     with TemporaryDirectory() as tempdir:
         qmp_socket = Path(tempdir).joinpath("qmp.sock")
+        # second monitor for AsyncQmpSession
+        qmp_async_socket = Path(tempdir).joinpath("qmp-async.sock")
+        # shared by all ssh commands to the guest (see ssh_cmd())
+        ssh_control_path = Path(tempdir).joinpath("ssh.sock")
+        ready_channel: bool = config.get("ready_channel", False)
+        ready_path = Path(tempdir).joinpath("ready.sock")
+        # without tmux, the console output goes to a log file
+        use_tmux: bool = config.get("tmux", True)
+        tmux_session = f"pytest-{os.getpid()}"
         cmd = extra_args_pre.copy()
 
         if numa_node is not None:
@@ -303,60 +846,52 @@ def spawn_qemu(
                 f"--membind={','.join(map(str, numa_node))}",
             ]
 
-        qmp_command = [
-            "-qmp",
-            f"unix:{str(qmp_socket)},server,nowait",
-        ]
+        if use_tmux:
+            qmp_command = ["-qmp", f"unix:{str(qmp_socket)},server,nowait"]
+        else:
+            qmp_listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            qmp_listener.bind(str(qmp_socket))
+            qmp_listener.listen(1)
+            qmp_command = [
+                "-chardev",
+                f"socket,id=qmp0,fd={qmp_listener.fileno()},server=on,wait=off",
+                "-mon",
+                "chardev=qmp0,mode=control",
+            ]
+        qmp_command += ["-qmp", f"unix:{str(qmp_async_socket)},server,nowait"]
         cmd += qemu_command
         cmd += qmp_command
+        if ready_channel:
+            cmd += qemu_option_ready_channel(ready_path)
         cmd += extra_args
 
         print(cmd)
 
-        # run qemu in a tmux session so that we can kill qemu threads easily
-        tmux_session = f"pytest-{os.getpid()}"
-        tmux = [
-            "tmux",
-            "-L",
-            tmux_session,
-            "new-session",
-            "-d",
-            " ".join(map(quote, cmd)),
-        ]
-        print("$ " + " ".join(map(quote, tmux)))
-        subprocess.run(tmux, check=True)
-        try:
-            proc = subprocess.run(
-                [
-                    "tmux",
-                    "-L",
-                    tmux_session,
-                    "list-panes",
-                    "-a",
-                    "-F",
-                    "#{pane_pid}",
-                ],
-                stdout=subprocess.PIPE,
-                check=True,
-            )
-            qemu_pid = int(proc.stdout)
-            print(f"qemu pid: {qemu_pid}")
-            while not qmp_socket.exists():
-                try:
-                    os.kill(qemu_pid, 0)
-                    time.sleep(0.1)
-                except ProcessLookupError:
-                    raise Exception("qemu vm was terminated")
+        launcher: "ContextManager[int]"
+        if use_tmux:
+            launcher = launch_tmux(cmd, qmp_socket, tmux_session)
+        else:
+            launcher = launch_popen(cmd, qmp_listener, Path(tempdir) / "qemu.log")
+        with launcher as qemu_pid:
             with connect_qmp(qmp_socket) as session:
-                yield QemuVm(session, tmux_session, qemu_pid, config)
-        finally:
-            subprocess.run(["tmux", "-L", tmux_session, "kill-server"])
-            while True:
+                ready_socket = None
+                if ready_channel:
+                    # all chardevs exist once qmp is up
+                    ready_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    ready_socket.connect(str(ready_path))
+                vm = QemuVm(
+                    session,
+                    tmux_session if use_tmux else None,
+                    qemu_pid,
+                    config,
+                    ssh_control_path,
+                    ready_socket,
+                    qmp_async_socket,
+                )
                 try:
-                    os.kill(qemu_pid, 0)
-                except ProcessLookupError:
-                    break
-                else:
-                    print("waiting for qemu to stop")
-                    time.sleep(1)
-            print("qemu stopped")
+                    yield vm
+                finally:
+                    vm.restore_io_pinning()
+                    vm.close_ssh_master()
+                    if ready_socket is not None:
+                        ready_socket.close()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Ingest raw benchmark results under bench-result/ into a Parquet dataset.
+
+Every raw run (log, JSON or XML file) is parsed once and stored as rows in
+bench-result/dataset/benchmark={benchmark}/data.parquet together with the
+path components (e.g., date) and the configuration columns (type, boot, size,
+vhost, mq, swiotlb, aio, device, ...). The configuration is taken from the
+metadata sidecar of the run (see metadata.py) whose fields also become columns
+(config.*, resource.*, host_kernel, guest_kernel, cpu_model, ...); for older
+runs without a sidecar it is reconstructed from the run name. Ingestion is
+incremental: only new or changed files (by mtime) are parsed again.
+
+The loaders in the plot_* modules call load() and fall back to parsing the raw
+files if the dataset is not available.
+"""
+
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import json
+import re
+import shlex
+
+import pandas as pd
+
+from invoke import task
+
+from loader import load_files
+from metadata import is_sidecar, sidecar_path
+
+DATASET_DIR = Path("./bench-result/dataset")
+
+# bump when a parser changes to re-ingest all files of the benchmark
+PARSER_VERSION = 3
+
+
+@dataclass
+class Source:
+    benchmark: str
+    base_dir: Path  # default directory of the raw files
+    pattern: str  # glob pattern relative to base_dir
+    keys: List[Optional[str]]  # column names of the path components
+    parse: Callable[[Path], pd.DataFrame]  # module-level (see loader.load_files)
+    processes: bool = False  # parse in a process pool (CPU-bound decoding)
+
+
+def parse_iperf(path: Path) -> pd.DataFrame:
+    from plot_network import parse_iperf_log
+
+    return pd.DataFrame({"throughput": [parse_iperf_log(path)]})
+
+
+def parse_iperf_intervals(path: Path) -> pd.DataFrame:
+    from plot_network import parse_iperf_intervals
+
+    return parse_iperf_intervals(path)
+
+
+def parse_ping(path: Path) -> pd.DataFrame:
+    from plot_network import parse_ping_log
+
+    return pd.DataFrame({"latency": parse_ping_log(path)})
+
+
+def parse_memtier(path: Path) -> pd.DataFrame:
+    from plot_network import parse_memtier_result_sub
+
+    server = path.parent.parent.parent.name
+    tls = server.endswith("-tls")
+    df = parse_memtier_result_sub(path, "", server.removesuffix("-tls"), tls)
+    return df.drop(columns=["name", "server"])
+
+
+def parse_memtier_sweep(path: Path) -> pd.DataFrame:
+    from plot_network import parse_memtier_sweep_step
+
+    return parse_memtier_sweep_step(path)
+
+
+def parse_nginx(path: Path) -> pd.DataFrame:
+    from plot_network import parse_nginx_result_sub
+
+    df = parse_nginx_result_sub(path, "", path.stem)
+    return df.drop(columns=["name", "workload"])
+
+
+def parse_nginx_sweep(path: Path) -> pd.DataFrame:
+    from plot_network import parse_nginx_sweep_step
+
+    return parse_nginx_sweep_step(path)
+
+
+def parse_tls_handshake(path: Path) -> pd.DataFrame:
+    from plot_network import parse_tls_handshake
+
+    return parse_tls_handshake(path)
+
+
+def parse_fio(path: Path) -> pd.DataFrame:
+    from plot_storage import read_json, process_data
+
+    return process_data(read_json(path), "").drop(columns=["name"])
+
+
+def parse_app(app: str, path: Path) -> pd.DataFrame:
+    import plot_application
+
+    if app == "sqlite":
+        df = plot_application.parse_sqlite_result_sub("", path.stem, path)
+        return df.drop(columns=["name", "workload"])
+    parse_sub = getattr(plot_application, f"parse_{app}_result_sub")
+    return parse_sub("", path).drop(columns=["name"])
+
+
+def parse_mlc(path: Path) -> pd.DataFrame:
+    from memory import parse_mlc_result_sub
+
+    return parse_mlc_result_sub("", path).drop(columns=["name"])
+
+
+def parse_phoronix(path: Path) -> pd.DataFrame:
+    from phoronix import parse_xml
+
+    return parse_xml(path)
+
+
+SOURCES: Dict[str, Source] = {}
+for source in [
+    Source(
+        "iperf",
+        Path("./bench-result/network"),
+        "iperf/*/*/*/*",  # {pkt}.json, or {pkt}.log for older runs
+        [None, "name", "mode", "date", "pkt"],
+        parse_iperf,
+    ),
+    Source(
+        "iperf_intervals",
+        Path("./bench-result/network"),
+        "iperf/*/*/*/*.json",
+        [None, "name", "mode", "date", "pkt"],
+        parse_iperf_intervals,
+        processes=True,
+    ),
+    Source(
+        "ping",
+        Path("./bench-result/network"),
+        "ping/*/*/*.log",
+        [None, "name", "date", "pkt"],
+        parse_ping,
+    ),
+    Source(
+        "memtier",
+        Path("./bench-result/network"),
+        "memtier/*/*/*/memtier.log",
+        [None, "server", "name", "date", None],
+        parse_memtier,
+    ),
+    Source(
+        "memtier_sweep",
+        Path("./bench-result/network"),
+        "memtier-sweep/*/*/*/*/memtier.json",  # step: peak or rate-{percent}
+        [None, "server", "name", "date", "step", None],
+        parse_memtier_sweep,
+    ),
+    Source(
+        "nginx",
+        Path("./bench-result/network"),
+        "nginx/*/*/*.log",
+        [None, "name", "date", "workload"],
+        parse_nginx,
+    ),
+    Source(
+        "nginx_sweep",
+        Path("./bench-result/network"),
+        "nginx-sweep/*/*/*/*/*.log",  # step: peak or rate-{percent}
+        [None, "name", "date", "scheme", "size", "step"],
+        parse_nginx_sweep,
+    ),
+    Source(
+        "tls_handshake",
+        Path("./bench-result/network"),
+        "tls-handshake/*/*/*.log",  # {server}-{key_type}-{session}.log
+        [None, "name", "date", None],
+        parse_tls_handshake,
+    ),
+    Source(
+        "fio",
+        Path("./bench-result/fio"),
+        "*/*/*.json",
+        ["name", "job", "date"],  # "jobname" is the name of a job in the job file
+        parse_fio,
+        processes=True,
+    ),
+    *[
+        Source(
+            app,
+            Path("./bench-result/application"),
+            f"{app}/*/*/*.log",
+            [None, "name", "date", "file" if app != "sqlite" else "workload"],
+            partial(parse_app, app),
+        )
+        for app in ["blender", "pytorch", "tensorflow", "sqlite"]
+    ],
+    Source(
+        "mlc",
+        Path("./bench-result/memory/mlc"),
+        "*/*/mlc.log",
+        ["name", "date", None],
+        parse_mlc,
+    ),
+    Source(
+        "phoronix",
+        Path("./bench-result/phoronix"),
+        "*/*/*.xml",
+        ["name", "bench", "date"],
+        parse_phoronix,
+        processes=True,
+    ),
+]:
+    SOURCES[source.benchmark] = source
+
+
+def known_sizes() -> List[str]:
+    from vm import VMRESOURCES
+
+    sizes = set()
+    for host in VMRESOURCES.values():
+        sizes |= set(host.keys())
+    # longest first so that "xlarge" is not taken as "x" + "large"
+    return sorted(sizes, key=len, reverse=True)
+
+
+AIO = ["native", "threads", "io_uring"]
+DEVICE = re.compile(r"^(nvme\d+n\d+|sd[a-z]+|vd[a-z]+|pmem\d+|ram\d+)")
+
+
+def parse_name(name: str) -> Dict[str, Any]:
+    """Reconstruct the configuration from a run name, e.g.,
+    "snp-direct-mediumnvme1n1-native-nodirect" or "amd-direct-medium-poll-vhost-mq"
+    (see vm.py for how the names are built)
+    """
+    config: Dict[str, Any] = dict(
+        type=None,
+        boot=None,
+        size=None,
+        vhost=False,
+        mq=False,
+        swiotlb=False,
+        aio=None,
+        direct=True,
+        iothread=True,
+        device=None,
+        extra="",
+    )
+    m = re.match(r"^(.+?)-(direct|disk)-(.*)$", name)
+    if m is None:
+        config["extra"] = name
+        return config
+    config["type"], config["boot"], rest = m.groups()
+    for size in known_sizes():
+        if rest.startswith(size):
+            config["size"] = size
+            rest = rest[len(size) :]
+            break
+    extra = []
+    for token in rest.split("-"):
+        if token == "vhost":
+            config["vhost"] = True
+        elif token == "mq":
+            config["mq"] = True
+        elif token == "swiotlb":
+            config["swiotlb"] = True
+        elif token == "nodirect":
+            config["direct"] = False
+        elif token == "noiothread":
+            config["iothread"] = False
+        elif token in AIO:
+            config["aio"] = token
+        elif token:
+            d = DEVICE.match(token)
+            if d is not None and config["device"] is None:
+                config["device"] = d.group(1)
+                token = token[d.end() :]
+            if token:
+                extra.append(token)
+    config["extra"] = "-".join(extra)
+    return config
+
+
+def parse_metadata(path: Path) -> Dict[str, Any]:
+    """Flatten a run sidecar (see metadata.py) into columns, e.g.,
+    config.virtio_nic_vhost, resource.cpu, host_kernel, qemu_cmd
+    """
+    with open(path) as f:
+        meta = json.load(f)
+    columns: Dict[str, Any] = {}
+    for key, value in meta.items():
+        if key in ["name", "date"]:
+            # already taken from the path
+            continue
+        if key in ["config", "resource"] and isinstance(value, dict):
+            for k, v in value.items():
+                columns[f"{key}.{k}"] = (
+                    json.dumps(v) if isinstance(v, (list, dict)) else v
+                )
+        elif key == "qemu_cmd":
+            columns[key] = shlex.join(value)
+        elif isinstance(value, (list, dict)):
+            columns[key] = json.dumps(value)
+        else:
+            columns[key] = value
+    return columns
+
+
+def config_from_metadata(columns: Dict[str, Any]) -> Dict[str, Any]:
+    """Same as parse_name(), but from the columns of a run sidecar"""
+    config = {
+        k[len("config.") :]: v for k, v in columns.items() if k.startswith("config.")
+    }
+    blk = config.get("virtio_blk")
+    return dict(
+        type=config.get("type"),
+        boot="direct" if config.get("direct", True) else "disk",
+        size=config.get("size"),
+        vhost=bool(config.get("virtio_nic_vhost")),
+        mq=bool(config.get("virtio_nic_mq")),
+        swiotlb=bool(config.get("virtio_iommu"))
+        and "swiotlb" in (config.get("extra_cmdline") or ""),
+        aio=config.get("virtio_blk_aio") if blk else None,
+        direct=config.get("virtio_blk_direct", True),
+        iothread=config.get("virtio_blk_iothread", True),
+        device=Path(blk).name if blk else None,
+        extra=(config.get("name_extra") or "").lstrip("-"),
+    )
+
+
+def dataset_path(benchmark: str) -> Path:
+    return DATASET_DIR / f"benchmark={benchmark}" / "data.parquet"
+
+
+def ingest_benchmark(
+    benchmark: str, base_dir: Optional[Path] = None, verbose=True
+) -> pd.DataFrame:
+    """Parse new or changed raw files of a benchmark into the dataset and
+    return all rows of base_dir
+    """
+    source = SOURCES[benchmark]
+    if base_dir is None:
+        base_dir = source.base_dir
+    root = str(Path(base_dir).resolve())
+
+    path = dataset_path(benchmark)
+    if path.exists():
+        dataset = pd.read_parquet(path)
+    else:
+        dataset = pd.DataFrame({"root": [], "source": [], "mtime": []})
+    others = dataset[dataset["root"] != root]
+    current = dataset[dataset["root"] == root]
+    if "parser_version" in current.columns:
+        current = current[current["parser_version"] == PARSER_VERSION]
+    ingested = dict(zip(current["source"], current["mtime"]))
+
+    files = {}
+    for file in Path(base_dir).glob(source.pattern):
+        if not is_sidecar(file):
+            files[str(file.relative_to(base_dir))] = file.stat().st_mtime
+    keep = [s for s, mtime in files.items() if ingested.get(s) == mtime]
+    new = [s for s in sorted(files) if ingested.get(s) != files[s]]
+    removed = set(ingested) - set(files)
+    if not new and not removed:
+        return current
+
+    dfs = [current[current["source"].isin(keep)]]
+    parsed = load_files(
+        source.parse,
+        [Path(base_dir) / s for s in new],
+        processes=source.processes,
+        return_exceptions=True,
+    )
+    for s, df in zip(new, parsed):
+        file = Path(base_dir) / s
+        if isinstance(df, Exception):
+            print(f"[warn] failed to parse {file}: {df}")
+            continue
+        for key, value in zip(source.keys, Path(s).parts):
+            if key is not None:
+                df[key] = Path(value).stem if value == Path(s).name else value
+        config = {}
+        meta = sidecar_path(file)
+        if meta is not None:
+            config = parse_metadata(meta)
+            config.update(config_from_metadata(config))
+        elif "name" in df.columns and len(df) > 0:
+            config = parse_name(df["name"].iloc[0])
+        for k, v in config.items():
+            if k not in df.columns:
+                df[k] = v
+        df["root"] = root
+        df["source"] = s
+        df["mtime"] = files[s]
+        df["parser_version"] = PARSER_VERSION
+        dfs.append(df)
+    if verbose:
+        print(f"[results] {benchmark}: {len(new)} new, {len(removed)} removed files")
+
+    dfs = [d for d in dfs if len(d) > 0]
+    current = pd.concat(dfs, ignore_index=True) if dfs else dataset.iloc[0:0]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.concat([others, current], ignore_index=True).to_parquet(path, index=False)
+    return current
+
+
+_loaded: Dict[tuple, pd.DataFrame] = {}
+
+
+def load(benchmark: str, base_dir: Optional[Path] = None) -> Optional[pd.DataFrame]:
+    """Return all rows of a benchmark (ingesting new raw files first), or None
+    if the dataset cannot be used (e.g., pyarrow is missing)
+    """
+    key = (benchmark, str(base_dir))
+    if key not in _loaded:
+        try:
+            _loaded[key] = ingest_benchmark(benchmark, base_dir)
+        except ImportError as e:
+            print(f"[warn] result dataset not available: {e}")
+            return None
+    return _loaded[key]
+
+
+# examples:
+# inv results.ingest
+# inv results.ingest --benchmark fio
+@task
+def ingest(ctx: Any, benchmark: Optional[str] = None) -> None:
+    """Parse raw results into bench-result/dataset"""
+    for name in [benchmark] if benchmark else SOURCES:
+        df = ingest_benchmark(name)
+        print(f"{name}: {len(df)} rows")
+
+
+# inv results.show --benchmark iperf --query "type == 'snp' and vhost"
+@task
+def show(ctx: Any, benchmark: str, query: Optional[str] = None) -> None:
+    """Show the dataset of a benchmark, optionally filtered with a pandas query"""
+    df = load(benchmark)
+    if query:
+        df = df.query(query)
+    with pd.option_context("display.max_rows", 100, "display.width", 200):
+        print(df.drop(columns=["root", "mtime", "parser_version"]))
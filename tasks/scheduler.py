@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from dataclasses import dataclass, field
+from itertools import product
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import datetime
+import json
+import multiprocessing
+import os
+import socket
+import sys
+
+from invoke import Context, task
+
+from config import SSH_PORT
+from topology import parse_cpulist
+from vm import STANDALONE_ACTIONS, VMRESOURCES, VMResource, get_vm_resource
+
+# actions that need the whole host (boot time is sensitive to any other load,
+# prepare-* write to the VM image)
+EXCLUSIVE_ACTIONS = ["boottime", "prepare", "prepare-phoronix", "prepare-app"]
+# all network benchmarks talk to the same guest IP (VM_IP) over the host bridge
+# and pin their host-side clients to fixed CPUs, so only one can run at a time
+NETWORK_ACTIONS = [
+    "run-iperf",
+    "run-iperf-udp",
+    "run-memtier",
+    "run-memtier-memcached",
+    "run-memtier-sweep",
+    "run-memtier-memcached-sweep",
+    "run-nginx",
+    "run-nginx-sweep",
+    "run-ping",
+    "run-tls-handshake",
+]
+# memory bandwidth/latency benchmarks need their NUMA nodes for themselves
+MEMORY_ACTIONS = ["run-mlc", "run-phoronix"]
+
+
+@dataclass
+class Run:
+    type: str
+    size: str
+    action: str
+    flags: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def actions(self) -> List[str]:
+        return [a.strip() for a in self.action.split(",") if a.strip()]
+
+    @property
+    def exclusive(self) -> bool:
+        return any(a in EXCLUSIVE_ACTIONS or a in NETWORK_ACTIONS for a in self.actions)
+
+    @property
+    def memory_bound(self) -> bool:
+        return any(a in MEMORY_ACTIONS for a in self.actions)
+
+    def __str__(self) -> str:
+        return f"{self.type}-{self.size}:{self.action}"
+
+
+@dataclass
+class Slot:
+    """Host resources assigned to a running Run"""
+
+    run: Run
+    resource: VMResource
+    cpus: List[int]
+    ssh_port: int
+    guest_cid: int
+    exclusive: bool = False
+
+    @property
+    def numa_node(self) -> List[int]:
+        return self.resource.numa_node or [0]
+
+
+def read_host_nodes() -> Dict[int, List[int]]:
+    """Return the CPUs of each host NUMA node"""
+    nodes = {}
+    for node in sorted(Path("/sys/devices/system/node").glob("node[0-9]*")):
+        nodes[int(node.name[4:])] = parse_cpulist((node / "cpulist").read_text())
+    return nodes
+
+
+def read_host_node_memory() -> Dict[int, int]:
+    """Return the memory (GB) of each host NUMA node"""
+    memory = {}
+    for node in sorted(Path("/sys/devices/system/node").glob("node[0-9]*")):
+        for line in (node / "meminfo").read_text().splitlines():
+            # Node 0 MemTotal:       263842464 kB
+            if "MemTotal:" in line:
+                memory[int(node.name[4:])] = int(line.split()[3]) // (1024 * 1024)
+    return memory
+
+
+def port_is_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind(("", port))
+        except OSError:
+            return False
+    return True
+
+
+def load_matrix(path: Path) -> List[Run]:
+    """Load a run matrix.
+
+    The matrix is a JSON list of entries. type, size and action can be a single
+    value or a list; an entry expands to all combinations. flags are passed to
+    vm.start as is, e.g.:
+    [
+      {"type": ["amd", "snp"], "size": "medium",
+       "action": ["run-blender", "run-pytorch"], "flags": {"repeat": 3}},
+      {"type": "snp", "size": "small", "action": "run-fio",
+       "flags": {"virtio_blk": "/dev/nvme1n1", "fio_job": "libaio"}}
+    ]
+    """
+    runs = []
+    with open(path) as f:
+        matrix = json.load(f)
+    for entry in matrix:
+        axes = []
+        for key in ["type", "size", "action"]:
+            value = entry[key]
+            axes.append(value if isinstance(value, list) else [value])
+        for type, size, action in product(*axes):
+            runs.append(Run(type, size, action, dict(entry.get("flags", {}))))
+    return runs
+
+
+class Scheduler:
+    """Greedily place runs on disjoint host CPUs and NUMA nodes"""
+
+    def __init__(
+        self,
+        hostname: str,
+        reserved_cpus: List[int],
+        memory_ratio: float = 0.9,
+    ):
+        self.hostname = hostname
+        self.nodes = read_host_nodes()
+        self.node_memory = read_host_node_memory()
+        self.reserved_cpus = set(reserved_cpus)
+        self.memory_ratio = memory_ratio
+        self.slots: List[Slot] = []
+
+    def check(self, run: Run) -> None:
+        """Reject runs that cannot be scheduled at all"""
+        for action in run.actions:
+            if action in STANDALONE_ACTIONS and action != "boottime":
+                raise ValueError(f"{run}: interactive action {action}")
+        if run.flags.get("pin_policy", "linear") != "linear":
+            # the scheduler hands out consecutive CPUs from pin_base
+            raise ValueError(f"{run}: only the linear pinning policy is supported")
+        resource = get_vm_resource(self.hostname, run.size)
+        for node in resource.numa_node or [0]:
+            if node not in self.nodes:
+                raise ValueError(f"{run}: no NUMA node {node} on this host")
+        if len(self.cpus_for(resource, exclusive=True)) < num_host_cpus(run, resource):
+            raise ValueError(f"{run}: not enough CPUs on the NUMA node(s)")
+
+    def cpus_for(self, resource: VMResource, exclusive: bool) -> List[int]:
+        cpus = []
+        for node in resource.numa_node or [0]:
+            cpus += self.nodes[node]
+        if not exclusive:
+            cpus = [c for c in cpus if c not in self.reserved_cpus]
+        return sorted(cpus)
+
+    def conflicts(self, run: Run, resource: VMResource) -> Optional[str]:
+        """Return the reason why run cannot start now, if any"""
+        if any(slot.exclusive for slot in self.slots):
+            return "an exclusive run is running"
+        if run.exclusive and self.slots:
+            return "needs the whole host"
+        nodes = set(resource.numa_node or [0])
+        for slot in self.slots:
+            shared = nodes & set(slot.numa_node)
+            if shared and (run.memory_bound or slot.run.memory_bound):
+                return f"memory benchmark on NUMA node(s) {sorted(shared)}"
+            blk = run.flags.get("virtio_blk")
+            if blk is not None and blk == slot.run.flags.get("virtio_blk"):
+                return f"{blk} is in use"
+        for node in nodes if self.slots else []:
+            used = sum(
+                slot.resource.memory / len(slot.numa_node)
+                for slot in self.slots
+                if node in slot.numa_node
+            )
+            limit = self.node_memory.get(node, 0) * self.memory_ratio
+            if used + resource.memory / len(nodes) > limit:
+                return f"not enough memory on NUMA node {node}"
+        return None
+
+    def place(self, run: Run) -> Optional[Slot]:
+        """Try to assign host resources to run. Return None if it does not fit now."""
+        resource = get_vm_resource(self.hostname, run.size)
+        if self.conflicts(run, resource) is not None:
+            return None
+
+        # QemuVm.pin_vcpu() pins to consecutive CPUs starting from pin_base
+        n = num_host_cpus(run, resource)
+        used = set(c for slot in self.slots for c in slot.cpus)
+        candidates = self.cpus_for(resource, exclusive=False)
+        if run.exclusive or (len(candidates) < n and not self.slots):
+            # use the reserved CPUs only when running alone
+            candidates = self.cpus_for(resource, exclusive=True)
+        cpus = None
+        for i in range(len(candidates) - n + 1):
+            window = candidates[i : i + n]
+            if window[-1] - window[0] == n - 1 and not used & set(window):
+                cpus = window
+                break
+        if cpus is None:
+            return None
+
+        ports = set(slot.ssh_port for slot in self.slots)
+        ssh_port = SSH_PORT
+        while ssh_port in ports or not port_is_free(ssh_port):
+            ssh_port += 1
+        cids = set(slot.guest_cid for slot in self.slots)
+        guest_cid = 11
+        while guest_cid in cids:
+            guest_cid += 1
+
+        slot = Slot(run, resource, cpus, ssh_port, guest_cid, run.exclusive)
+        self.slots.append(slot)
+        return slot
+
+    def release(self, slot: Slot) -> None:
+        self.slots.remove(slot)
+
+
+def num_host_cpus(run: Run, resource: VMResource) -> int:
+    """Number of host CPUs pinned by a run (vCPUs + iothread)"""
+    n = resource.cpu
+    if run.flags.get("virtio_blk") and run.flags.get("virtio_blk_iothread", True):
+        n += 1
+    return n
+
+
+def start_kwargs(run: Run, slot: Slot) -> Dict[str, Any]:
+    kwargs = dict(run.flags)
+    kwargs.update(
+        type=run.type,
+        size=run.size,
+        action=run.action,
+        pin_base=slot.cpus[0],
+        ssh_port=slot.ssh_port,
+        guest_cid=slot.guest_cid,
+        # the VM image is shared by concurrent runs
+        overlay=not slot.exclusive,
+        # no one can answer the prompt
+        warn=False,
+    )
+    return kwargs
+
+
+def run_worker(kwargs: Dict[str, Any], log: Path) -> None:
+    """Entry point of a worker process: run vm.start with output going to log"""
+    fd = os.open(log, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    sys.stdout = os.fdopen(1, "w", buffering=1)
+    sys.stderr = os.fdopen(2, "w", buffering=1)
+
+    from vm import start
+
+    start(Context(), **kwargs)
+
+
+# examples:
+# inv scheduler.run --matrix experiment/schedule_app.json
+# inv scheduler.run --matrix experiment/schedule_app.json --dry-run
+@task
+def run(
+    ctx: Any,
+    matrix: str,
+    hostname: Optional[str] = None,  # by default use the local hostname
+    reserved_cpus: str = "0-3",  # host CPUs not used by VMs unless running alone
+    dry_run: bool = False,  # only show the placement of the first wave of runs
+) -> None:
+    """Run a matrix of VM benchmarks concurrently on non-overlapping host resources"""
+    if hostname is None:
+        hostname = socket.gethostname()
+    if hostname not in VMRESOURCES:
+        raise ValueError(f"Unknown host: {hostname}")
+
+    runs = load_matrix(Path(matrix))
+    scheduler = Scheduler(hostname, parse_cpulist(reserved_cpus))
+    for r in runs:
+        scheduler.check(r)
+
+    date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    logdir = Path(f"./bench-result/schedule/{date}")
+    if not dry_run:
+        logdir.mkdir(parents=True, exist_ok=True)
+
+    mp = multiprocessing.get_context("fork")
+    pending = list(runs)
+    running = {}  # sentinel -> (process, slot)
+    failed = []
+    count = 0
+    while pending or running:
+        for r in list(pending):
+            slot = scheduler.place(r)
+            if slot is None:
+                if r.exclusive:
+                    # do not let later runs overtake an exclusive run forever
+                    break
+                continue
+            pending.remove(r)
+            print(
+                f"[schedule] start {r}: cpus {slot.cpus[0]}-{slot.cpus[-1]}, "
+                f"ssh port {slot.ssh_port}, guest cid {slot.guest_cid}"
+            )
+            if dry_run:
+                continue
+            count += 1
+            log = logdir / f"{count:03d}-{r.type}-{r.size}-{r.action}.log"
+            p = mp.Process(target=run_worker, args=(start_kwargs(r, slot), log))
+            p.start()
+            running[p.sentinel] = (p, slot)
+
+        if dry_run:
+            for r in pending:
+                print(f"[schedule] wait  {r}")
+            return
+        if not running:
+            raise RuntimeError(f"cannot place {pending[0]}")
+
+        for sentinel in wait(list(running.keys())):
+            p, slot = running.pop(sentinel)
+            p.join()
+            scheduler.release(slot)
+            status = "done" if p.exitcode == 0 else f"failed ({p.exitcode})"
+            print(f"[schedule] {status} {slot.run}")
+            if p.exitcode != 0:
+                failed.append(slot.run)
+
+    print(f"[schedule] finished {len(runs)} runs, logs in {logdir}")
+    if failed:
+        print(f"[schedule] {len(failed)} runs failed: {', '.join(map(str, failed))}")
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Summary statistics of benchmark results with bootstrap confidence intervals.
+
+    vm = [10.1, 10.3, 9.9]   # e.g., runtimes of amd-direct-medium
+    cvm = [10.9, 11.2, 11.0]  # ... and of snp-direct-medium
+    r = ratio(cvm, vm)        # 1.092 [1.068, 1.117]
+    print(f"CVM/VM: {r}, overhead: {r.overhead()}%")
+
+The bootstrap resamples every configuration independently (N_BOOT times, in one
+vectorized draw) and the CI is the percentile interval of the replicates. The
+geometric mean of several ratios (e.g., over benchmarks or sizes) combines the
+replicates of its ratios, so its CI accounts for the noise of each of them.
+summarize() and overheads() do this per group of a results DataFrame (see
+results.py).
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import time
+
+import numpy as np
+import pandas as pd
+from invoke import task
+
+N_BOOT = 10000
+ALPHA = 0.05  # 95% confidence interval
+SEED = 0
+# Tukey's fences: outside [Q1 - k * IQR, Q3 + k * IQR]
+OUTLIER_K = 1.5
+
+# minimum number of runs before the CI is used to stop sampling
+MIN_ADAPTIVE_RUNS = 3
+# 0.975 quantiles of Student's t distribution by degrees of freedom (for the
+# 95% CI of the mean of a few runs, where the bootstrap CI is too narrow);
+# between two entries the smaller degrees of freedom (larger t) is used
+T_975 = {
+    1: 12.706,
+    2: 4.303,
+    3: 3.182,
+    4: 2.776,
+    5: 2.571,
+    6: 2.447,
+    7: 2.365,
+    8: 2.306,
+    9: 2.262,
+    10: 2.228,
+    11: 2.201,
+    12: 2.179,
+    13: 2.160,
+    14: 2.145,
+    15: 2.131,
+    16: 2.120,
+    17: 2.110,
+    18: 2.101,
+    19: 2.093,
+    20: 2.086,
+    25: 2.060,
+    30: 2.042,
+    40: 2.021,
+    60: 2.000,
+    120: 1.980,
+}
+
+STATS: Dict[str, Callable[..., np.ndarray]] = {
+    "mean": np.mean,
+    "median": np.median,
+}
+
+
+@dataclass
+class Estimate:
+    value: float
+    low: float
+    high: float
+
+    def overhead(self, higher_is_better: bool = False) -> "Estimate":
+        """Return the overhead of a ratio (CVM/VM) in percent"""
+        if higher_is_better:
+            return Estimate(
+                (1 - self.value) * 100, (1 - self.high) * 100, (1 - self.low) * 100
+            )
+        return Estimate(
+            (self.value - 1) * 100, (self.low - 1) * 100, (self.high - 1) * 100
+        )
+
+    def __str__(self) -> str:
+        return f"{self.value:.3f} [{self.low:.3f}, {self.high:.3f}]"
+
+
+def as_array(samples: Any) -> np.ndarray:
+    x = np.asarray(samples, dtype=float).ravel()
+    return x[~np.isnan(x)]
+
+
+def bootstrap(
+    samples: Any,
+    stat: str = "mean",
+    n_boot: int = N_BOOT,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Return n_boot bootstrap replicates of stat(samples)"""
+    x = as_array(samples)
+    if len(x) == 0:
+        return np.full(n_boot, np.nan)
+    if rng is None:
+        rng = np.random.default_rng(SEED)
+    idx = rng.integers(0, len(x), size=(n_boot, len(x)))
+    return STATS[stat](x[idx], axis=1)
+
+
+def interval(value: float, replicates: np.ndarray, alpha: float = ALPHA) -> Estimate:
+    if np.isnan(replicates).all():
+        return Estimate(value, np.nan, np.nan)
+    q = [alpha / 2 * 100, (1 - alpha / 2) * 100]
+    low, high = np.nanpercentile(replicates, q)
+    return Estimate(value, low, high)
+
+
+def estimate(
+    samples: Any, stat: str = "mean", n_boot: int = N_BOOT, alpha: float = ALPHA
+) -> Estimate:
+    """Return stat(samples) with its bootstrap CI"""
+    x = as_array(samples)
+    value = STATS[stat](x) if len(x) else np.nan
+    return interval(value, bootstrap(x, stat, n_boot), alpha)
+
+
+def geomean(values: Any, axis: Optional[int] = None) -> Any:
+    return np.exp(np.mean(np.log(np.asarray(values, dtype=float)), axis=axis))
+
+
+def ratio_replicates(
+    cvm: Any,
+    vm: Any,
+    stat: str = "mean",
+    n_boot: int = N_BOOT,
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[float, np.ndarray]:
+    if rng is None:
+        rng = np.random.default_rng(SEED)
+    x, y = as_array(cvm), as_array(vm)
+    value = STATS[stat](x) / STATS[stat](y) if len(x) and len(y) else np.nan
+    return value, bootstrap(x, stat, n_boot, rng) / bootstrap(y, stat, n_boot, rng)
+
+
+def ratio(
+    cvm: Any, vm: Any, stat: str = "mean", n_boot: int = N_BOOT, alpha: float = ALPHA
+) -> Estimate:
+    """Return stat(cvm) / stat(vm) with its bootstrap CI"""
+    value, replicates = ratio_replicates(cvm, vm, stat, n_boot)
+    return interval(value, replicates, alpha)
+
+
+def geomean_ratio(
+    pairs: Sequence[Tuple[Any, Any]],
+    stat: str = "mean",
+    n_boot: int = N_BOOT,
+    alpha: float = ALPHA,
+) -> Estimate:
+    """Return the geometric mean of the ratios stat(cvm) / stat(vm) of
+    [(cvm, vm), ...] with its bootstrap CI
+    """
+    rng = np.random.default_rng(SEED)
+    values, replicates = zip(
+        *(ratio_replicates(c, v, stat, n_boot, rng) for c, v in pairs)
+    )
+    return interval(geomean(values), geomean(np.stack(replicates), axis=0), alpha)
+
+
+def outliers(values: pd.Series, k: float = OUTLIER_K) -> pd.Series:
+    """Return a mask of the values outside Tukey's fences"""
+    q1, q3 = values.quantile(0.25), values.quantile(0.75)
+    iqr = q3 - q1
+    return (values < q1 - k * iqr) | (values > q3 + k * iqr)
+
+
+def group_outliers(
+    df: pd.DataFrame, value: str, by: List[str], k: float = OUTLIER_K
+) -> pd.Series:
+    """Return a mask of the rows whose value is an outlier within its group"""
+    grouped = df.groupby(by)[value]
+    q1 = grouped.transform(lambda x: x.quantile(0.25))
+    q3 = grouped.transform(lambda x: x.quantile(0.75))
+    iqr = q3 - q1
+    return (df[value] < q1 - k * iqr) | (df[value] > q3 + k * iqr)
+
+
+def summarize(
+    df: pd.DataFrame,
+    value: str,
+    by: List[str],
+    stat: str = "mean",
+    n_boot: int = N_BOOT,
+    alpha: float = ALPHA,
+) -> pd.DataFrame:
+    """Return count, mean, median, std, the CI of stat and the number of
+    outliers of value for each group of df
+    """
+    summary = df.groupby(by)[value].agg(["count", "mean", "median", "std"])
+    mask = group_outliers(df, value, by)
+    summary["outliers"] = mask.groupby([df[b] for b in by]).sum()
+    cis = [estimate(x, stat, n_boot, alpha) for _, x in df.groupby(by)[value]]
+    summary["low"] = [ci.low for ci in cis]
+    summary["high"] = [ci.high for ci in cis]
+    return summary.reset_index()
+
+
+def paired_groups(
+    df: pd.DataFrame, value: str, by: List[str], vm: str, cvm: str, config: str = "name"
+) -> List[Tuple[Tuple, pd.Series, pd.Series]]:
+    """Return [(key, cvm values, vm values), ...] for the groups of df (by) that
+    have rows of both df[config] == vm and df[config] == cvm
+    """
+    vm_groups = dict(list(df[df[config] == vm].groupby(by)[value]))
+    return [
+        (key if isinstance(key, tuple) else (key,), x, vm_groups[key])
+        for key, x in df[df[config] == cvm].groupby(by)[value]
+        if key in vm_groups
+    ]
+
+
+def overheads(
+    df: pd.DataFrame,
+    value: str,
+    by: List[str],
+    vm: str,
+    cvm: str,
+    config: str = "name",
+    stat: str = "mean",
+    n_boot: int = N_BOOT,
+    alpha: float = ALPHA,
+) -> pd.DataFrame:
+    """Return the ratio stat(cvm) / stat(vm) of value with its CI for each
+    group of df, where the rows of df[config] == vm (cvm) are the VM (CVM)
+    """
+    rows = []
+    for key, x, y in paired_groups(df, value, by, vm, cvm, config):
+        r = ratio(x, y, stat, n_boot, alpha)
+        rows.append([*key, r.value, r.low, r.high])
+    return pd.DataFrame(rows, columns=[*by, "ratio", "low", "high"])
+
+
+@dataclass
+class Sampler:
+    """Decide how often a benchmark is repeated in a VM.
+
+        sampler = Sampler.from_config(vm.config, repeat)
+        while sampler.more():
+            sampler.add(run_once())  # the primary metric, None if the run failed
+        update_metadata(sidecar, sampling=sampler.record())
+
+    Without a CI target the benchmark runs exactly min_runs times. With one,
+    it runs until the 95% CI of the mean of the primary metric (Student's t,
+    as the runs are few) is narrower than target (half-width relative to the
+    mean), max_runs or the time budget (seconds) is reached.
+    """
+
+    min_runs: int = 1
+    max_runs: int = 1
+    target: float = 0.0
+    budget: float = 0.0
+    samples: List[float] = field(default_factory=list)
+    runs: int = 0
+    reason: str = ""
+    start: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_config(
+        cls, config: Dict[str, Any], repeat: Optional[int] = None
+    ) -> "Sampler":
+        """Return the sampler of the vm.start options repeat, ci_target,
+        max_repeat and time_budget
+        """
+        if repeat is None:
+            repeat = config.get("repeat", 1)
+        target = config.get("ci_target", 0.0)
+        if target <= 0:
+            return cls(repeat, repeat)
+        min_runs = max(repeat, MIN_ADAPTIVE_RUNS)
+        max_runs = max(config.get("max_repeat", min_runs), min_runs)
+        return cls(min_runs, max_runs, target, config.get("time_budget", 0.0))
+
+    def half_width(self) -> float:
+        """Return the half-width of the 95% Student-t CI of the mean relative
+        to the mean
+        """
+        n = len(self.samples)
+        if n < 2:
+            return np.inf
+        mean = np.mean(self.samples)
+        if not mean:
+            return np.inf
+        t = T_975[max(df for df in T_975 if df <= n - 1)]
+        return t * np.std(self.samples, ddof=1) / np.sqrt(n) / abs(mean)
+
+    def more(self) -> bool:
+        """Return True if the benchmark should run again"""
+        if self.runs < self.min_runs:
+            return True
+        if self.target <= 0:
+            self.reason = "repeat"
+        elif self.half_width() <= self.target:
+            self.reason = "ci_target"
+        elif self.runs >= self.max_runs:
+            self.reason = "max_runs"
+        elif self.budget > 0 and time.monotonic() - self.start >= self.budget:
+            self.reason = "time_budget"
+        else:
+            return True
+        print(f"[sampling] stop after {self.runs} runs ({self.reason})")
+        return False
+
+    def add(self, value: Optional[float]) -> None:
+        self.runs += 1
+        if value is not None:
+            self.samples.append(value)
+            if self.target > 0:
+                print(
+                    f"[sampling] run {self.runs}: {value:.4g}, "
+                    f"CI half-width {self.half_width():.2%} (target {self.target:.2%})"
+                )
+
+    def record(self) -> Dict[str, Any]:
+        """Return the sampling decision for the run metadata"""
+        return {
+            "mode": "adaptive" if self.target > 0 else "fixed",
+            "runs": self.runs,
+            "samples": self.samples,
+            "stop_reason": self.reason,
+            "ci_half_width": self.half_width() if len(self.samples) >= 2 else None,
+            "ci_target": self.target,
+            "min_runs": self.min_runs,
+            "max_runs": self.max_runs,
+            "time_budget": self.budget,
+            "elapsed": time.monotonic() - self.start,
+        }
+
+
+# examples:
+# inv stats.summary --benchmark fio --value read_iops_mean --by name,job
+# inv stats.summary --benchmark iperf --value throughput --by name,mode,pkt --stat median
+@task
+def summary(
+    ctx: Any,
+    benchmark: str,
+    value: str,
+    by: str = "name",
+    stat: str = "mean",
+    result_dir: Optional[str] = None,
+) -> None:
+    """Show the statistics of a value of the result dataset with bootstrap CIs"""
+    import results
+
+    df = results.load(benchmark, Path(result_dir) if result_dir else None)
+    if df is None or len(df) == 0:
+        print(f"no dataset for {benchmark}, run `inv results.ingest` first")
+        return
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(summarize(df, value, by.split(","), stat))
+
+
+# examples:
+# inv stats.overhead --benchmark fio --value read_iops_mean --by job \
+#   --vm amd-direct-medium --cvm snp-direct-medium
+@task
+def overhead(
+    ctx: Any,
+    benchmark: str,
+    value: str,
+    vm: str,
+    cvm: str,
+    by: Optional[str] = None,  # e.g., job (fio); a single ratio by default
+    config: str = "name",
+    stat: str = "mean",
+    higher_is_better: bool = False,
+    result_dir: Optional[str] = None,
+) -> None:
+    """Show the CVM/VM ratios of a value of the result dataset with bootstrap CIs"""
+    import results
+
+    df = results.load(benchmark, Path(result_dir) if result_dir else None)
+    if df is None or len(df) == 0:
+        print(f"no dataset for {benchmark}, run `inv results.ingest` first")
+        return
+    if by is None:
+        df = df.assign(all="all")
+    keys = by.split(",") if by else ["all"]
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(overheads(df, value, keys, vm, cvm, config, stat))
+    pairs = [(x, y) for _, x, y in paired_groups(df, value, keys, vm, cvm, config)]
+    if pairs:
+        g = geomean_ratio(pairs, stat)
+        print(f"geomean: {g}, overhead: {g.overhead(higher_is_better)} %")
@@ -3,10 +3,30 @@
 
 from datetime import datetime
 from pathlib import Path
-
+from typing import Optional
 import time
+
 from config import PROJECT_ROOT
+from metadata import save_metadata, update_metadata
 from qemu import QemuVm
+from stats import Sampler
+
+# percentiles reported by fio (in addition to the histograms)
+CLAT_PERCENTILES = [1, 5, 10, 25, 50, 75, 90, 95, 99, 99.5, 99.9, 99.95, 99.99]
+
+
+def fio_iops(file: Path) -> Optional[float]:
+    """Return the geometric mean of the IOPS of the jobs of a fio output"""
+    import stats
+    from plot_storage import read_json
+
+    try:
+        jobs = read_json(file)["jobs"]
+        iops = [job["read"]["iops"] + job["write"]["iops"] for job in jobs]
+        return float(stats.geomean([v for v in iops if v > 0]))
+    except Exception as e:
+        print(f"[sampling] cannot parse {file}: {e!r}")
+        return None
 
 
 def run_fio(
@@ -15,26 +35,56 @@ def run_fio(
     job: str = "test",
     filename: str = "/dev/vdb",
 ):
-    date = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    """Run a fio job file on the VM, once per sample (see stats.Sampler).
+    The results are saved in ./bench-result/fio/{name}/{job}/{date}.json
+    """
     outputdir = Path(f"./bench-result/fio/{name}/{job}/")
     outputdir_host = PROJECT_ROOT / outputdir
     outputdir_host.mkdir(parents=True, exist_ok=True)
-    output = Path("/share") / outputdir / f"{date}.json"
     fio_job = f"/share/config/fio/{job}.fio"
-    cmd = [
-        "fio",
-        f"--filename={filename}",
-        f"--output={output}",
-        "--output-format=json",
-        fio_job,
-    ]
-    vm.ssh_cmd(cmd)
+
+    sidecars = []
+    sampler = Sampler.from_config(vm.config)
+    while sampler.more():
+        date = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        output = Path("/share") / outputdir / f"{date}.json"
+        cmd = [
+            "fio",
+            f"--filename={filename}",
+            f"--output={output}",
+            # json+ adds the completion latency histogram (clat_ns.bins) of each job
+            "--output-format=json+",
+            "--clat_percentiles=1",
+            f"--percentile_list={':'.join(map(str, CLAT_PERCENTILES))}",
+            # per-second clat histograms: {date}_clat_hist.{job index}.log
+            f"--write_hist_log={Path('/share') / outputdir / date}",
+            "--log_hist_msec=1000",
+            fio_job,
+        ]
+        vm.ssh_cmd(cmd)
+        sidecars.append(outputdir_host / f"{date}.meta.json")
+        save_metadata(sidecars[-1], vm.metadata, name, job=job)
+        sampler.add(fio_iops(outputdir_host / f"{date}.json"))
+        # a new date for the next run
+        time.sleep(1)
+
+    # every run of the sequence is a sample
+    for sidecar in sidecars:
+        update_metadata(sidecar, sampling=sampler.record())
 
 
 def mount_disk(vm: QemuVm, dev: str, mountpoint: str = "/mnt", format="no") -> bool:
     """Mount a disk on the VM"""
     vm.ssh_cmd(["sudo", "mkdir", "-p", mountpoint])
 
+    # the disk may be still mounted by a previous action in the same VM
+    output = vm.ssh_cmd(["mountpoint", "-q", mountpoint], check=False)
+    if output.returncode == 0:
+        if format != "yes":
+            print(f"[mount disk] {mountpoint} is already mounted")
+            return True
+        vm.ssh_cmd(["sudo", "umount", mountpoint])
+
     if format == "auto":
         # try mount
         output = vm.ssh_cmd(["sudo", "mount", dev, mountpoint], check=False)
@@ -49,7 +99,7 @@ def mount_disk(vm: QemuVm, dev: str, mountpoint: str = "/mnt", format="no") -> b
 
     time.sleep(1)
 
-    vm.ssh_cmd(["sudo", "mount", dev, mountpoint], check=False)
+    output = vm.ssh_cmd(["sudo", "mount", dev, mountpoint], check=False)
     if output.returncode == 0:
         print(f"[mount disk] mount {dev} to {mountpoint}")
         return True
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import datetime
+import json
+
+SYSFS_CPU = Path("/sys/devices/system/cpu")
+SYSFS_NODE = Path("/sys/devices/system/node")
+
+PIN_POLICIES = ["linear", "compact", "spread", "smt-pair"]
+# placement of vhost workers and device IRQs (see plan_io_pinning())
+IO_PIN_POLICIES = ["none", "iothread", "spread"]
+
+
+@dataclass
+class Core:
+    """A physical core"""
+
+    threads: List[int]  # logical CPUs (SMT siblings), sorted
+    node: int
+    llc: str  # shared_cpu_list of the last level cache
+
+
+@dataclass
+class PinPlan:
+    """Placement of QEMU threads on host CPUs"""
+
+    policy: str
+    vcpus: List[int]  # host CPU of vCPU i
+    iothreads: List[int] = field(default_factory=list)
+    main: Optional[int] = None  # host CPU of the QEMU main loop
+    vhost: Dict[int, int] = field(default_factory=dict)  # vhost worker tid -> CPU
+    irqs: Dict[int, int] = field(default_factory=dict)  # host IRQ -> CPU
+
+    def asdict(self) -> dict:
+        return asdict(self)
+
+
+def parse_cpulist(cpulist: str) -> List[int]:
+    """Parse a cpulist such as "0-7,16-23" """
+    cpus = []
+    for part in cpulist.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus += list(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def read_llc(cpu: int) -> str:
+    """Return the shared_cpu_list of the last level cache of cpu"""
+    llc, level = "", 0
+    for index in (SYSFS_CPU / f"cpu{cpu}/cache").glob("index[0-9]*"):
+        if (index / "type").read_text().strip() == "Instruction":
+            continue
+        lv = int((index / "level").read_text())
+        if lv > level:
+            llc, level = (index / "shared_cpu_list").read_text().strip(), lv
+    return llc
+
+
+def read_cpu_topology() -> List[Core]:
+    """Read the physical cores of the host from sysfs, ordered by their first CPU"""
+    cpu_node = {}
+    for node in SYSFS_NODE.glob("node[0-9]*"):
+        for cpu in parse_cpulist((node / "cpulist").read_text()):
+            cpu_node[cpu] = int(node.name[4:])
+
+    cores: Dict[Tuple[int, int], Core] = {}
+    online = parse_cpulist((SYSFS_CPU / "online").read_text())
+    for cpu in online:
+        topology = SYSFS_CPU / f"cpu{cpu}/topology"
+        package = int((topology / "physical_package_id").read_text())
+        core_id = int((topology / "core_id").read_text())
+        key = (package, core_id)
+        if key not in cores:
+            cores[key] = Core([], cpu_node.get(cpu, 0), read_llc(cpu))
+        cores[key].threads.append(cpu)
+    for core in cores.values():
+        core.threads.sort()
+    return sorted(cores.values(), key=lambda c: c.threads[0])
+
+
+def plan_pinning(
+    num_vcpus: int,
+    num_iothreads: int,
+    numa_node: Optional[List[int]],
+    policy: str = "compact",
+    pin_base: int = 0,
+    cores: Optional[List[Core]] = None,
+) -> PinPlan:
+    """Plan the placement of vCPUs, iothreads and the QEMU main loop.
+
+    - linear: vCPU i on pin_base + i, iothreads on the following CPUs
+      (the traditional behaviour, the main loop is not pinned)
+    - compact: vCPUs on distinct physical cores, filling one LLC after another
+    - spread: vCPUs on distinct physical cores, round-robin over LLCs
+    - smt-pair: vCPUs on both SMT siblings of as few cores as possible
+
+    Except for linear, only cores within numa_node whose first CPU is not
+    smaller than pin_base are used. iothreads go to the cores next to the
+    vCPUs (or free SMT siblings), the main loop to a sibling of the first
+    iothread if possible.
+    """
+    if policy == "linear":
+        return PinPlan(
+            policy,
+            [pin_base + i for i in range(num_vcpus)],
+            [pin_base + num_vcpus + i for i in range(num_iothreads)],
+        )
+    if policy not in PIN_POLICIES:
+        raise ValueError(f"Unknown pinning policy: {policy}")
+
+    if cores is None:
+        cores = read_cpu_topology()
+    nodes = numa_node if numa_node else [0]
+    cores = [c for c in cores if c.node in nodes and c.threads[0] >= pin_base]
+
+    vcpu_cores: List[Core]
+    if policy == "smt-pair":
+        vcpus = [t for c in cores for t in c.threads][:num_vcpus]
+        vcpu_cores = [c for c in cores if set(c.threads) & set(vcpus)]
+    else:
+        if policy == "spread":
+            llcs: Dict[str, List[Core]] = {}
+            for c in cores:
+                llcs.setdefault(c.llc, []).append(c)
+            ordered = []
+            groups = list(llcs.values())
+            for i in range(max(map(len, groups), default=0)):
+                ordered += [g[i] for g in groups if i < len(g)]
+        else:
+            ordered = cores
+        vcpu_cores = ordered[:num_vcpus]
+        vcpus = [c.threads[0] for c in vcpu_cores]
+    if len(vcpus) < num_vcpus:
+        raise ValueError(
+            f"Cannot place {num_vcpus} vCPUs on NUMA node(s) {nodes} "
+            f"from CPU {pin_base} with policy {policy}"
+        )
+
+    # candidates for the other threads: first threads of adjacent free cores
+    # (same LLC first), then free SMT siblings
+    vcpu_llcs = set(c.llc for c in vcpu_cores)
+    last = max(cores.index(c) for c in vcpu_cores) if vcpu_cores else 0
+    free_cores = sorted(
+        [c for c in cores if c not in vcpu_cores],
+        key=lambda c: (c.llc not in vcpu_llcs, abs(cores.index(c) - last)),
+    )
+    used = set(vcpus)
+    pool = [c.threads[0] for c in free_cores]
+    pool += [t for c in free_cores + vcpu_cores for t in c.threads[1:]]
+    pool = [t for t in pool if t not in used]
+
+    if len(pool) < num_iothreads:
+        raise ValueError(
+            f"Cannot place {num_iothreads} iothreads next to the vCPUs "
+            f"on NUMA node(s) {nodes}"
+        )
+    iothreads = pool[:num_iothreads]
+    pool = pool[num_iothreads:]
+
+    main = None
+    if iothreads:
+        siblings = next(c.threads for c in cores if iothreads[0] in c.threads)
+        main = next((t for t in siblings if t in pool), None)
+    if main is None and pool:
+        main = pool[0]
+
+    return PinPlan(policy, vcpus, iothreads, main)
+
+
+def find_vhost_workers(pid: int) -> List[int]:
+    """Return the thread ids of the vhost workers of a QEMU process.
+    Before Linux 6.4 these are kernel threads named vhost-<pid>; since then they
+    are threads of the QEMU process with the same name.
+    """
+    tids = []
+    for comm in Path(f"/proc/{pid}/task").glob("*/comm"):
+        try:
+            if comm.read_text().startswith("vhost-"):
+                tids.append(int(comm.parent.name))
+        except OSError:
+            pass
+    for comm in Path("/proc").glob("[0-9]*/comm"):
+        try:
+            if comm.read_text().strip() == f"vhost-{pid}":
+                tids.append(int(comm.parent.name))
+        except OSError:
+            pass
+    return sorted(set(tids))
+
+
+def pci_irqs(path: Path) -> List[int]:
+    """Return the IRQs of the PCI device that path (a sysfs path) belongs to"""
+    path = path.resolve()
+    for p in [path] + list(path.parents):
+        if (p / "msi_irqs").is_dir():
+            return sorted(int(irq.name) for irq in (p / "msi_irqs").iterdir())
+        if (p / "irq").is_file() and (p / "vendor").is_file():
+            irq = int((p / "irq").read_text())
+            return [irq] if irq > 0 else []
+    return []
+
+
+def find_device_irqs(device: str) -> List[int]:
+    """Return the host IRQs of a block device (e.g. /dev/nvme1n1) or a network
+    interface. For tap and macvtap interfaces, the IRQs of the physical NICs
+    behind the bridge or the macvtap are returned.
+    """
+    if device.startswith("/dev/"):
+        name = Path(device).resolve().name
+        path = Path(f"/sys/class/block/{name}")
+        if not path.exists():
+            return []
+        return pci_irqs(path)
+
+    path = Path(f"/sys/class/net/{device}")
+    if not path.exists():
+        return []
+    interfaces = []
+    if (path / "master" / "brif").is_dir():
+        interfaces += [p.name for p in (path / "master" / "brif").iterdir()]
+    interfaces += [p.name[len("lower_") :] for p in path.glob("lower_*")]
+    irqs = []
+    for interface in interfaces:
+        p = Path(f"/sys/class/net/{interface}").resolve()
+        if "/virtual/" not in str(p):
+            irqs += pci_irqs(p)
+    return sorted(set(irqs))
+
+
+def plan_io_pinning(
+    plan: PinPlan,
+    vhost: List[int],
+    irqs: List[int],
+    numa_node: Optional[List[int]],
+    policy: str,
+    cores: Optional[List[Core]] = None,
+) -> PinPlan:
+    """Add the placement of vhost workers and device IRQs to plan.
+
+    - none: leave them alone
+    - iothread: put them on the CPUs of the iothreads and the main loop
+    - spread: spread them over the CPUs of numa_node that no vCPU uses
+    """
+    if policy not in IO_PIN_POLICIES:
+        raise ValueError(f"Unknown IO pinning policy: {policy}")
+    if policy == "none":
+        return plan
+
+    cpus = []
+    if policy == "iothread":
+        cpus = plan.iothreads + ([plan.main] if plan.main is not None else [])
+    if not cpus:
+        if cores is None:
+            cores = read_cpu_topology()
+        nodes = numa_node if numa_node else [0]
+        cpus = [
+            t
+            for c in cores
+            if c.node in nodes
+            for t in c.threads
+            if t not in plan.vcpus
+        ]
+    if not cpus:
+        print("No CPUs left for vhost workers and IRQs")
+        return plan
+
+    plan.vhost = {tid: cpus[i % len(cpus)] for i, tid in enumerate(vhost)}
+    plan.irqs = {irq: cpus[i % len(cpus)] for i, irq in enumerate(irqs)}
+    return plan
+
+
+def set_irq_affinity(irq: int, cpus: str) -> Optional[str]:
+    """Set the affinity of a host IRQ and return the previous one"""
+    path = Path(f"/proc/irq/{irq}/smp_affinity_list")
+    try:
+        old = path.read_text().strip()
+        path.write_text(cpus)
+    except OSError as e:
+        print(f"Failed to set the affinity of IRQ {irq}: {e}")
+        return None
+    return old
+
+
+def save_pinning(name: str, plan: PinPlan) -> Path:
+    """Record the placement of a run under bench-result/pinning"""
+    date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    outputdir = Path(f"./bench-result/pinning/{name}/")
+    outputdir.mkdir(parents=True, exist_ok=True)
+    path = outputdir / f"{date}.json"
+    with open(path, "w") as f:
+        json.dump(plan.asdict(), f, indent=2)
+    return path
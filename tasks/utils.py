@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
 
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import shlex
+import statistics
+import subprocess
+import sys
+import time
 
 from invoke import task
 
@@ -13,3 +19,69 @@ def show_config(ctx):
     print(f"SCRIPT_ROOT: {config.SCRIPT_ROOT}")
     print(f"PROJECT_ROOT: {config.PROJECT_ROOT}")
     print(f"BUILD_DIR: {config.BUILD_DIR}")
+
+
+# modules that must not be imported to run tasks that do not plot or parse results
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "seaborn", "scipy", "pyarrow"]
+
+
+def import_times(argv: List[str]) -> Dict[str, Tuple[int, int]]:
+    """Run argv with python -X importtime and return {module: (level, cumulative us)}"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        cwd=config.PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        level = (len(module) - len(module.lstrip()) - 1) // 2
+        times[module.strip()] = (level, int(cumulative))
+    return times
+
+
+# examples:
+# inv utils.bench-startup
+# inv utils.bench-startup --command "vm.start --help" --max-ms 500
+# inv utils.bench-startup --command "network.plot-iperf --help" --heavy
+@task
+def bench_startup(
+    ctx: Any,
+    command: str = "utils.show-config",
+    repeat: int = 5,
+    max_ms: Optional[float] = None,  # fail if the median startup is slower
+    heavy: bool = False,  # the task may import pandas, matplotlib, etc.
+    top: int = 10,
+) -> None:
+    """Measure the startup time of invoke and check that no plotting/analysis
+    libraries are imported for tasks that do not need them
+    """
+    argv = ["-m", "invoke", *shlex.split(command)]
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *argv],
+            cwd=config.PROJECT_ROOT,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        elapsed.append((time.perf_counter() - start) * 1000)
+    median = statistics.median(elapsed)
+    print(f"inv {command}: {median:.0f}ms (median of {repeat})")
+
+    times = import_times(argv)
+    toplevel = [(us, m) for m, (level, us) in times.items() if level == 0]
+    for us, module in sorted(toplevel, reverse=True)[:top]:
+        print(f"  {us / 1000:>7.1f}ms {module}")
+
+    imported = [m for m in HEAVY_MODULES if m in times]
+    if imported and not heavy:
+        raise RuntimeError(f"inv {command} imports {', '.join(imported)}")
+    if max_ms is not None and median > max_ms:
+        raise RuntimeError(f"inv {command} took {median:.0f}ms > {max_ms:.0f}ms")
@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from contextlib import contextmanager, nullcontext
 from copy import deepcopy
 from dataclasses import dataclass
-from typing import Any, Optional, List
+from tempfile import TemporaryDirectory
+from typing import Any, Iterator, Optional, List
 from pathlib import Path
+import datetime
 import shlex
 
 from invoke import task
 
 from config import BUILD_DIR, PROJECT_ROOT, LINUX_DIR, SSH_PORT
+from metadata import run_metadata
 from qemu import spawn_qemu, QemuVm
+from procs import run
+from topology import IO_PIN_POLICIES, PIN_POLICIES, save_pinning
 
 
 @dataclass
@@ -704,6 +710,90 @@ def qemu_option_virtio_nic(
     return shlex.split(option)
 
 
+def qemu_option_image_overlay(qemu_cmd: List[str], overlay_dir: Path) -> List[str]:
+    """Boot from a temporary qcow2 overlay backed by the VM image instead of the
+    image itself. QEMU locks the image for writing, so VMs sharing an image can
+    only run at the same time with this. Writes to the root disk are discarded.
+    """
+    cmd = []
+    for arg in qemu_cmd:
+        if "node-name=q2," in arg:
+            opts = arg.split(",")
+            for i, opt in enumerate(opts):
+                if opt.startswith("file.filename="):
+                    image = opt[len("file.filename=") :]
+                    overlay = overlay_dir / "overlay.qcow2"
+                    run(
+                        ["qemu-img", "create", "-f", "qcow2", "-F", "qcow2"]
+                        + ["-b", image, str(overlay)]
+                    )
+                    opts[i] = f"file.filename={overlay}"
+            arg = ",".join(opts)
+        cmd.append(arg)
+    return cmd
+
+
+def io_devices(config: dict) -> List[str]:
+    """Host devices backing the virtio devices of a VM (see QemuVm.pin_io())"""
+    devices = []
+    if config.get("virtio_blk"):
+        if Path(config["virtio_blk"]).is_block_device():
+            devices.append(str(config["virtio_blk"]))
+    if config.get("virtio_nic"):
+        if config.get("virtio_nic_mq"):
+            devices.append(config["virtio_nic_mtap"])
+        else:
+            devices.append(config["virtio_nic_tap"])
+    return devices
+
+
+@contextmanager
+def spawn_vm(qemu_cmd: List[str], pin: bool, config: dict) -> Iterator[QemuVm]:
+    """Start a VM, pin vCPUs, wait until the VM is accessible via ssh, and shut
+    it down at the end.
+    If the VM is already running because several actions share it (see
+    run_actions()), just use that VM.
+    """
+    vm: Optional[QemuVm] = config.get("vm")
+    if vm is not None:
+        yield vm
+        return
+
+    resource: VMResource = config["resource"]
+    pin_base: int = config.get("pin_base", resource.pin_base)
+    with spawn_qemu(qemu_cmd, numa_node=resource.numa_node, config=config) as vm:
+        if pin:
+            vm.pin_vcpu(pin_base)
+        vm.wait_for_ssh()
+        if pin:
+            vm.pin_io(io_devices(config), config.get("io_pin_policy", "none"))
+            config["pinning"] = vm.pinning.asdict()
+            if "name" in config:
+                save_pinning(config["name"], vm.pinning)
+        vm.metadata = run_metadata(config, qemu_cmd, vm)
+        yield vm
+        elapsed = vm.shutdown()
+        if "name" in config:
+            record_teardown(config["name"], resource, elapsed, vm.shutdown_method)
+
+
+def record_teardown(
+    name: str, resource: VMResource, elapsed: float, method: Optional[str]
+) -> None:
+    """Append the teardown time of a VM (shutdown until the QEMU process has
+    exited and released the guest memory) to bench-result/teardown/{name}.csv
+    """
+    outputdir = Path("./bench-result/teardown/")
+    outputdir.mkdir(parents=True, exist_ok=True)
+    path = outputdir / f"{name}.csv"
+    new = not path.exists()
+    date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    with open(path, "a") as f:
+        if new:
+            f.write("date,cpu,memory,method,seconds\n")
+        f.write(f"{date},{resource.cpu},{resource.memory},{method},{elapsed:.3f}\n")
+
+
 def start_and_attach(qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
     """Start a VM and attach to the console (tmux session) to interact with the VM.
     Note 1: The VM automatically terminates when the tmux session is closed.
@@ -757,23 +847,13 @@ def ssh_cmd(qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
     # we can have multiple ssh commands
     inv vm.start --type intel --ssh-cmd "echo hi" --ssh-cmd "ls /" --action ssh-cmd
     """
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     cmds: [str] = kargs["config"]["ssh_cmd"]
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
-
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         for cmd in cmds:
             cmd_ = shlex.split(cmd)
             vm.ssh_cmd(cmd_)
 
-        vm.shutdown()
-
 
 def boottime(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
     """Measure the boot time of a VM"""
@@ -791,39 +871,21 @@ def prepare(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
 
 
 def prepare_phoronix(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from phoronix import install_bench
 
         install_bench("pts/memory", vm)
         install_bench("pts/npb", vm)
-        vm.shutdown()
 
 
 def prepare_app(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
-
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from application import prepare
 
         prepare(vm)
 
-        vm.shutdown()
-
 
 def run_phoronix(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
     bench_name = kargs["config"]["phoronix_bench_name"]
@@ -833,66 +895,35 @@ def run_phoronix(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> Non
         )
         return
 
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         import phoronix
 
         phoronix.run_phoronix(name, f"{bench_name}", f"pts/{bench_name}", vm)
-        vm.shutdown()
 
 
 def run_mlc(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         import memory
 
         memory.run_mlc(name, vm)
-        vm.shutdown()
 
 
 def run_blender(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
     repeat: int = kargs["config"].get("repeat", 1)
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from application import run_blender
 
         run_blender(name, vm, repeat=repeat)
-        vm.shutdown()
 
 
 def run_iperf(
     name: str, qemu_cmd: List[str], pin: bool, udp: bool = False, **kargs: Any
 ):
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from network import run_iperf
 
         if kargs["config"]["virtio_nic_vhost"]:
@@ -906,23 +937,19 @@ def run_iperf(
             name += f"-swiotlb"
         run_iperf(name, vm, udp=udp)
 
-        vm.shutdown()
-
 
 def run_memtier(
-    name: str, qemu_cmd: List[str], pin: bool, server: str = "redis", **kargs: Any
+    name: str,
+    qemu_cmd: List[str],
+    pin: bool,
+    server: str = "redis",
+    sweep: bool = False,  # latency at 10%..110% of the peak load (see run_memtier_sweep)
+    **kargs: Any,
 ):
     tls: bool = kargs["config"].get("tls", False)
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
-        from network import run_memtier
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
+        from network import run_memtier, run_memtier_sweep
 
         if kargs["config"]["virtio_nic_vhost"]:
             name += f"-vhost"
@@ -933,21 +960,48 @@ def run_memtier(
             and "swiotlb" in kargs["config"]["extra_cmdline"]
         ):
             name += f"-swiotlb"
-        run_memtier(name, vm, server=server, tls=tls)
-        vm.shutdown()
+        if sweep:
+            run_memtier_sweep(name, vm, server=server, tls=tls)
+            return
+        # timed multi-client runs are not comparable with the single client
+        instances: str = kargs["config"].get("memtier_instances", "1")
+        if instances == "auto":
+            name += "-auto"
+        elif instances != "1":
+            name += f"-x{instances}"
+        run_memtier(name, vm, server=server, tls=tls, instances=instances)
+
+
+def run_nginx(
+    name: str,
+    qemu_cmd: List[str],
+    pin: bool,
+    sweep: bool = False,  # wrk2 latency distributions (see run_nginx_sweep)
+    **kargs: Any,
+):
+    vm: QemuVM
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
+        from network import run_nginx, run_nginx_sweep
 
+        if kargs["config"]["virtio_nic_vhost"]:
+            name += f"-vhost"
+        if kargs["config"]["virtio_nic_mq"]:
+            name += f"-mq"
+        if (
+            kargs["config"]["virtio_iommu"]
+            and "swiotlb" in kargs["config"]["extra_cmdline"]
+        ):
+            name += f"-swiotlb"
+        if sweep:
+            run_nginx_sweep(name, vm)
+            return
+        run_nginx(name, vm)
 
-def run_nginx(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any):
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
+
+def run_tls_handshake(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any):
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
-        from network import run_nginx
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
+        from network import run_tls_handshake
 
         if kargs["config"]["virtio_nic_vhost"]:
             name += f"-vhost"
@@ -958,20 +1012,12 @@ def run_nginx(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any):
             and "swiotlb" in kargs["config"]["extra_cmdline"]
         ):
             name += f"-swiotlb"
-        run_nginx(name, vm)
-        vm.shutdown()
+        run_tls_handshake(name, vm)
 
 
 def run_ping(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any):
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from network import run_ping
 
         if kargs["config"]["virtio_nic_vhost"]:
@@ -984,56 +1030,31 @@ def run_ping(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any):
         ):
             name += f"-swiotlb"
         run_ping(name, vm)
-        vm.shutdown()
 
 
 def run_tensorflow(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
     repeat: int = kargs["config"].get("repeat", 1)
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from application import run_tensorflow
 
         run_tensorflow(name, vm, repeat=repeat)
-        vm.shutdown()
 
 
 def run_pytorch(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
     repeat: int = kargs["config"].get("repeat", 1)
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from application import run_pytorch
 
         run_pytorch(name, vm, repeat=repeat)
-        vm.shutdown()
 
 
 def run_sqlite(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
-    resource: VMResource = kargs["config"]["resource"]
     virito_blk: Optional[str] = kargs["config"]["virtio_blk"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     dbpath: str = "/tmp/test.db"
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
-
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         if virito_blk:
             import storage
 
@@ -1054,19 +1075,11 @@ def run_sqlite(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
         from application import run_sqlite
 
         run_sqlite(name, vm, dbpath)
-        vm.shutdown()
 
 
 def run_fio(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         import storage
 
         name += f"-{kargs['config']['virtio_blk_aio']}"
@@ -1081,43 +1094,26 @@ def run_fio(name: str, qemu_cmd: List[str], pin: bool, **kargs: Any) -> None:
             name += f"-swiotlb"
         fio_job = kargs["config"]["fio_job"]
         storage.run_fio(name, vm, fio_job)
-        vm.shutdown()
 
 
 def run_attestation_sev(
     name: str, qemu_cmd: List[str], pin: bool, **kargs: Any
 ) -> None:
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from attestation import run_attestation_sev
 
         run_attestation_sev(name, vm)
-        vm.shutdown()
 
 
 def run_attestation_tdx(
     name: str, qemu_cmd: List[str], pin: bool, **kargs: Any
 ) -> None:
-    resource: VMResource = kargs["config"]["resource"]
-    pin_base: int = kargs["config"].get("pin_base", resource.pin_base)
     vm: QemuVM
-    with spawn_qemu(
-        qemu_cmd, numa_node=resource.numa_node, config=kargs["config"]
-    ) as vm:
-        if pin:
-            vm.pin_vcpu(pin_base)
-        vm.wait_for_ssh()
+    with spawn_vm(qemu_cmd, pin, kargs["config"]) as vm:
         from attestation import run_attestation_tdx
 
         run_attestation_tdx(name, vm)
-        vm.shutdown()
 
 
 def do_action(action: str, **kwargs: Any) -> None:
@@ -1157,8 +1153,16 @@ def do_action(action: str, **kwargs: Any) -> None:
         run_memtier(server="redis", **kwargs)
     elif action == "run-memtier-memcached":
         run_memtier(server="memcached", **kwargs)
+    elif action == "run-memtier-sweep":
+        run_memtier(server="redis", sweep=True, **kwargs)
+    elif action == "run-memtier-memcached-sweep":
+        run_memtier(server="memcached", sweep=True, **kwargs)
     elif action == "run-nginx":
         run_nginx(**kwargs)
+    elif action == "run-nginx-sweep":
+        run_nginx(sweep=True, **kwargs)
+    elif action == "run-tls-handshake":
+        run_tls_handshake(**kwargs)
     elif action == "run-ping":
         run_ping(**kwargs)
     elif action == "run-attestation-sev":
@@ -1169,6 +1173,52 @@ def do_action(action: str, **kwargs: Any) -> None:
         raise ValueError(f"Unknown action: {action}")
 
 
+# actions that manage the VM by themselves and cannot share a VM with others
+STANDALONE_ACTIONS = ["attach", "ipython", "boottime"]
+
+
+def reset_guest(vm: QemuVm, reset: str) -> None:
+    """Reset guest state between two actions that share a VM"""
+    if reset == "none":
+        return
+    elif reset == "drop-caches":
+        vm.ssh_cmd(["sync"])
+        vm.ssh_cmd(["sh", "-c", "echo 3 > /proc/sys/vm/drop_caches"])
+    elif reset == "remount":
+        # the next action mounts the disk again (see storage.mount_disk())
+        vm.ssh_cmd(["sh", "-c", "mountpoint -q /mnt && umount /mnt || true"])
+        vm.ssh_cmd(["sync"])
+        vm.ssh_cmd(["sh", "-c", "echo 3 > /proc/sys/vm/drop_caches"])
+    else:
+        raise ValueError(f"Unknown reset: {reset}")
+
+
+def run_actions(
+    actions: List[str],
+    qemu_cmd: List[str],
+    pin: bool,
+    name: str,
+    config: dict,
+) -> None:
+    """Run multiple actions back-to-back in a single VM"""
+    for action in actions:
+        if action in STANDALONE_ACTIONS:
+            raise ValueError(f"{action} cannot be combined with other actions")
+
+    reset: str = config["reset"]
+    with spawn_vm(qemu_cmd, pin, config) as vm:
+        config["vm"] = vm
+        try:
+            for i, action in enumerate(actions):
+                if i > 0:
+                    print(f"Reset guest: {reset}")
+                    reset_guest(vm, reset)
+                print(f"Run action: {action}")
+                do_action(action, qemu_cmd=qemu_cmd, pin=pin, name=name, config=config)
+        finally:
+            config.pop("vm", None)
+
+
 # ------------------------------------------------------------
 
 
@@ -1176,6 +1226,18 @@ def do_action(action: str, **kwargs: Any) -> None:
 # inv vm.start --type snp --size small
 # inv vm.start --type normal --no-direct
 # inv vm.start --type snp --action run-phoronix
+# run several actions in one VM, remounting the disk in between:
+# inv vm.start --type snp --virtio-blk /dev/nvme1n1 --action run-sqlite,run-fio --reset remount
+# repeat blender until the 95% CI is within +-1% of the mean (at most 30 runs or 2h):
+# inv vm.start --type snp --action run-blender --ci-target 0.01 --max-repeat 30 --time-budget 7200
+# add memtier clients until they do not limit the throughput anymore:
+# inv vm.start --type snp --virtio-nic --action run-memtier --memtier-instances auto
+# redis latency from 10% to 110% of the peak load (see plot_network.plot_memtier_knee):
+# inv vm.start --type snp --virtio-nic --virtio-nic-vhost --action run-memtier-sweep
+# nginx latency distributions at 25%..100% of the peak request rate (wrk2):
+# inv vm.start --type snp --virtio-nic --action run-nginx-sweep
+# TLS handshakes/s against nginx and redis, counting VM exits with bpftrace:
+# inv vm.start --type snp --virtio-nic --action run-tls-handshake
 @task
 def start(
     ctx: Any,
@@ -1183,12 +1245,18 @@ def start(
     size: str = "medium",  # small, medium, large, numa
     hostname: str = None,  # by default use the local hostname
     direct: bool = True,  # if True, do direct boot. otherwise boot from the disk
-    action: str = "attach",
+    action: str = "attach",  # comma-separated list of actions run in one VM
+    reset: str = "none",  # reset between actions: none, drop-caches, remount
     ssh_port: int = SSH_PORT,
     guest_cid: int = 11,  # Guest CID for vsock (only for TDX)
     pin: bool = True,  # if True, pin vCPUs
     pin_base: Optional[int] = None,  # pinning base
+    pin_policy: str = "linear",  # linear, compact, spread, smt-pair (see topology.py)
+    io_pin_policy: str = "none",  # vhost workers and device IRQs: none, iothread, spread
     extra_cmdline: str = "",  # extra kernel cmdline (only for direct boot)
+    ready_channel: bool = True,  # if True, the guest announces readiness via virtio-serial
+    tmux: bool = False,  # if True, run QEMU in a tmux session (always for --action attach)
+    shutdown_timeout: int = 60,  # seconds to wait for each shutdown method
     # ssh_cmd options
     ssh_cmd: [str] = [],
     # boot eval options
@@ -1197,7 +1265,11 @@ def start(
     # phoronix options
     phoronix_bench_name: Optional[str] = None,
     # application bench options
-    repeat: int = 1,
+    repeat: int = 1,  # runs per benchmark (the minimum with --ci-target)
+    # adaptive repetition (see stats.Sampler; boottime, application, fio, iperf)
+    ci_target: float = 0.0,  # repeat until the 95% CI half-width / mean < this
+    max_repeat: int = 20,  # ... or this many runs
+    time_budget: float = 0.0,  # ... or this many seconds (0: no limit)
     virtio_iommu: bool = False,  # enable VIRTIO_F_ACCESS_PLATFORM (VIRTIO_F_IOMMU_PLATFORM) feature bit
     # virtio-nic options
     virtio_nic: bool = False,
@@ -1212,7 +1284,9 @@ def start(
     virtio_blk_aio: str = "native",
     virtio_blk_direct: bool = True,
     virtio_blk_iothread: bool = True,
+    overlay: bool = False,  # if True, boot from a temporary overlay of the image
     tls: bool = False,
+    memtier_instances: str = "1",  # memtier clients spread over NUMA nodes, or "auto"
     fio_job: str = "test",
     warn: bool = True,
     name_extra: str = "",
@@ -1225,10 +1299,17 @@ def start(
     resource: VMResource = get_vm_resource(hostname, size)
     config["resource"] = resource
 
+    if pin_policy not in PIN_POLICIES:
+        raise ValueError(f"Unknown pinning policy: {pin_policy}")
+    if io_pin_policy not in IO_PIN_POLICIES:
+        raise ValueError(f"Unknown IO pinning policy: {io_pin_policy}")
     if direct and (type == "intel-ubuntu" or type == "tdx-ubuntu"):
         raise NotImplementedError(
             "No support of direct boot of ubuntu (use --no-direct option)"
         )
+    if type == "intel-ubuntu" or type == "tdx-ubuntu":
+        # ubuntu images do not have the guest-ready service
+        config["ready_channel"] = False
 
     qemu_cmd: str
     if type == "amd":
@@ -1288,5 +1369,13 @@ def start(
     if config["pin_base"] is None:
         config.pop("pin_base", None)
     name = f"{type}-{'direct' if direct else 'disk'}-{size}" + name_extra
+    config["name"] = name
     print(f"Starting VM: {name}")
-    do_action(action, qemu_cmd=qemu_cmd, pin=pin, name=name, config=config)
+    actions = [a.strip() for a in action.split(",") if a.strip()]
+    with TemporaryDirectory() if overlay else nullcontext() as overlay_dir:
+        if overlay_dir is not None:
+            qemu_cmd = qemu_option_image_overlay(qemu_cmd, Path(overlay_dir))
+        if len(actions) == 1:
+            do_action(actions[0], qemu_cmd=qemu_cmd, pin=pin, name=name, config=config)
+        else:
+            run_actions(actions, qemu_cmd=qemu_cmd, pin=pin, name=name, config=config)